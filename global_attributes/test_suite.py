@@ -8,11 +8,21 @@ from geometry.test_shape import TestShape, TestPoint
 from geometry.test_bowl import TestBowl
 from geometry.test_circle import TestCircle
 from hydraulics.test_pipe import TestPipe
-from hydrology.test_awbm import TestBucketCase, TestSurfaceStore
+from hydrology.test_awbm import TestBucketCase, TestSurfaceStore, TestRunSeries, TestTrustedInput, TestSensitivity, TestSnapshot
+from hydrology.test_awbm_batch import TestAwbmBatch
+from hydrology.test_calibration import TestCalibration
+from hydrology.test_enkf import TestEnsembleKalmanFilter
 from hydrology.test_catchment import TestCatchment
+from hydrology.test_sacramento import (TestSacramento, TestSacramentoSnapshot, TestSacramentoSeries,
+                                       TestSacramentoEtDemand, TestSacramentoCells, TestSacramentoFrozenGround)
+from hydrology.test_sacramento_recorder import TestSacramentoRecorder
 # TODO add test for: from hydrology.test_junction import ________
 from hydrology.test_watershed import TestWatershed
-from hydrology.test_wgen import TestWGEN
+from hydrology.test_wgen import TestWGEN, TestWgenGenerate, TestWgenStreams, TestWgenSpells, TestWgenResiduals, TestWgenTables, TestWgenChunks
+from hydrology.test_wgenpar import TestWgenPar
+from hydrology.test_wgen_cache import TestWgenCache
+from hydrology.test_wgen_multisite import TestMultiSiteWgen
+from hydrology.test_wgen_validation import TestWgenValidation
 from inputs.test_data import TestScalar, TestVector
 # TODO add test for: from inputs.test_table import _______
 # TODO - add new test for: from inputs.test_timeseries import _______
@@ -38,9 +48,33 @@ def suite():
     test_suite.addTest(unittest.makeSuite(TestPipe))
     test_suite.addTest(unittest.makeSuite(TestBucketCase))
     test_suite.addTest(unittest.makeSuite(TestSurfaceStore))
+    test_suite.addTest(unittest.makeSuite(TestRunSeries))
+    test_suite.addTest(unittest.makeSuite(TestTrustedInput))
+    test_suite.addTest(unittest.makeSuite(TestSensitivity))
+    test_suite.addTest(unittest.makeSuite(TestSnapshot))
+    test_suite.addTest(unittest.makeSuite(TestAwbmBatch))
+    test_suite.addTest(unittest.makeSuite(TestCalibration))
+    test_suite.addTest(unittest.makeSuite(TestEnsembleKalmanFilter))
     test_suite.addTest(unittest.makeSuite(TestCatchment))
+    test_suite.addTest(unittest.makeSuite(TestSacramento))
+    test_suite.addTest(unittest.makeSuite(TestSacramentoSnapshot))
+    test_suite.addTest(unittest.makeSuite(TestSacramentoSeries))
+    test_suite.addTest(unittest.makeSuite(TestSacramentoEtDemand))
+    test_suite.addTest(unittest.makeSuite(TestSacramentoCells))
+    test_suite.addTest(unittest.makeSuite(TestSacramentoFrozenGround))
+    test_suite.addTest(unittest.makeSuite(TestSacramentoRecorder))
     test_suite.addTest(unittest.makeSuite(TestWatershed))
     test_suite.addTest(unittest.makeSuite(TestWGEN))
+    test_suite.addTest(unittest.makeSuite(TestWgenGenerate))
+    test_suite.addTest(unittest.makeSuite(TestWgenStreams))
+    test_suite.addTest(unittest.makeSuite(TestWgenSpells))
+    test_suite.addTest(unittest.makeSuite(TestWgenResiduals))
+    test_suite.addTest(unittest.makeSuite(TestWgenTables))
+    test_suite.addTest(unittest.makeSuite(TestWgenChunks))
+    test_suite.addTest(unittest.makeSuite(TestWgenPar))
+    test_suite.addTest(unittest.makeSuite(TestWgenCache))
+    test_suite.addTest(unittest.makeSuite(TestMultiSiteWgen))
+    test_suite.addTest(unittest.makeSuite(TestWgenValidation))
     test_suite.addTest(unittest.makeSuite(TestScalar))
     test_suite.addTest(unittest.makeSuite(TestVector))
     test_suite.addTest(unittest.makeSuite(TestReservoir))
@@ -1,3 +1,5 @@
+import numpy as np
+from scipy.signal import lfilter
 from validation import error_checks as ec
 from water_manage.store import Store
 from water_manage.store_array import StoreArray
@@ -31,6 +33,14 @@ class Awbm:
             precipitation, remove losses, and overflow the
             amount that is in excess of the capacity.
             Typically these depths range from 10 mm to 400 mm
+        routing : str, default 'step'
+            How run_series routes bucket overflow through the surface and
+            baseflow stores. 'step' steps the stores one day at a time.
+            'filter' treats each store as a linear reservoir and solves it
+            over the whole record with one recursive filter pass.
+        fast_forward_dry : bool, default True
+            Used by run_series to advance spells of days without precip
+            in closed form instead of one day at a time.
 
         Methods
         -------
@@ -41,8 +51,16 @@ class Awbm:
             this is the main output of AWBM. It represents the
             outflow discharge rate from the catch01 on a per
             area basis [mm]
+        run_series : array[float]
+            same as runoff but for whole arrays of precip and et
+        validate(precip, et)
+            check the forcing and parameters once before a run
         set_bucket_capacity :
             reset the capacity depths for each bucket [mm]
+        snapshot : bytes
+            the bucket, surface and baseflow quantities as a small binary blob
+        restore_state(state)
+            put the model back in the state from a snapshot
     """
 
     def __init__(self, depth_capacity=[0.04, 0.15, 0.3]):
@@ -60,6 +78,8 @@ class Awbm:
         self.surface = Store(0.0)
         self.baseflow_recession = 0.309
         self.base = Store(0.0)
+        self.routing = 'step'
+        self.fast_forward_dry = True
 
         self.bucket_count = len(self.depth_comp_capacity)
         bucket_capacities = [0.0] * self.bucket_count
@@ -88,8 +108,9 @@ class Awbm:
             sum_overflow : float
                 the sum of overflows from all the buckets
         """
-        ec.check_all_items_positive(inflow)
-        ec.check_all_items_positive(outflow)
+        if not ec.is_trusted():
+            ec.check_all_items_positive(inflow)
+            ec.check_all_items_positive(outflow)
 
         sum_overflow = 0.0
         for i in range(self.bucket_count):
@@ -146,6 +167,178 @@ class Awbm:
         # Sum surface and baseflow
         return self.surface.outflow + self.base.outflow
 
+    def run_series(self, precip, et, sensitivity=False):
+        """Calculates the outflow series for whole arrays of precip and et
+
+            Gives the same numbers as calling runoff once per time step,
+            but the bucket, surface and baseflow states are carried in
+            float arrays instead of Store objects. Each bucket only sees
+            its own share of precip and et, so the buckets are stepped
+            one at a time over the whole record. The Store objects are
+            left holding the final state so runoff can carry on from here.
+
+            The surface and baseflow stores are routed as set by the
+            routing attribute. The 'filter' option agrees with runoff to
+            within floating point round-off rather than bit for bit.
+
+            If fast_forward_dry is set, every spell of two or more days
+            without precip is advanced in closed form: the buckets are
+            drawn down by the total et of the spell and the stores decay
+            geometrically. This also agrees with runoff to round-off.
+
+            With sensitivity set, the derivatives of the outflow with
+            respect to each parameter are carried along with the state
+            (forward mode). The initial state is held fixed. Where a bucket
+            is exactly at a kink (just full or just empty) the derivative
+            of the branch that was taken is used.
+
+            Parameters
+            ----------
+            precip : array[float]
+                Daily precipitation [m]
+            et : array[float] or float
+                effective evapotranspiration [m]
+            sensitivity : bool, default False
+                also return the parameter Jacobian of the outflow
+
+            Returns
+            -------
+            outflow : array[float]
+                outflow from the catchment [m] on a per unit area basis
+            jacobian : array[float]
+                only if sensitivity is set. Shaped time x parameter, with
+                columns for baseflow_index, surface_recession,
+                baseflow_recession and then depth_comp_capacity for each
+                bucket, in that order.
+        """
+        self.validate(precip, et)
+        precip, et = np.broadcast_arrays(np.asarray(precip, dtype=float),
+                                         np.asarray(et, dtype=float))
+        n = precip.size
+        fractions = np.asarray(self.partial_area_fraction, dtype=float)
+        capacities = np.array([store.capacity for store in self.buckets.stores])
+        quantities = np.array([store.quantity for store in self.buckets.stores])
+
+        # Net inflow to each bucket, one contiguous row per bucket
+        net = np.ascontiguousarray(np.multiply.outer(fractions, precip.ravel())
+                                   - np.multiply.outer(fractions, et.ravel()))
+        if self.routing not in ('step', 'filter'):
+            raise ValueError("routing should be 'step' or 'filter', not " + str(self.routing))
+
+        # Collapse each dry spell into one step of the buckets. With no
+        # precip the buckets can only drain, so the drawdown over the whole
+        # spell can be applied at once.
+        spells = None
+        if self.fast_forward_dry and n > 0:
+            spells = _dry_spells(precip.ravel())
+            net = np.add.reduceat(net, spells[0], axis=1)
+
+        overflow = np.zeros(net.shape[1])
+        bucket_overflow = np.zeros(self.bucket_count)
+        if sensitivity:
+            d_overflow = np.zeros(net.shape)
+            for i in range(self.bucket_count):
+                quantities[i], bucket_overflow[i] = _bucket_tangent(net[i], capacities[i], quantities[i],
+                                                                    fractions[i], overflow, d_overflow[i])
+        else:
+            for i in range(self.bucket_count):
+                quantities[i], bucket_overflow[i] = _bucket_series(net[i], capacities[i], quantities[i], overflow)
+
+        recession = (self.baseflow_index,
+                     self.surface_recession,
+                     self.baseflow_recession,
+                     self.surface.quantity,
+                     self.base.quantity)
+        if spells is not None:
+            full_overflow = np.zeros(n)
+            full_overflow[spells[0]] = overflow
+        else:
+            full_overflow = overflow
+        if spells is None:
+            route = (_recession_series if self.routing == 'step' else _recession_filter)
+            outflow, surface, base = route(overflow, *recession)
+        elif self.routing == 'step':
+            outflow, surface, base = _recession_dry(overflow, spells, *recession)
+        else:
+            outflow, surface, base = _recession_filter(full_overflow, *recession)
+
+        if sensitivity:
+            if spells is not None:
+                full = np.zeros((self.bucket_count, n))
+                full[:, spells[0]] = d_overflow
+                d_overflow = full
+            jacobian = _recession_tangent(full_overflow, d_overflow, *recession)
+
+        # Leave the stores in the same state as the per-step path
+        for i, (quantity, spill) in enumerate(zip(quantities.tolist(), bucket_overflow.tolist())):
+            self.buckets[i]._quantity = quantity
+            self.buckets[i].overflow = spill
+        if n > 0:
+            self.surface._quantity, self.surface.outflow = surface
+            self.base._quantity, self.base.outflow = base
+        if sensitivity:
+            return outflow.reshape(precip.shape), jacobian
+        return outflow.reshape(precip.shape)
+
+    def validate(self, precip, et):
+        """Check the forcing and parameters once before a run
+
+            All of precip and et is checked at once, so a run stepped
+            with runoff inside ec.trusted_input() can skip the checks
+            made on every step.
+
+            Parameters
+            ----------
+            precip, et : array[float]
+
+            Raises
+            ------
+            ValueError
+                if any forcing value is negative or missing, or a
+                parameter is out of range
+        """
+        ec.check_array_positive(precip, 'precip')
+        ec.check_array_positive(et, 'et')
+        ec.check_array_positive(self.depth_comp_capacity, 'depth_comp_capacity')
+        ec.check_in_range(self.baseflow_index)
+        ec.check_in_range(self.surface_recession)
+        ec.check_in_range(self.baseflow_recession)
+
+    def snapshot(self):
+        """Save the state of the model as bytes
+
+            The blob holds the bucket quantities followed by the surface
+            and baseflow quantities as little endian float64 values. It
+            can be kept in memory or written out, e.g. with np.save on
+            np.frombuffer(blob).
+
+            Returns
+            -------
+            state : bytes
+        """
+        quantities = [store.quantity for store in self.buckets.stores]
+        quantities += [self.surface.quantity, self.base.quantity]
+        return np.array(quantities, dtype='<f8').tobytes()
+
+    def restore_state(self, state):
+        """Put the model back in the state saved by snapshot
+
+            Parameters
+            ----------
+            state : bytes or array[float]
+                from snapshot, or the same values as an array
+        """
+        if isinstance(state, bytes):
+            state = np.frombuffer(state, dtype='<f8')
+        state = np.asarray(state, dtype=float).tolist()
+        ec.check_equal_values(self.bucket_count + 2, len(state))
+        ec.check_all_items_positive(state)
+        for i in range(self.bucket_count):
+            self.buckets[i]._quantity = state[i]
+            self.buckets[i].overflow = 0.0
+        self.surface._quantity = state[-2]
+        self.base._quantity = state[-1]
+
     def set_partial_area_fraction(self, new_fractions):
         """Reset the partial area fractions used for the bucket stores
 
@@ -179,3 +372,202 @@ class Awbm:
             bucket_capacities[i] = new_capacities[i] * self.partial_area_fraction[i]
         self.buckets.set_capacity(bucket_capacities)
         return "Array of fractions replaced."
+
+
+def _bucket_series(net, capacity, quantity, overflow):
+    """Step a single bucket through a series of net inflows
+
+        Overflow from the bucket is added onto the overflow array in place.
+
+        Returns
+        -------
+        quantity, last_overflow : float
+            the bucket state after the last step
+    """
+    spill = 0.0
+    for t, d in enumerate(net.tolist()):
+        quantity += d
+        if quantity > capacity:
+            spill = quantity - capacity
+            quantity = capacity
+            overflow[t] += spill
+        else:
+            spill = 0.0
+            if quantity < 0.0:
+                quantity = 0.0
+    return quantity, spill
+
+
+def _recession_series(overflow, baseflow_index, surface_recession, baseflow_recession, surface, base):
+    """Route a bucket overflow series through the surface and baseflow stores
+
+        Returns
+        -------
+        outflow : array[float]
+            surface plus baseflow outflow for each step
+        surface, base : tuple(float, float)
+            (quantity, outflow) of each store after the last step
+    """
+    outflow = np.empty(overflow.size)
+    q_surface = 0.0
+    q_base = 0.0
+    for t, o in enumerate(overflow.tolist()):
+        q_surface = (1.0 - surface_recession) * surface
+        surface += o * (1.0 - baseflow_index) - q_surface
+        q_base = (1.0 - baseflow_recession) * base
+        base += o * baseflow_index - q_base
+        outflow[t] = q_surface + q_base
+    return outflow, (surface, q_surface), (base, q_base)
+
+
+def _bucket_tangent(net, capacity, quantity, fraction, overflow, d_overflow):
+    """Same as _bucket_series, also carrying the derivative with respect
+        to the bucket's depth_comp_capacity
+
+        The derivative of the overflow is written into d_overflow.
+        While the bucket is full its quantity moves with the capacity
+        (derivative = fraction). Once it empties the derivative drops
+        to zero. In between it carries over from the last step.
+    """
+    spill = 0.0
+    d_quantity = 0.0
+    for t, d in enumerate(net.tolist()):
+        quantity += d
+        if quantity > capacity:
+            spill = quantity - capacity
+            quantity = capacity
+            overflow[t] += spill
+            d_overflow[t] = d_quantity - fraction
+            d_quantity = fraction
+        else:
+            spill = 0.0
+            if quantity < 0.0:
+                quantity = 0.0
+                d_quantity = 0.0
+    return quantity, spill
+
+
+def _recession_tangent(overflow, d_overflow, baseflow_index, surface_recession, baseflow_recession, surface, base):
+    """Derivatives of the outflow series with respect to each parameter
+
+        Each store is quantity[t] = k * quantity[t-1] + inflow[t], so the
+        derivative of its quantity follows the same recursion driven by
+        the derivative of its inflow, and each column is one lfilter pass.
+
+        Parameters
+        ----------
+        overflow : array[float]
+            bucket overflow for each step
+        d_overflow : array[float]
+            derivative of the overflow with respect to each bucket's
+            depth_comp_capacity, shaped bucket x time
+
+        Returns
+        -------
+        jacobian : array[float]
+            shaped time x parameter, in the order baseflow_index,
+            surface_recession, baseflow_recession, depth_comp_capacity
+    """
+    n = overflow.size
+    jacobian = np.zeros((n, 3 + d_overflow.shape[0]))
+    if n == 0:
+        return jacobian
+
+    def previous(quantity, initial):
+        return np.concatenate(([initial], quantity[:-1]))
+
+    def tangent(k, inflow):
+        # Outflow derivative of a store whose quantity derivative starts at zero
+        return (1.0 - k) * previous(lfilter([1.0], [1.0, -k], inflow), 0.0)
+
+    ks = surface_recession
+    kb = baseflow_recession
+    surface_prev = previous(lfilter([1.0], [1.0, -ks], overflow * (1.0 - baseflow_index), zi=[ks * surface])[0], surface)
+    base_prev = previous(lfilter([1.0], [1.0, -kb], overflow * baseflow_index, zi=[kb * base])[0], base)
+
+    jacobian[:, 0] = tangent(ks, -overflow) + tangent(kb, overflow)
+    jacobian[:, 1] = tangent(ks, surface_prev) - surface_prev
+    jacobian[:, 2] = tangent(kb, base_prev) - base_prev
+    for i in range(d_overflow.shape[0]):
+        jacobian[:, 3 + i] = tangent(ks, d_overflow[i] * (1.0 - baseflow_index)) + tangent(kb, d_overflow[i] * baseflow_index)
+    return jacobian
+
+
+def _dry_spells(precip):
+    """Split a precip series into steps, where each spell of days with
+        no precip counts as a single step.
+
+        Returns
+        -------
+        first : array[int]
+            index of the first day of each step
+        lengths : array[int]
+            number of days in each step
+    """
+    n = precip.size
+    dry = precip == 0.0
+    new_step = np.ones(n, dtype=bool)
+    new_step[1:] = ~(dry[1:] & dry[:-1])
+    first = np.flatnonzero(new_step)
+    lengths = np.diff(np.append(first, n))
+    return first, lengths
+
+
+def _recession_dry(overflow, spells, baseflow_index, surface_recession, baseflow_recession, surface, base):
+    """Same as _recession_series, but each dry spell is a single step
+
+        The overflow array holds one value per step from _dry_spells. Over
+        a dry spell there is no inflow, so each store decays geometrically
+        and the outflow for each day of the spell is filled in afterwards
+        from the store quantities at the start of the spell.
+    """
+    first, lengths = spells
+    outflow = np.empty(first[-1] + lengths[-1])
+    spell = np.flatnonzero(lengths > 1)
+    start = np.empty((2, spell.size))
+    q_surface = 0.0
+    q_base = 0.0
+    s = 0
+    for t, o, length in zip(first.tolist(), overflow.tolist(), lengths.tolist()):
+        if length == 1:
+            q_surface = (1.0 - surface_recession) * surface
+            surface += o * (1.0 - baseflow_index) - q_surface
+            q_base = (1.0 - baseflow_recession) * base
+            base += o * baseflow_index - q_base
+            outflow[t] = q_surface + q_base
+        else:
+            start[0, s] = surface
+            start[1, s] = base
+            s += 1
+            q_surface = (1.0 - surface_recession) * surface * surface_recession ** (length - 1)
+            q_base = (1.0 - baseflow_recession) * base * baseflow_recession ** (length - 1)
+            surface *= surface_recession ** length
+            base *= baseflow_recession ** length
+
+    # Outflow for each day of the dry spells
+    spell_lengths = lengths[spell]
+    which = np.repeat(np.arange(spell.size), spell_lengths)
+    day = np.arange(which.size) - np.repeat(np.cumsum(spell_lengths) - spell_lengths, spell_lengths)
+    outflow[first[spell][which] + day] = ((1.0 - surface_recession) * start[0, which] * surface_recession ** day
+                                          + (1.0 - baseflow_recession) * start[1, which] * baseflow_recession ** day)
+    return outflow, (surface, q_surface), (base, q_base)
+
+
+def _recession_filter(overflow, baseflow_index, surface_recession, baseflow_recession, surface, base):
+    """Same as _recession_series, solved as first order recursive filters
+
+        Each store is a linear reservoir, quantity[t] = k * quantity[t-1] + inflow[t],
+        with outflow[t] = (1 - k) * quantity[t-1]. The quantities for the
+        whole record come from one lfilter pass per store.
+    """
+    if overflow.size == 0:
+        return np.empty(0), (surface, 0.0), (base, 0.0)
+    outflow = np.zeros(overflow.size)
+    final = []
+    for fraction, k, quantity in ((1.0 - baseflow_index, surface_recession, surface),
+                                  (baseflow_index, baseflow_recession, base)):
+        store = lfilter([1.0], [1.0, -k], overflow * fraction, zi=[k * quantity])[0]
+        previous = np.concatenate(([quantity], store[:-1]))
+        outflow += (1.0 - k) * previous
+        final.append((store[-1], (1.0 - k) * previous[-1]))
+    return outflow, final[0], final[1]
@@ -0,0 +1,237 @@
+import numpy as np
+from validation import error_checks as ec
+from hydrology.awbm import Awbm
+
+
+class AwbmBatch:
+    """A class used to run the AWBM for many catchments at once
+
+        Holds the same state and parameters as Awbm, but as arrays with
+        one row per catchment so that every catchment is advanced by
+        one set of array operations instead of one Awbm object each.
+        The per-catchment results are the same as running an Awbm
+        object for each catchment.
+
+        Attributes
+        ----------
+        count : int
+            number of catchments in the batch
+        names : list(str)
+            catchment names, if built from a watershed
+        area : array[float]
+            Area of each catchment in m2
+        baseflow_index : array[float]
+            the fraction of total bucket overflow that goes to baseflow
+        surface_recession : array[float]
+            Surface outflow recession constant
+        baseflow_recession : array[float]
+            Baseflow recession constant
+        depth_comp_capacity : array[float]
+            Storage capacity for each bucket [m], shaped catchment x bucket
+        partial_area_fraction : array[float]
+            Area fraction for each bucket, shaped catchment x bucket
+        buckets : array[float]
+            Quantity in each bucket [m], shaped catchment x bucket
+        surface : array[float]
+            Quantity in the surface store of each catchment [m]
+        base : array[float]
+            Quantity in the baseflow store of each catchment [m]
+
+        Methods
+        -------
+        from_awbm(awbm_list)
+            build a batch from existing Awbm objects
+        from_catchments(catchments)
+            build a batch from a dict of Catchment objects
+        runoff(precip, et)
+            advance every catchment by one step
+        run_series(precip, et)
+            advance every catchment over a whole series
+        outflow(precip, et)
+            one step of runoff multiplied by catchment area
+        snapshot()
+            the state of every catchment as an array
+        restore_state(state)
+            put every catchment back in the state from a snapshot
+    """
+
+    def __init__(self, count=1, depth_capacity=[0.04, 0.15, 0.3]):
+        """Initialize the batch with the default Awbm parameters.
+            Parameters
+            ----------
+            count : int
+                The number of catchments
+            depth_capacity : list of float
+                The capacity (depth) of each bucket. Units are meters.
+        """
+        self.count = count
+        self.names = [None] * count
+        self.area = np.ones(count)
+        self.partial_area_fraction = np.tile([0.134, 0.433, 0.433], (count, 1))
+        self.depth_comp_capacity = np.tile(np.asarray(depth_capacity, dtype=float), (count, 1))
+        self.baseflow_index = np.full(count, 0.658)
+        self.surface_recession = np.full(count, 0.869)
+        self.baseflow_recession = np.full(count, 0.309)
+
+        self.bucket_count = self.depth_comp_capacity.shape[1]
+        self.buckets = np.zeros((count, self.bucket_count))
+        self.surface = np.zeros(count)
+        self.base = np.zeros(count)
+
+    @classmethod
+    def from_awbm(cls, awbm_list):
+        """Build a batch holding the parameters and state of Awbm objects
+
+            Parameters
+            ----------
+            awbm_list : list(Awbm)
+        """
+        batch = cls(len(awbm_list), awbm_list[0].depth_comp_capacity)
+        for i, a in enumerate(awbm_list):
+            ec.check_equal_values(batch.bucket_count, a.bucket_count)
+            batch.partial_area_fraction[i] = a.partial_area_fraction
+            batch.depth_comp_capacity[i] = a.depth_comp_capacity
+            batch.baseflow_index[i] = a.baseflow_index
+            batch.surface_recession[i] = a.surface_recession
+            batch.baseflow_recession[i] = a.baseflow_recession
+            batch.buckets[i] = [store.quantity for store in a.buckets.stores]
+            batch.surface[i] = a.surface.quantity
+            batch.base[i] = a.base.quantity
+        return batch
+
+    @classmethod
+    def from_catchments(cls, catchments):
+        """Build a batch from catchments that use the Awbm runoff method
+
+            Parameters
+            ----------
+            catchments : dict
+                Catchment objects by name, as held by a Watershed
+
+            Raises
+            ------
+            ValueError
+                if a catchment does not use the Awbm runoff method
+        """
+        names = list(catchments.keys())
+        for name in names:
+            if not isinstance(catchments[name].runoff_method, Awbm):
+                raise ValueError("The catchment " + str(name) + " does not use the Awbm runoff method.")
+        batch = cls.from_awbm([catchments[name].runoff_method for name in names])
+        batch.names = names
+        batch.area = np.array([catchments[name].area for name in names], dtype=float)
+        return batch
+
+    @property
+    def capacity(self):
+        """Capacity of each bucket [m], shaped catchment x bucket"""
+        return self.partial_area_fraction * self.depth_comp_capacity
+
+    def runoff(self, precip, et):
+        """Calculates the outflow rate for every catchment for one step
+
+            Parameters
+            ----------
+            precip : float or array[float]
+                Daily precipitation [m], one value or one per catchment
+            et : float or array[float]
+                effective evapotranspiration [m], one value or one per catchment
+
+            Returns
+            -------
+            outflow : array[float]
+                outflow from each catchment [m] on a per unit area basis
+        """
+        precip = np.broadcast_to(np.asarray(precip, dtype=float), (self.count,))
+        et = np.broadcast_to(np.asarray(et, dtype=float), (self.count,))
+        return _step(self, self.capacity, precip[:, None], et[:, None])
+
+    def run_series(self, precip, et):
+        """Calculates the outflow rate for every catchment over a series
+
+            Parameters
+            ----------
+            precip : array[float]
+                Daily precipitation [m], shaped time or time x catchment
+            et : array[float] or float
+                effective evapotranspiration [m], shaped time or time x catchment
+
+            Returns
+            -------
+            outflow : array[float]
+                outflow [m] on a per unit area basis, shaped time x catchment
+
+            Raises
+            ------
+            ValueError
+                if any precip or et value is negative or missing. The whole
+                series is checked once, not on every step.
+        """
+        ec.check_array_positive(precip, 'precip')
+        ec.check_array_positive(et, 'et')
+        precip = np.asarray(precip, dtype=float)
+        n = precip.shape[0]
+        precip = np.broadcast_to(precip.reshape(n, -1), (n, self.count))
+        et = np.asarray(et, dtype=float)
+        et = np.broadcast_to(et.reshape(et.shape[0], -1) if et.ndim else et, (n, self.count))
+
+        capacity = self.capacity
+        outflow = np.empty((n, self.count))
+        for t in range(n):
+            outflow[t] = _step(self, capacity, precip[t, :, None], et[t, :, None])
+        return outflow
+
+    def outflow(self, precip, et):
+        """Runoff for one step times catchment area, same as Catchment.outflow"""
+        return self.runoff(precip, et) * self.area
+
+    def snapshot(self):
+        """Save the state of every catchment
+
+            Returns
+            -------
+            state : array[float]
+                one row per catchment with the bucket quantities followed
+                by the surface and baseflow quantities, the same values
+                as Awbm.snapshot. Save it with np.save for a .npy record.
+        """
+        return np.column_stack((self.buckets, self.surface, self.base))
+
+    def restore_state(self, state):
+        """Put every catchment back in the state saved by snapshot
+
+            Parameters
+            ----------
+            state : array[float]
+                from snapshot, or a list of Awbm.snapshot blobs
+        """
+        if len(state) and isinstance(state[0], bytes):
+            state = [np.frombuffer(s, dtype='<f8') for s in state]
+        state = np.asarray(state, dtype=float)
+        ec.check_equal_values((self.count, self.bucket_count + 2), state.shape)
+        ec.check_positive(state.min(), 'state')
+        self.buckets[:] = state[:, :self.bucket_count]
+        self.surface[:] = state[:, -2]
+        self.base[:] = state[:, -1]
+
+
+def _step(batch, capacity, precip, et):
+    """Advance the batch state by one step
+
+        Follows the same order of operations as Awbm.runoff so that each
+        catchment gets the same numbers as its own Awbm object.
+    """
+    fractions = batch.partial_area_fraction
+    buckets = batch.buckets
+    buckets += fractions * precip - fractions * et
+    spill = buckets - capacity
+    np.maximum(spill, 0.0, out=spill)
+    np.minimum(buckets, capacity, out=buckets)
+    np.maximum(buckets, 0.0, out=buckets)
+    overflow = spill.sum(axis=1)
+
+    q_surface = (1.0 - batch.surface_recession) * batch.surface
+    batch.surface += overflow * (1.0 - batch.baseflow_index) - q_surface
+    q_base = (1.0 - batch.baseflow_recession) * batch.base
+    batch.base += overflow * batch.baseflow_index - q_base
+    return q_surface + q_base
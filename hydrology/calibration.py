@@ -0,0 +1,202 @@
+import hashlib
+import multiprocessing
+import numpy as np
+from hydrology.awbm import Awbm
+
+
+class AwbmCalibration:
+    """A class used to fit Awbm parameters to observed flows
+
+        Candidate parameter sets are run through Awbm.run_series on a
+        process pool, started by the first call to evaluate and kept until
+        close, or the end of a with block. The forcing and observed arrays
+        are handed to each worker once when the pool starts, so each task
+        only carries the parameter set there and the objective values
+        back. Objective values are cached by a hash of the parameter set
+        so a candidate that comes up again is never simulated twice.
+
+        A parameter set is a dict with any of PARAMETERS:
+        baseflow_index, surface_recession, baseflow_recession and
+        depth_comp_capacity (a list with one depth per bucket).
+        Missing keys keep the Awbm defaults.
+
+        Attributes
+        ----------
+        precip : array[float]
+            Daily precipitation [m]
+        et : array[float]
+            effective evapotranspiration [m]
+        observed : array[float]
+            Observed outflow [m] on a per unit area basis. NaN values
+            are left out of the objectives.
+        warmup : int
+            Number of days at the start left out of the objectives
+        processes : int
+            Size of the process pool. 1 runs everything in this process.
+        cache : dict
+            Objective values by parameter hash
+        simulations : int
+            Number of candidates actually simulated
+
+        Methods
+        -------
+        evaluate(candidates)
+            objective values for a list of parameter sets
+        search(bounds, count, seed)
+            evaluate random candidates within bounds and return the best
+        close()
+            shut down the process pool
+    """
+
+    PARAMETERS = ['baseflow_index', 'surface_recession', 'baseflow_recession', 'depth_comp_capacity']
+
+    def __init__(self, precip, et, observed, warmup=0, processes=None):
+        self.precip = np.asarray(precip, dtype=float)
+        self.et = np.broadcast_to(np.asarray(et, dtype=float), self.precip.shape)
+        self.observed = np.asarray(observed, dtype=float)
+        self.warmup = warmup
+        self.processes = processes or multiprocessing.cpu_count()
+        self.cache = {}
+        self.simulations = 0
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the process pool, if one was started"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def evaluate(self, candidates):
+        """Calculate the objective values for each parameter set
+
+            Parameters
+            ----------
+            candidates : list(dict)
+
+            Returns
+            -------
+            results : list(dict)
+                nse, rmse and bias for each candidate, in the same order
+        """
+        keys = [param_key(c) for c in candidates]
+        todo = {}
+        for key, candidate in zip(keys, candidates):
+            if key not in self.cache and key not in todo:
+                todo[key] = candidate
+
+        if todo:
+            forcing = (self.precip, self.et, self.observed, self.warmup)
+            if self.processes == 1:
+                _init_worker(*forcing)
+                results = [_evaluate_worker(c) for c in todo.values()]
+            else:
+                if self._pool is None:
+                    self._pool = multiprocessing.Pool(self.processes, _init_worker, forcing)
+                results = self._pool.map(_evaluate_worker, list(todo.values()))
+            self.cache.update(zip(todo.keys(), results))
+            self.simulations += len(todo)
+
+        return [self.cache[key] for key in keys]
+
+    def search(self, bounds, count=100, seed=None):
+        """Evaluate uniform random candidates and return the best one by NSE
+
+            Parameters
+            ----------
+            bounds : dict
+                (lower, upper) for each parameter. For depth_comp_capacity
+                give lists for lower and upper with one depth per bucket.
+            count : int
+                number of candidates
+            seed : int
+
+            Returns
+            -------
+            best : dict
+                the best parameter set
+            result : dict
+                objective values of the best parameter set
+        """
+        rng = np.random.RandomState(seed)
+        candidates = []
+        for i in range(count):
+            candidate = {}
+            for name, (lower, upper) in bounds.items():
+                value = rng.uniform(lower, upper)
+                candidate[name] = value.tolist() if np.ndim(value) else float(value)
+            candidates.append(candidate)
+
+        results = self.evaluate(candidates)
+        best = int(np.argmax([r['nse'] for r in results]))
+        return candidates[best], results[best]
+
+
+def param_key(params):
+    """Hash a parameter set so equal sets give equal keys"""
+    items = tuple((name, tuple(np.atleast_1d(params[name]).astype(float).tolist())) for name in sorted(params))
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+def build_awbm(params):
+    """Create an Awbm object with the given parameter set
+
+        Raises
+        ------
+        KeyError
+            if a name is not one of AwbmCalibration.PARAMETERS
+    """
+    a = Awbm()
+    for name, value in params.items():
+        if name not in AwbmCalibration.PARAMETERS:
+            raise KeyError(name + " is not an AwbmCalibration parameter.")
+        if name == 'depth_comp_capacity':
+            a.set_comp_capacity(list(value))
+        else:
+            setattr(a, name, value)
+    return a
+
+
+def nse(simulated, observed):
+    """Nash-Sutcliffe efficiency"""
+    return 1.0 - np.sum((simulated - observed) ** 2) / np.sum((observed - observed.mean()) ** 2)
+
+
+def rmse(simulated, observed):
+    """Root mean square error"""
+    return np.sqrt(np.mean((simulated - observed) ** 2))
+
+
+def bias(simulated, observed):
+    """Total simulated volume relative to the total observed volume, less 1"""
+    return np.sum(simulated) / np.sum(observed) - 1.0
+
+
+# Forcing held by each worker process, set once when the pool starts
+_forcing = {}
+
+
+def _init_worker(precip, et, observed, warmup):
+    _forcing['precip'] = precip
+    _forcing['et'] = et
+    _forcing['observed'] = observed
+    _forcing['warmup'] = warmup
+
+
+def _evaluate_worker(params):
+    simulated = build_awbm(params).run_series(_forcing['precip'], _forcing['et'])
+    warmup = _forcing['warmup']
+    observed = _forcing['observed'][warmup:]
+    simulated = simulated[warmup:]
+    keep = ~np.isnan(observed)
+    simulated = simulated[keep]
+    observed = observed[keep]
+    return {'nse': float(nse(simulated, observed)),
+            'rmse': float(rmse(simulated, observed)),
+            'bias': float(bias(simulated, observed))}
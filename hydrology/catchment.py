@@ -76,4 +76,12 @@ class Rational:
     
     def runoff(self, precip, et):
         precip_excess = precip - et
-        return precip_excess * (1 - self.loss)
\ No newline at end of file
+        return precip_excess * (1 - self.loss)
+
+    def snapshot(self):
+        """There is no state to save"""
+        return b''
+
+    def restore_state(self, state):
+        """There is no state to restore"""
+        pass
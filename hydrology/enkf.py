@@ -0,0 +1,219 @@
+import numpy as np
+from hydrology.awbm_batch import AwbmBatch
+from hydrology.sacramento import Sacramento
+
+
+class EnsembleKalmanFilter:
+    """A class used to assimilate observed streamflow into model states
+
+        The ensemble is held inside one model object whose state arrays
+        have a leading axis with one entry per member: a Sacramento with
+        states shaped member or member x basin, or an AwbmBatch with one
+        catchment per member and basin. Every member is advanced by the
+        model's own array operations, and the analysis works on the states
+        gathered into one member x basin x state array.
+
+        Each basin is updated from its own gauge only, so spurious
+        correlations between basins from a small ensemble do not leak
+        into the states.
+
+        Attributes
+        ----------
+        model : Sacramento or AwbmBatch
+            holds the state of every member
+        members : int
+            number of ensemble members
+        basins : int
+            number of basins
+        predicted : array[float]
+            the modelled flow from the last forecast, shaped member x basin
+        rng : np.random.Generator
+            used for the forcing and observation perturbations
+
+        Methods
+        -------
+        from_sacramento(init_state, params, globals, members, seed)
+            build a filter around a new Sacramento ensemble
+        from_awbm(awbm_list, members, seed)
+            build a filter around an AwbmBatch copied from Awbm objects
+        perturb(relative)
+            spread the members by multiplying each state by random factors
+        forecast(precip, et, precip_error)
+            advance every member by one time step
+        analysis(observed, error)
+            update the states from observed flows
+    """
+    SACRAMENTO_STATE = ['uztwc', 'uzfwc', 'lztwc', 'lzfsc', 'lzfpc', 'adimc']
+
+    def __init__(self, model, members, seed=None):
+        self.model = model
+        self.members = members
+        if isinstance(model, Sacramento):
+            self._shape = np.shape(model.uztwc)
+            if self._shape[:1] != (members,):
+                raise ValueError("The Sacramento states should have a leading axis of " + str(members) + " members.")
+        elif isinstance(model, AwbmBatch):
+            self._shape = (model.count,)
+            if model.count % members != 0:
+                raise ValueError("The AwbmBatch should hold the same number of catchments for each member.")
+        else:
+            raise TypeError("The model should be a Sacramento or an AwbmBatch.")
+        self.basins = int(np.prod(self._shape)) // members
+        self.predicted = None
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_sacramento(cls, init_state, params, globals, members, seed=None):
+        """Build a filter with every member starting from the same state
+
+            Parameters
+            ----------
+            init_state : dict
+                state values, a float or one value per basin
+            params : dict
+                parameter values, a float or one value per basin, shared
+                by every member
+            globals : dict
+                as for Sacramento
+            members : int
+            seed : int
+        """
+        shape = (members,) + np.shape(init_state['uztwc'])
+        states = {name: np.broadcast_to(np.asarray(value, dtype=float), shape).copy()
+                  for name, value in init_state.items()}
+        return cls(Sacramento(states, params, globals), members, seed)
+
+    @classmethod
+    def from_awbm(cls, awbm_list, members, seed=None):
+        """Build a filter with members copied from Awbm objects, one per basin"""
+        batch = AwbmBatch.from_awbm([a for m in range(members) for a in awbm_list])
+        return cls(batch, members, seed)
+
+    @property
+    def state(self):
+        """The state of every member, shaped member x basin x state"""
+        if isinstance(self.model, Sacramento):
+            return np.stack([np.broadcast_to(getattr(self.model, name), self._shape).reshape(self.members, -1)
+                             for name in self.SACRAMENTO_STATE], axis=-1)
+        batch = self.model
+        return np.column_stack((batch.buckets, batch.surface, batch.base)).reshape(self.members, self.basins, -1)
+
+    @state.setter
+    def state(self, value):
+        if isinstance(self.model, Sacramento):
+            for i, name in enumerate(self.SACRAMENTO_STATE):
+                setattr(self.model, name, value[..., i].reshape(self._shape).copy())
+        else:
+            batch = self.model
+            value = value.reshape(batch.count, -1)
+            batch.buckets[:] = value[:, :batch.bucket_count]
+            batch.surface[:] = value[:, -2]
+            batch.base[:] = value[:, -1]
+
+    def capacity(self):
+        """Largest value each state can take, shaped basin x state"""
+        if isinstance(self.model, Sacramento):
+            s = self.model
+            limits = [s.uztwm, s.uzfwm, s.lztwm, s.lzfsm, s.lzfpm, s.uztwm + s.lztwm]
+            return np.stack([np.broadcast_to(limit, self._shape[1:]).reshape(-1) for limit in limits], axis=-1)
+        capacity = self.model.capacity[:self.basins]
+        return np.column_stack((capacity, np.full((self.basins, 2), np.inf)))
+
+    def perturb(self, relative=0.1):
+        """Spread the members by multiplying each state by normal factors
+
+            Parameters
+            ----------
+            relative : float
+                standard deviation of the factors
+        """
+        state = self.state
+        state = state * self.rng.normal(1.0, relative, state.shape)
+        self.state = self._bounded(state)
+
+    def forecast(self, precip, et, precip_error=0.0):
+        """Advance every member by one time step
+
+            Parameters
+            ----------
+            precip : float or array[float]
+                precipitation, one value or one per basin
+            et : float or array[float]
+                evapotranspiration (ET-demand for Sacramento), one value or
+                one per basin
+            precip_error : float
+                standard deviation of the log of a multiplicative error
+                given to the precipitation of each member
+
+            Returns
+            -------
+            predicted : array[float]
+                modelled flow, shaped member x basin
+        """
+        size = (self.members, self.basins)
+        precip = np.broadcast_to(precip, size)
+        if precip_error > 0.0:
+            precip = precip * self.rng.lognormal(-0.5 * precip_error ** 2, precip_error, size)
+        et = np.broadcast_to(et, size)
+        if isinstance(self.model, Sacramento):
+            flow = self.model.update(precip.reshape(self._shape), et.reshape(self._shape))
+        else:
+            flow = self.model.runoff(precip.reshape(-1), et.reshape(-1))
+        self.predicted = np.reshape(flow, size)
+        return self.predicted
+
+    def analysis(self, observed, error):
+        """Update the states of every member from the observed flows
+
+            Uses perturbed observations: each member is moved towards its
+            own noisy copy of the observation by the Kalman gain worked out
+            from the ensemble covariances. Basins with a NaN observation
+            are left as they are.
+
+            Parameters
+            ----------
+            observed : float or array[float]
+                observed flow, one value per basin, in the units of the
+                model's flow
+            error : float or array[float]
+                standard deviation of the observation error, one value or
+                one per basin
+
+            Returns
+            -------
+            state : array[float]
+                the updated states, shaped member x basin x state
+        """
+        if self.predicted is None:
+            raise ValueError("forecast must be run before analysis.")
+        observed = np.broadcast_to(np.asarray(observed, dtype=float), (self.basins,))
+        error = np.broadcast_to(np.asarray(error, dtype=float), (self.basins,))
+        keep = ~np.isnan(observed)
+
+        state = self.state
+        predicted = self.predicted
+        anomaly = state - state.mean(axis=0)
+        predicted_anomaly = predicted - predicted.mean(axis=0)
+        # Covariances between the states and the predicted flow, and of the flow itself
+        pxy = np.einsum('mbs,mb->bs', anomaly, predicted_anomaly) / (self.members - 1)
+        pyy = np.einsum('mb,mb->b', predicted_anomaly, predicted_anomaly) / (self.members - 1) + error ** 2
+        gain = np.where(keep[:, None], pxy / pyy[:, None], 0.0)
+
+        perturbed = np.where(keep, observed, 0.0) + self.rng.normal(0.0, 1.0, predicted.shape) * error
+        innovation = np.where(keep, perturbed - predicted, 0.0)
+        state = state + innovation[:, :, None] * gain
+        self.state = self._bounded(state)
+        return self.state
+
+    def _bounded(self, state):
+        """state with every store between empty and its capacity
+
+            The Sacramento adimc store holds the tension water of uztwc as
+            well, so it is also kept at least as large as uztwc.
+        """
+        state = np.clip(state, 0.0, self.capacity())
+        if isinstance(self.model, Sacramento):
+            uztwc = self.SACRAMENTO_STATE.index('uztwc')
+            adimc = self.SACRAMENTO_STATE.index('adimc')
+            state[..., adimc] = np.maximum(state[..., adimc], state[..., uztwc])
+        return state
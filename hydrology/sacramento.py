@@ -1,158 +1,368 @@
-import math
+import numpy as np
 # This is the Sacramento Soil Moisture Accounting Model implemented in Python
 
 
 class Sacramento:
     # Class constants
     DT = 1.0        # Length of time interval in days
-    IFRZE = False       # Flag to incorporate frost calculations. True = use calculations
+    IFRZE = False       # Default for frozen_ground_calc_option. True = use frost calculations
+    STATE = ['uztwc', 'uzfwc', 'lztwc', 'lzfsc', 'lzfpc', 'adimc', 'fgix']  # Carried from one step to the next
+    PARAMS = ['uztwm', 'uzfwm', 'lztwm', 'lzfpm', 'lzfsm', 'uzk', 'lzpk', 'lzsk',
+              'zperc', 'rexp', 'pfree', 'pctim', 'adimp', 'riva', 'side', 'rserv']
+    # One record per grid cell: the state followed by the parameters
+    CELL_DTYPE = np.dtype([(name, '<f8') for name in STATE + PARAMS])
+    # First day of each month in a leap year, as a 0 based day of the year.
+    # Daily ET-demand tables use this calendar in every year, so a date always
+    # maps to the same entry and February 29 is only looked up in leap years.
+    MONTH_START = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+    OUTPUTS = ['tci', 'roimp', 'sdro', 'ssur', 'sif', 'bfs', 'bfp', 'bfcc', 'bfncc', 'tet']  # Kept by run_series
+    # Changed within a runoff increment
+    INCREMENT_VARS = ['uzfwc', 'lztwc', 'lzfsc', 'lzfpc', 'adimc',
+                      'sbf', 'spbf', 'ssur', 'sif', 'sperc', 'sdro']
+    # Changed by percolation
+    PERCOLATION_VARS = ['uzfwc', 'lztwc', 'lzfsc', 'lzfpc', 'sperc', 'sif']
     
     def __init__(self, init_state, params, globals):
+        """Each state and parameter value can be a float for a single basin,
+            or an array with one value per basin to run many basins together."""
         # Initial values of state variables
-        self.uztwc = init_state['uztwc']    # Upper zone tension water storage
-        self.uzfwc = init_state['uzfwc']    # Upper zone free water storage
-        self.lztwc = init_state['lztwc']    # Lower zone tension water storage
-        self.lzfsc = init_state['lzfsc']    # Lower zone supplementary free water storage
-        self.lzfpc = init_state['lzfpc']    # Upper zone primary free water storage
-        self.adimc = init_state['adimc']    # Additional impervious area storage
+        self.uztwc = _values(init_state['uztwc'])  # Upper zone tension water storage
+        self.uzfwc = _values(init_state['uzfwc'])  # Upper zone free water storage
+        self.lztwc = _values(init_state['lztwc'])  # Lower zone tension water storage
+        self.lzfsc = _values(init_state['lzfsc'])  # Lower zone supplementary free water storage
+        self.lzfpc = _values(init_state['lzfpc'])  # Upper zone primary free water storage
+        self.adimc = _values(init_state['adimc'])  # Additional impervious area storage
         self.fgix = 0.0                     # Initial value of the frost index, units of Cdeg
 
-        # Params yet to be incorporated:
-        self.sasc_input_option = True      # Option to use the SASC time series
+        # Recording intervals [hours], used by SacramentoRecorder:
         self.runoff_component_interval = 24
         #   Runoff component time series (ROCL) interval. Must be multiple of the input RAIM time series interval
         self.smzc_interval = 24
         #   Soil moisture storages time series (SMZC) interval. Must be multiple of the input RAIM time
         #   series interval
+
+        # Params yet to be incorporated:
+        self.sasc_input_option = True      # Option to use the SASC time series
         self.mape_input = False         # Option to use the MAPE time series
-        self.frozen_ground_calc_option = False
+        self.frozen_ground_calc_option = self.IFRZE
+        #   Option to run the frozen ground calculations. update then needs the air temperature.
+        self.max_ninc = 20
+        #   Largest number of increments a time interval is split into (None for no limit).
+        #   Without it a very wet interval is split into one increment per 5 mm of water.
         self.et_demand_curve = [0.65, 0.65, 0.67, 0.73, 0.89, 1.05, 1.09, 1.04, 0.9, 0.78, 0.73, 0.7]
         """ ET-demand or PE-adjustment factor (the table contains 12 values). If PE data used
         (i.e. MAPE_INPUT is “Yes”), then values are PEadjustments; if PE data not used, then values
         represent ET-demand. Both 16th of each month (Jan. through Dec.; units of MM/day); daily
         values are computed by linear interpolation."""
+        # Frozen ground parameters. The frost index fgix is 0 for thawed ground and
+        # goes negative as the ground freezes.
+        self.csoil = 0.1                # Heat transfer coefficient of bare soil [1/day]
+        self.csnow = 0.44               # Reduction in heat transfer per mm of snow water equivalent
+        self.ghc = 0.1                  # Ground heat contribution to thawing [Cdeg/day]
+        self.rthaw = 0.05               # Thaw of the frost index per mm of water entering the soil [Cdeg/mm]
+        self.frtemp = -3.0              # Frost index below which percolation and interflow are reduced [Cdeg]
+        self.satr = 0.2                 # Reduction in percolation per Cdeg of frost below frtemp when saturated
+        self.frexp = 8.0                # Exponent of the lower zone deficiency in the frozen ground reduction
         self.pxadj = 1.0                # Precipitation adjustment factor
         self.peadj = 1.0                # ET-demand adjustment factor
         self.efc = 0.0                  # Effective forest cover
         
         # Model parameters
-        self.uztwm = params['uztwm']  # Upper zone tension water capacity [mm]
-        self.uzfwm = params['uzfwm']  # Upper zone free water capacity [mm]
-        self.lztwm = params['lztwm']
-        self.lzfpm = params['lzfpm']  # Lower zone primary free water capacity [mm]
-        self.lzfsm = params['lzfsm']  # Lower zone supplementary free water capacity [mm]
-        self.uzk = params['uzk']  # Upper zone free water lateral depletion coefficient [1/day]
-        self.lzpk = params['lzpk']  # Lower zone primary free water depletion rate [1/day]
-        self.lzsk = params['lzsk']  # Lower zone supplementary free water depletion rate [1/day]
-        self.zperc = params['zperc']  # Percolation demand scale parameter [-]
-        self.rexp = params['rexp']  # Percolation demand shape parameter [-]
-        self.pfree = params['pfree']  # Percolating water split parameter (decimal fraction)
-        self.pctim = params['pctim']  # Impervious fraction of the watershed area (decimal fraction)
-        self.adimp = params['adimp']  # Additional impervious areas (decimal fraction)
-        self.riva = params['riva']  # Riparian vegetation area (decimal fraction)
-        self.side = params['side']  # The ratio of deep recharge to channel base flow [-]
-        self.rserv = params['rserv']  # Fraction of lower zone free water not transferrable (decimal fraction)
+        self.uztwm = _values(params['uztwm'])  # Upper zone tension water capacity [mm]
+        self.uzfwm = _values(params['uzfwm'])  # Upper zone free water capacity [mm]
+        self.lztwm = _values(params['lztwm'])
+        self.lzfpm = _values(params['lzfpm'])  # Lower zone primary free water capacity [mm]
+        self.lzfsm = _values(params['lzfsm'])  # Lower zone supplementary free water capacity [mm]
+        self.uzk = _values(params['uzk'])  # Upper zone free water lateral depletion coefficient [1/day]
+        self.lzpk = _values(params['lzpk'])  # Lower zone primary free water depletion rate [1/day]
+        self.lzsk = _values(params['lzsk'])  # Lower zone supplementary free water depletion rate [1/day]
+        self.zperc = _values(params['zperc'])  # Percolation demand scale parameter [-]
+        self.rexp = _values(params['rexp'])  # Percolation demand shape parameter [-]
+        self.pfree = _values(params['pfree'])  # Percolating water split parameter (decimal fraction)
+        self.pctim = _values(params['pctim'])  # Impervious fraction of the watershed area (decimal fraction)
+        self.adimp = _values(params['adimp'])  # Additional impervious areas (decimal fraction)
+        self.riva = _values(params['riva'])  # Riparian vegetation area (decimal fraction)
+        self.side = _values(params['side'])  # The ratio of deep recharge to channel base flow [-]
+        self.rserv = _values(params['rserv'])  # Fraction of lower zone free water not transferrable (decimal fraction)
 
         self.pxv = globals['pxv']  # Precip for the time interval
-        self.lwe = globals['lwe']
-        self.we = globals['we']
+        self.lwe = globals.get('lwe', 0.0)
+        self.we = globals.get('we', 0.0)
         self.isc = globals['isc']
         self.aesc = globals['aesc']
 
         self.roimp = 0.0
         self.lzdefr = 0.0
-        self.fr = 0.0
-        self.fi = 0.0
+        self.fr = 1.0
+        self.fi = 1.0
+        self._frozen = None
 
         self.sif = 0.0
         self.sperc = 0.0
         self.spbf = 0.0
+        self.sbf = 0.0
+        self.ssur = 0.0
+        self.sdro = 0.0
+        self.bfs = 0.0
+        self.bfp = 0.0
+        self.bfcc = 0.0
+        self.bfncc = 0.0
+        self.tet = 0.0
         self.sett = 0.0
         self.se1 = 0.0
         self.se3 = 0.0
         self.se4 = 0.0
         self.se5 = 0.0
         self.tci = 0.0
-        
-        self.bf = 0.0                   # baseflow
 
-    def update(self, p, et):
-        # Carryover state variables and update runoff amounts
-        self.evapotrans(et)
-        return None
-    
+        self.ninc_intervals = 0
+        self.ninc_capped = 0
+        self.ninc_largest = 0
+        self._depletion_key = None
+        self._depletion = None
+        self._depletion_unique = None
+        self._depletion_column = None
+        self._et_demand_key = None
+        self._et_demand = None
+
+    def snapshot(self):
+        """Save the state variables (in the order of STATE) as little endian float64 bytes"""
+        shape = np.shape(self.uztwc)
+        return np.array([np.broadcast_to(getattr(self, name), shape) for name in self.STATE], dtype='<f8').tobytes()
+
+    def restore_state(self, state):
+        """Put the state variables back from a snapshot (bytes or array in the order of STATE)"""
+        if isinstance(state, bytes):
+            state = np.frombuffer(state, dtype='<f8')
+        state = np.asarray(state, dtype=float)
+        shape = np.shape(self.uztwc)
+        if state.size != len(self.STATE) * int(np.prod(shape)):
+            raise ValueError("The state should have " + str(len(self.STATE)) + " values per basin.")
+        for name, value in zip(self.STATE, state.reshape((len(self.STATE),) + shape)):
+            setattr(self, name, _values(value))
+
+    @classmethod
+    def from_cells(cls, cells, globals):
+        """Build a model for a collection of grid cells
+
+            Each state and parameter is held as one contiguous array with a
+            value per cell, so a single update advances every cell and a
+            cell costs a few hundred bytes rather than a Python object.
+
+            Parameters
+            ----------
+            cells : structured array
+                One record per cell with the fields of CELL_DTYPE (fgix is
+                optional), e.g. from np.zeros(count, Sacramento.CELL_DTYPE)
+            globals : dict
+                pxv, isc and aesc, as for the constructor
+        """
+        columns = {name: np.ascontiguousarray(cells[name], dtype=float)
+                   for name in cells.dtype.names if name in cls.STATE + cls.PARAMS}
+        s = cls(columns, columns, globals)
+        if 'fgix' in columns:
+            s.fgix = columns['fgix']
+        return s
+
+    def cells(self):
+        """The state and parameters of every cell as a CELL_DTYPE structured array"""
+        shape = np.shape(self.uztwc)
+        cells = np.zeros(shape, dtype=self.CELL_DTYPE)
+        for name in self.STATE + self.PARAMS:
+            cells[name] = getattr(self, name)
+        return cells
+
+    def nbytes(self):
+        """Bytes held in arrays by the model, including the depletion table"""
+        return sum(value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray))
+
+    def update(self, p, et, ta=None):
+        """Advance the model by one time interval
+
+            Parameters
+            ----------
+            p : float or array[float]
+                Precipitation for the time interval [mm]
+            et : float or array[float]
+                ET-demand for the time interval [mm]
+            ta : float or array[float]
+                Air temperature for the time interval [C]. Only needed
+                with frozen_ground_calc_option.
+
+            Returns
+            -------
+            tci : float or array[float]
+                Total channel inflow for the time interval [mm]
+        """
+        self.pxv = _values(p)
+        if self.frozen_ground_calc_option:
+            if ta is None:
+                raise ValueError("The air temperature is needed for the frozen ground calculations.")
+            # Only the cells with frost below frtemp have their percolation reduced
+            frozen = np.flatnonzero(np.asarray(self.fgix) < self.frtemp)
+            self._frozen = frozen if frozen.size else None
+        self.evapotrans(_values(et))
+        if self.frozen_ground_calc_option:
+            self.frost1(np.asarray(ta, dtype=float))
+        return self.tci
+
+    def run_series(self, precip, pet, recorder=None, ta=None):
+        """Run the model over a whole series of precip and ET-demand
+
+            The state is carried in arrays, so every basin held by the
+            object is advanced together at each time step.
+
+            Parameters
+            ----------
+            precip : array[float]
+                Precipitation [mm], shaped time or time x basin
+            pet : array[float] or float
+                ET-demand [mm], shaped time or time x basin, e.g. from
+                et_demand(dates)
+            recorder : SacramentoRecorder
+                if given, results are only kept at the recorder's
+                intervals instead of at every time step
+            ta : array[float]
+                Air temperature [C], shaped time or time x basin. Only
+                needed with frozen_ground_calc_option.
+
+            Returns
+            -------
+            results : dict
+                Each of OUTPUTS by name, shaped time x basin (or just time
+                if the state is scalar), or recorder.results()
+        """
+        precip = np.asarray(precip, dtype=float)
+        pet = np.asarray(pet, dtype=float)
+        n = precip.shape[0]
+        if pet.ndim == 0:
+            pet = np.full(n, pet)
+        ta = [None] * n if ta is None else np.asarray(ta, dtype=float)
+        if recorder is not None:
+            for t in range(n):
+                self.update(precip[t], pet[t], ta[t])
+                recorder.record(self)
+            return recorder.results()
+
+        shape = np.broadcast(precip[0], pet[0], self.uztwc).shape
+        results = {name: np.zeros((n,) + shape) for name in self.OUTPUTS}
+        for t in range(n):
+            self.update(precip[t], pet[t], ta[t])
+            for name in self.OUTPUTS:
+                results[name][t] = getattr(self, name)
+        return results
+
+    def et_demand_table(self):
+        """Daily ET-demand (or PE-adjustment) for each day of a leap year
+
+            The 12 values of et_demand_curve belong to the 16th of each
+            month. Days between them are linearly interpolated, wrapping
+            from December 16th to January 16th, and the result is
+            multiplied by peadj. Entry 59 is February 29th. The table is
+            worked out once and rebuilt if et_demand_curve or peadj change.
+
+            Returns
+            -------
+            table : array[float]
+                366 values, indexed by day of the year in a leap year
+        """
+        key = (tuple(np.asarray(self.et_demand_curve, dtype=float).tolist()), float(self.peadj))
+        if key != self._et_demand_key:
+            curve = np.asarray(self.et_demand_curve, dtype=float)
+            if curve.shape != (12,):
+                raise ValueError("et_demand_curve should have 12 values, one for each month.")
+            mid_month = self.MONTH_START + 15
+            days = np.arange(366)
+            table = np.interp(days, mid_month, curve, period=366)
+            self._et_demand_key = key
+            self._et_demand = table * self.peadj
+        return self._et_demand
+
+    def et_demand(self, dates):
+        """Daily ET-demand (or PE-adjustment) for each date
+
+            Parameters
+            ----------
+            dates : array[datetime64] or list
+                Any dates numpy can convert to datetime64[D], e.g.
+                np.arange('1990-01-01', '2020-01-01', dtype='datetime64[D]')
+
+            Returns
+            -------
+            values : array[float]
+                from et_demand_table, in the shape of dates. Multiply PE by
+                these values when mape_input is True, otherwise use them as
+                the ET-demand [mm] for run_series.
+        """
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        months = dates.astype('datetime64[M]')
+        month = months.astype(int) % 12
+        day = (dates - months).astype(int)
+        return self.et_demand_table()[self.MONTH_START[month] + day]
+
     def evapotrans(self, ep):
-        """Compute evapotranspiration loss for the time interval."""
-        # epdist = list(range(0, 24))
+        """Compute evapotranspiration loss for the time interval, then
+            percolation and runoff (Fortran subroutine FLAND1)."""
         # edmnd is the et-demand for the time interval
-        edmnd = ep      # * epdist[self.kint] --this was removed for constant ep over the day
-        
+        edmnd = ep
+        uztwm, uzfwm, lztwm = self.uztwm, self.uzfwm, self.lztwm
+
         # Compute ET from the upper zone
-        e1 = edmnd * (self.uztwc / self.uztwm)
-        
+        e1 = edmnd * (self.uztwc / uztwm)
+
         # Residual evaporation demand
         red = edmnd - e1
-        
-        self.uztwc -= e1
-        
-        if self.uztwc < 0.0:
-            e1 += self.uztwc
-            self.uztwc = 0.0
-            red = edmnd - e1
-            
-        if self.uzfwc < red:
-            e2 = self.uzfwc
-            self.uzfwc = 0.0
-            red -= e2
-        else:
-            e2 = red
-            self.uzfwc -= e2
-            red = 0.0
-
-            if (self.uztwc / self.uztwm) < (self.uzfwc / self.uzfwm):
-                uzrat = (self.uztwc + self.uzfwc) / (self.uztwm + self.uzfwm)
-                self.uztwc = self.uztwm * uzrat
-                self.uzfwc = self.uzfwm * uzrat
-        
-        if self.uztwc < 0.00001:
-            self.uztwc = 0.0
-        if self.uzfwc < 0.00001:
-            self.uzfwc = 0.0
-            
+        uztwc = self.uztwc - e1
+        uzfwc = self.uzfwc
+
+        short_tension = uztwc < 0.0
+        e1 = _where(short_tension, e1 + uztwc, e1)
+        uztwc = _where(short_tension, 0.0, uztwc)
+        red = _where(short_tension, edmnd - e1, red)
+        # If the free water cannot meet what is left, it is emptied
+        short_free = short_tension & (uzfwc < red)
+        e2 = _where(short_tension, _where(short_free, uzfwc, red), 0.0)
+        uzfwc = _where(short_tension, _where(short_free, 0.0, uzfwc - e2), uzfwc)
+        red = _where(short_free, red - e2, _where(short_tension, 0.0, red))
+
+        # Upper zone free water is not allowed to be relatively fuller than tension water
+        uzrat = (uztwc + uzfwc) / (uztwm + uzfwm)
+        rebalance = ~short_free & ((uztwc / uztwm) < (uzfwc / uzfwm))
+        uztwc = _where(rebalance, uztwm * uzrat, uztwc)
+        uzfwc = _where(rebalance, uzfwm * uzrat, uzfwc)
+        self.uztwc = _where(uztwc < 0.00001, 0.0, uztwc)
+        self.uzfwc = _where(uzfwc < 0.00001, 0.0, uzfwc)
+
         # Compute ET from lower zone
-        e3 = red * (self.lztwc / (self.uztwm + self.lztwm))
-        self.lztwc -= e3
-        if self.lztwc < 0.0:
-            e3 += self.lztwc
-            self.lztwc = 0.0
-        ratlzt = self.lztwc / self.lztwm
-        ratlz = (self.lztwc + self.lzfpc + self.lzfsc) / (self.lztwm + self.lzfpm + self.lzfsm)
-        if ratlzt < ratlz:
-            delivery = (ratlz - ratlzt) * self.lztwm
-            self.lztwc += delivery
-            self.lzfsc -= delivery
-            if self.lzfsc < 0.0:
-                self.lzfpc += self.lzfsc
-                self.lzfsc = 0.0
-        if self.lztwc < 0.00001:
-            self.lztwc = 0.0
-            
-        e5 = e1 + (red + e2) * ((self.adimc - e1 - self.uztwc) / (self.uztwm + self.lztwm))
-        self.adimc -= e5
-        if self.adimc < 0.0:
-            e5 += self.adimc
-            self.adimc = 0.0
-        e5 *= self.adimp
-        
+        e3 = red * (self.lztwc / (uztwm + lztwm))
+        lztwc = self.lztwc - e3
+        e3 = _where(lztwc < 0.0, e3 + lztwc, e3)
+        lztwc = _maximum(lztwc, 0.0)
+
+        # Resupply lower zone tension water from the free water
+        saved = self.rserv * (self.lzfpm + self.lzfsm)
+        ratlzt = lztwc / lztwm
+        ratlz = (lztwc + self.lzfpc + self.lzfsc - saved) / (lztwm + self.lzfpm + self.lzfsm - saved)
+        delivery = _where(ratlzt < ratlz, (ratlz - ratlzt) * lztwm, 0.0)
+        lztwc = lztwc + delivery
+        lzfsc = self.lzfsc - delivery
+        self.lzfpc = _where(lzfsc < 0.0, self.lzfpc + lzfsc, self.lzfpc)
+        self.lzfsc = _maximum(lzfsc, 0.0)
+        self.lztwc = _where(lztwc < 0.00001, 0.0, lztwc)
+
+        # Compute ET from the adimp area
+        e5 = e1 + (red + e2) * ((self.adimc - e1 - self.uztwc) / (uztwm + lztwm))
+        adimc = self.adimc - e5
+        e5 = _where(adimc < 0.0, e5 + adimc, e5)
+        self.adimc = _maximum(adimc, 0.0)
+        e5 = e5 * self.adimp
+
         # Compute percolation and runoff amounts
-        twx = self.pxv + self.uztwc - self.uztwm
-        if twx < 0.0:
-            self.uztwc += self.pxv
-            twx = 0.0
-        else:
-            self.uztwc = self.uztwm
-        self.adimc += self.pxv - twx
-        
+        twx = self.pxv + self.uztwc - uztwm
+        self.uztwc = _where(twx < 0.0, self.uztwc + self.pxv, uztwm)
+        twx = _maximum(twx, 0.0)
+        self.adimc = self.adimc + self.pxv - twx
+
         # Compute impervious area runoff
         self.roimp = self.pxv * self.pctim
         self.runoff(twx)
@@ -161,123 +371,182 @@ class Sacramento:
         eused = e1 + e2 + e3
         # eused is the et from parea which is 1.0-adimp-pctim
         parea = 1.0 - self.adimp - self.pctim
-        self.sif *= parea
+        self.sif = self.sif * parea
         # Separate channel component of baseflow from the non-channel component
-        tbf = bf * parea
+        tbf = self.sbf * parea
         # tbf is total baseflow
-        bfcc = tbf * (1.0 / (1.0 + self.side))
+        self.bfcc = tbf * (1.0 / (1.0 + self.side))
         # bfcc is baseflow, channel component
-        bfp = self.spbf * parea / (1.0 + self.side)
-        bfs = bfcc - bfp
-        bfs = max(bfs, 0.0)
-        bfncc = tbf - bfcc
+        self.bfp = self.spbf * parea / (1.0 + self.side)
+        self.bfs = _maximum(self.bfcc - self.bfp, 0.0)
+        self.bfncc = tbf - self.bfcc
         # bfncc is baseflow,non-channel component
 
         # compute total channel inflow for the time interval.
-        self.tci = self.roimp + self.addro + self.ssur + self.sif + bfcc
+        tci = self.roimp + self.sdro + self.ssur + self.sif + self.bfcc
 
         # compute e4-et from riparian vegetation.
         e4 = (edmnd - eused) * self.riva
 
         # subtract e4 from channel inflow
-        self.tci -= e4
-        if self.tci < 0.0:
-            e4 += self.tci
-            self.tci = 0.0
+        tci = tci - e4
+        e4 = _where(tci < 0.0, e4 + tci, e4)
+        self.tci = _maximum(tci, 0.0)
 
         # compute total evapotranspiration - tet
         eused = eused * parea
-        tet = eused + e5 + e4
-        self.sett += tet
-        self.se1 += e1 * parea
-        self.se3 += e3 * parea
-        self.se4 += e4
-        self.se5 += e5
+        self.tet = eused + e5 + e4
+        self.sett = self.sett + self.tet
+        self.se1 = self.se1 + e1 * parea
+        self.se3 = self.se3 + e3 * parea
+        self.se4 = self.se4 + e4
+        self.se5 = self.se5 + e5
         # check that adimc >= uztwc
-        self.adimc = max(self.uztwc, self.adimc)
-    
+        self.adimc = _maximum(self.uztwc, self.adimc)
+
     def runoff(self, twx):
-        
+        """Split the time interval into increments and route the water
+            available in each one. Each basin gets its own number of
+            increments, so increments past that number leave it unchanged."""
+
         # Initialize time interval sums
-        self.sif = 0.0
-        self.sperc = 0.0
-        self.spbf = 0.0
-        
+        zero = np.zeros(np.shape(twx)) if isinstance(twx, np.ndarray) else 0.0
+        self.sbf = zero
+        self.ssur = zero
+        self.sif = zero
+        self.sperc = zero
+        self.sdro = zero
+        self.spbf = zero
+
         # Determine computational time increment for the basic time interval
-        ninc = 1.0 + 0.2 * (self.uzfwc + twx)
+        ninc = np.floor(1.0 + 0.2 * (self.uzfwc + twx)).astype(int)
         # ninc = number of time increments that the time interval is divided into for further
-        # soil-moisture accounting. No one increment will exceed 5.0 millimeters of uzfwc+pav
-        dinc = (1.0 / ninc) * self.DT
-        # dinc = length of each increment in days
+        # soil-moisture accounting. No one increment will exceed 5.0 millimeters of uzfwc+pav,
+        # unless that would take more than max_ninc increments.
+        self.ninc_intervals += ninc.size
+        self.ninc_largest = max(self.ninc_largest, int(np.max(ninc)))
+        if self.max_ninc is not None:
+            capped = ninc > self.max_ninc
+            self.ninc_capped += int(np.count_nonzero(capped))
+            ninc = _where(capped, self.max_ninc, ninc)
         pinc = twx / ninc
-        # pinc = Amount of available moisture for each increment. Compute free water depletion
+        # pinc = Amount of available moisture for each increment. Free water depletion
         # fractions for the time increment being used-basic depletions are for one day
-        duz = 1.0 - ((1.0 - self.uzk)**dinc)
-        dlzp = 1.0 - ((1.0 - self.lzpk)**dinc)
-        dlzs = 1.0 - ((1.0 - self.lzsk)**dinc)
-        
+        duz, dlzp, dlzs = self.depletion(ninc)
+
         # Start incremental do loop for the time interval.
-        for i in range(int(ninc)):
-            adsur = 0.0
-            # Compute direct runoff (from adimp area)
-            ratio = (self.adimc - self.uztwc) / self.lztwm
-            if ratio < 0.0:
-                ratio = 0.0
-            addro = pinc * ratio**2
-            # addro is the amount of direct runoff from the area adimp
-            
-        bf = self.baseflow(dlzp, dlzs)
+        for i in range(int(np.max(ninc))):
+            self.increment(i < ninc, pinc, duz, dlzp, dlzs)
+
+    def depletion(self, ninc):
+        """Free water depletion fractions for increments of 1/ninc of a time interval
+
+            For a given set of uzk, lzpk and lzsk these only depend on
+            ninc, so they are worked out once for each ninc and kept in a
+            table with one row per ninc. Basins sharing the same three
+            values share a column of the table, so a grid whose cells take
+            their parameters from a few soil classes only needs a few
+            columns. The table is rebuilt if any of the three parameters
+            change.
+
+            Returns
+            -------
+            duz, dlzp, dlzs : float or array[float]
+        """
+        key = tuple(np.asarray(k, dtype=float).tobytes() for k in (self.uzk, self.lzpk, self.lzsk)) + (self.DT,)
+        if key != self._depletion_key:
+            coefficients = np.broadcast_arrays(self.uzk, self.lzpk, self.lzsk)
+            unique, inverse = np.unique(np.stack(coefficients, axis=-1).reshape(-1, 3),
+                                        axis=0, return_inverse=True)
+            self._depletion_key = key
+            self._depletion_unique = unique.T
+            self._depletion_column = inverse.reshape(coefficients[0].shape)
+            self._depletion = np.zeros((3, 1, len(unique)))
+        rows = self._depletion.shape[1]
+        largest = int(np.max(ninc))
+        if largest >= rows:
+            # dinc = length of each increment in days
+            dinc = self.DT / np.arange(rows, largest + 1)[:, np.newaxis]
+            new_rows = 1.0 - (1.0 - self._depletion_unique[:, np.newaxis]) ** dinc
+            self._depletion = np.concatenate((self._depletion, new_rows), axis=1)
+        return tuple(self._depletion[:, ninc, self._depletion_column])
+
+    def ninc_report(self):
+        """How often max_ninc has limited the number of increments
+
+            Returns
+            -------
+            report : dict
+                intervals - number of basin time intervals run
+                capped - how many of them hit max_ninc
+                fraction - capped / intervals
+                largest - the largest ninc asked for, before the cap
+        """
+        return {'intervals': self.ninc_intervals,
+                'capped': self.ninc_capped,
+                'fraction': self.ninc_capped / max(self.ninc_intervals, 1),
+                'largest': self.ninc_largest}
+
+    def increment(self, active, pinc, duz, dlzp, dlzs):
+        """One increment of the soil moisture accounting, applied where active is True"""
+        before = {name: getattr(self, name) for name in self.INCREMENT_VARS}
+
+        # Compute direct runoff (from adimp area)
+        ratio = _maximum((self.adimc - self.uztwc) / self.lztwm, 0.0)
+        addro = pinc * ratio ** 2
+        # addro is the amount of direct runoff from the area adimp
+
+        self.baseflow(dlzp, dlzs)
+
+        # Compute percolation-if no water available then skip
+        percolate = (pinc + self.uzfwc) > 0.01
+        uzfwc_dry = self.uzfwc + pinc
+        skipped = {name: getattr(self, name) for name in self.PERCOLATION_VARS}
+        self.percolation(dlzp, dlzs, duz)
+        for name in self.PERCOLATION_VARS:
+            setattr(self, name, _where(percolate, getattr(self, name), skipped[name]))
+
+        # Distribute pinc between uzfwc and surface runoff.
+        spill = percolate & (pinc != 0.0) & ((pinc + self.uzfwc) > self.uzfwm)
+        sur = _where(spill, pinc + self.uzfwc - self.uzfwm, 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            adsur = _where(spill, sur * (1.0 - addro / pinc), 0.0)
+        # adsur is the amount of surface runoff which comes from that portion of adimp
+        # which is not currently generating direct runoff. addro/pinc is the fraction
+        # of adimp currently generating direct runoff.
+        self.ssur = self.ssur + sur * (1.0 - self.adimp - self.pctim) + adsur * self.adimp
+        self.uzfwc = _where(percolate, _where(spill, self.uzfwm, self.uzfwc + pinc), uzfwc_dry)
+
+        # adimp area water balance -- sdro is the sum of direct runoff.
+        adimc = self.adimc + pinc - addro - adsur
+        adimx = self.uztwm + self.lztwm
+        addro = _where(adimc > adimx, addro + adimc - adimx, addro)
+        adimc = _minimum(adimc, adimx)
+        self.sdro = self.sdro + addro * self.adimp
+        self.adimc = _where(adimc < 0.00001, 0.0, adimc)
+
+        # Only keep the changes for the basins that still have increments to run
+        for name in self.INCREMENT_VARS:
+            setattr(self, name, _where(active, getattr(self, name), before[name]))
 
     def baseflow(self, dlzp, dlzs):
-        # Compute baseflow
+        """Compute baseflow and keep track of time interval sum"""
         bf = self.lzfpc * dlzp
-        self.lzfpc -= bf
-        if self.lzfpc <= 0.0001:
-            bf += self.lzfpc
-            self.lzfpc = 0.0
+        lzfpc = self.lzfpc - bf
+        bf = _where(lzfpc <= 0.0001, bf + lzfpc, bf)
+        self.lzfpc = _where(lzfpc <= 0.0001, 0.0, lzfpc)
+        self.sbf = self.sbf + bf
+        self.spbf = self.spbf + bf
 
-        self.spbf += bf
         bf = self.lzfsc * dlzs
-        self.lzfsc -= bf
-        if self.lzfsc <= 0.0001:
-            bf += self.lzfsc
-            self.lzfsc = 0.0
-        return bf
-        
-        # Compute percolation-if no water available then skip
-        if pinc + self.uzfwc <= 0.01:
-            self.uzfwc += pinc
-        else:
-            self.percolation(dlzp, dlzs, duz, pinc, addro, adsur)
+        lzfsc = self.lzfsc - bf
+        bf = _where(lzfsc <= 0.0001, bf + lzfsc, bf)
+        self.lzfsc = _where(lzfsc <= 0.0001, 0.0, lzfsc)
+        self.sbf = self.sbf + bf
 
-        # Distribute pinc between uzfwc and surface runoff.
-        if pinc != 0.0:
-            # Check if pinc exceeds uzfwm
-            if (pinc + self.uzfwc) <= self.uzfwm:
-                # No surface runoff
-                self.uzfwc = self.uzfwc + pinc
-            else:
-                #
-                #     compute surface runoff (sur) and keep track of time interval sum.
-                sur = pinc + self.uzfwc - self.uzfwm
-                self.uzfwc = self.uzfwm
-                # self.ssur += sur * self.parea -- I removed cumulative since time step is always 1 day
-                adsur = sur * (
-                            1.0 - addro / pinc)  # adsur is the amount of surface runoff which comes from that portion of adimp which is not  # currently generating direct runoff.  addro/pinc is the fraction of adimp currently generating  # direct runoff.  # self.ssur += adsur * self.adimp -- I removed cumulative since time step is always 1 day  # adimp area water balance -- sdro is the 6 hr sum of direct runoff.
-
-        self.adimc = self.adimc + pinc - addro - adsur
-        if self.adimc > self.uztwm + self.lztwm:
-            addro = addro + self.adimc - (self.uztwm + self.lztwm)
-            self.adimc = self.uztwm + self.lztwm
-        self.sdro += addro * self.adimp
-        if self.adimc < 0.00001:
-            self.adimc = 0.0
-
-        # compute new frost index and moisture transfer.
-        if self.IFRZE:
-            self.frost1(self.pxv, sur, addro, self.lwe, self.we, self.isc, self.aesc)
-            
-    def percolation(self, dlzp, dlzs, duz, pinc, addro, adsur):
+    def percolation(self, dlzp, dlzs, duz):
+        """Compute percolation and interflow from the upper zone free water
+            and distribute the percolated water into the lower zones"""
         percm = self.lzfpm * dlzp + self.lzfsm * dlzs
         perc = percm * (self.uzfwc / self.uzfwm)
         defr = 1.0 - ((self.lztwc + self.lzfpc + self.lzfsc) / (self.lztwm + self.lzfpm + self.lzfsm))
@@ -286,142 +555,160 @@ class Sacramento:
         #     fr is the change in percolation withdrawal due to frozen ground.
         self.fi = 1.0
         #     fi is the change in interflow withdrawal due to frozen ground.
-        if self.IFRZE:
-            uzdefr = 1.0 - ((self.uztwc + self.uzfwc) / (self.uztwm + self.uzfwm))
+        if self._frozen is not None:
+            self.lzdefr = defr
             self.fgfr1()
-        
+
         perc = perc * (1.0 + self.zperc * (defr ** self.rexp)) * self.fr
         #     note...percolation occurs from uzfwc before pav is added.
-        if perc >= self.uzfwc:
-            # Percolation rate exceeds uzfwc.
-            perc = self.uzfwc
-        # Percolation rate is less than uzfwc.
-        self.uzfwc = self.uzfwc - perc
+        perc = _minimum(perc, self.uzfwc)
+        uzfwc = self.uzfwc - perc
         #     check to see if percolation exceeds lower zone deficiency.
         check = self.lztwc + self.lzfpc + self.lzfsc + perc - self.lztwm - self.lzfpm - self.lzfsm
-        if check > 0.0:
-            perc = perc - check
-            self.uzfwc += check
-
-        self.sperc += perc
+        check = _maximum(check, 0.0)
+        perc = perc - check
+        uzfwc = uzfwc + check
+        self.sperc = self.sperc + perc
         #     sperc is the time interval summation of perc
         #
         #     compute interflow and keep track of time interval sum.
         #     note...pinc has not yet been added
-        delivery = self.uzfwc * duz * self.fi
-        self.sif += delivery
-        self.uzfwc = self.uzfwc - delivery
+        delivery = uzfwc * duz * self.fi
+        self.sif = self.sif + delivery
+        self.uzfwc = uzfwc - delivery
         # Distribute percolated water into the lower zones
         # Tension water must be filled first except for the pfree area.
         # perct is percolation to tension water and percf is percolation going to free water.
         perct = perc * (1.0 - self.pfree)
-        if (perct + self.lztwc) <= self.lztwm:
-            self.lztwc = self.lztwc + perct
-            percf = 0.0
-        else:
-            percf = perct + self.lztwc - self.lztwm
-            self.lztwc = self.lztwm
+        fits = (perct + self.lztwc) <= self.lztwm
+        percf = _where(fits, 0.0, perct + self.lztwc - self.lztwm)
+        lztwc = _where(fits, self.lztwc + perct, self.lztwm)
         #
         #      distribute percolation in excess of tension
         #      requirements among the free water storages.
         percf = percf + perc * self.pfree
-        if percf != 0.0:
-            hpl = self.lzfpm / (self.lzfpm + self.lzfsm)
-            #     hpl is the relative size of the primary storage
-            #     as compared with total lower zone free water storage.
-            ratlp = self.lzfpc / self.lzfpm
-            ratls = self.lzfsc / self.lzfsm
-            #     ratlp and ratls are content to capacity ratios, or
-            #     in other words, the relative fullness of each storage
-            fracp = (hpl * 2.0 * (1.0 - ratlp)) / ((1.0 - ratlp) + (1.0 - ratls))
-            #     fracp is the fraction going to primary.
-            fracp = min(fracp, 1.0)
-            percp = percf * fracp
-            percs = percf - percp
-            # percp and percs are the amount of the excess percolation going to primary
-            # and supplemental storges, respectively.
-            self.lzfsc += percs
-            if self.lzfsc > self.lzfsm:
-                percs = percs - self.lzfsc + self.lzfsm
-                self.lzfsc = self.lzfsm
-            self.lzfpc = self.lzfpc + (percf - percs)
-            # Check to make sure lzfpc does not exceed lzfpm.
-            if self.lzfpc > self.lzfpm:
-                excess = self.lzfpc - self.lzfpm
-                self.lztwc = self.lztwc + excess
-                self.lzfpc = self.lzfpm
-            
-        
-    
+        hpl = self.lzfpm / (self.lzfpm + self.lzfsm)
+        #     hpl is the relative size of the primary storage
+        #     as compared with total lower zone free water storage.
+        ratlp = self.lzfpc / self.lzfpm
+        ratls = self.lzfsc / self.lzfsm
+        #     ratlp and ratls are content to capacity ratios, or
+        #     in other words, the relative fullness of each storage
+        deficit = (1.0 - ratlp) + (1.0 - ratls)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fracp = _where(deficit > 0.0, (hpl * 2.0 * (1.0 - ratlp)) / deficit, hpl)
+        #     fracp is the fraction going to primary.
+        fracp = _minimum(fracp, 1.0)
+        percp = percf * fracp
+        percs = percf - percp
+        # percp and percs are the amount of the excess percolation going to primary
+        # and supplemental storges, respectively.
+        lzfsc = self.lzfsc + percs
+        percs = _where(lzfsc > self.lzfsm, percs - lzfsc + self.lzfsm, percs)
+        self.lzfsc = _minimum(lzfsc, self.lzfsm)
+        lzfpc = self.lzfpc + (percf - percs)
+        # Check to make sure lzfpc does not exceed lzfpm.
+        excess = _maximum(lzfpc - self.lzfpm, 0.0)
+        self.lztwc = lztwc + excess
+        self.lzfpc = lzfpc - excess
+
     def fgfr1(self):
-        # Compute the change in the percolation and interflow withdrawal rates due to frozen ground.
-        # The following vars are references to items from an array that I still need to find.
-        findx = 1
-        frtemp = 1.0
-        satr = 1.0
-        frexp = 1.0
-
-        #     determine if frozen ground effect exists.
-        if findx < frtemp:
-            # Compute saturated reduction.
-            exp = frtemp - findx
-            fsat = (1.0 - satr)**exp
-            # Change at dry conditions
-            fdry = 1.0
-            # Compute actual change
-            if self.lzdefr <= 0.0:
-                self.fr = fsat
-                self.fi = self.fr
-            else:
-                self.fr = fsat + (fdry - fsat) * self.lzdefr**frexp
-                self.fi = self.fr
-
-    def frost1(self, pxv, sur, addro, isc, aesc):
-        # Compute the change in the frozen ground index and moisture movement due to temperature gradients.        #
-        # The following vars are references to items from an array that I still need to find.
-        ta = 1.0
-        lwe = 1.0
-        we = 1.0
-        findx = 1.0
-        # findx1 = findx
-        csoil = 4.0 * self.DT * 1.0
-        csnow = 1.0
-        ghc = 1.0 * self.DT
-        rthaw = 1.0
-        #
-        # Compute moisture movement (equations not ready yet)
-        #
-        # Compute change in frozen ground index due to water frezing in the soil.
-        if findx < 0.0:  # go to 120
-            water = pxv - sur - addro
-            if water > 0.0:  # go to 120
-                findx += rthaw * water
-            findx = max(findx, 0.0)
-        
-        # change due to temperature.
-        if (findx < 0.0) or (ta < 0.0):
-            # Compute transfer coefficient.
-            if lwe == 0.0 or we == 0.0:
-                c = csoil
-            else:
-                cover = 1.0
-                twe = we / cover
-                c = csoil * (1.0 - cover) + csoil * ((1.0 - csnow) ** twe) * cover
-            if isc > 0:
-                cover = aesc
-            else:
-                cover = 1.0
-                twe = we / cover
-                c = csoil * (1.0 - cover) + csoil * ((1.0 - csnow) ** twe) * cover
-            if cover == 0.0:
-                c = csoil
-
-            # compute change in frost index.
-            if ta < 0.0:  # go to 126
-                cfi = -c * math.sqrt(ta * ta + findx * findx) - c * findx + ghc
-                findx = findx + cfi
-            # go to 190
-            else:
-                findx = findx + c * ta + ghc
-        
-        return max(findx, 0.0)
+        """Compute the change in the percolation and interflow withdrawal rates
+            due to frozen ground (Fortran subroutine FGFR1)
+
+            Only the cells listed in _frozen, where the frost index is below
+            frtemp, are worked out. Everywhere else fr and fi stay 1.
+        """
+        cells = self._frozen
+        findx = _subset(self.fgix, cells)
+        # Compute saturated reduction.
+        fsat = (1.0 - _subset(self.satr, cells)) ** (_subset(self.frtemp, cells) - findx)
+        # Change at dry conditions
+        fdry = 1.0
+        # Compute actual change
+        lzdefr = np.maximum(_subset(self.lzdefr, cells), 0.0)
+        fr = np.ones(np.broadcast(self.lzdefr, self.fgix).shape)
+        fr.flat[cells] = fsat + (fdry - fsat) * lzdefr ** _subset(self.frexp, cells)
+        self.fr = fr
+        self.fi = fr
+
+    def frost1(self, ta):
+        """Compute the change in the frozen ground index for the time interval
+            (Fortran subroutine FROST1)
+
+            Only the cells that are frozen or below freezing are worked
+            out, so a warm interval costs one comparison per cell.
+
+            Parameters
+            ----------
+            ta : float or array[float]
+                Air temperature for the time interval [C]
+        """
+        shape = np.broadcast(self.tci, ta).shape
+        if not isinstance(self.fgix, np.ndarray) or self.fgix.shape != shape:
+            self.fgix = np.array(np.broadcast_to(self.fgix, shape), dtype=float)
+        cells = np.flatnonzero((self.fgix < 0.0) | (ta < 0.0))
+        if cells.size == 0:
+            return
+        findx = self.fgix.reshape(-1)[cells]
+        ta = _subset(ta, cells)
+
+        # Compute change in frozen ground index due to water entering the soil.
+        water = _subset(self.pxv - self.roimp - self.ssur - self.sdro, cells)
+        thaw = (findx < 0.0) & (water > 0.0)
+        findx = np.where(thaw, np.minimum(findx + _subset(self.rthaw, cells) * water, 0.0), findx)
+
+        # Compute transfer coefficient, reduced by snow cover.
+        csoil = _subset(self.csoil, cells) * self.DT
+        cover = _subset(self.aesc, cells) if np.any(self.isc > 0) else 1.0
+        we = _subset(self.we, cells)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            twe = we / cover
+            c = np.where((we > 0.0) & (cover > 0.0),
+                         csoil * (1.0 - cover) + csoil * ((1.0 - _subset(self.csnow, cells)) ** twe) * cover,
+                         csoil)
+
+        # Compute change in frost index due to temperature.
+        ghc = _subset(self.ghc, cells) * self.DT
+        cfi = np.where(ta < 0.0, -c * np.sqrt(ta * ta + findx * findx) - c * findx, c * ta) + ghc
+        self.fgix.flat[cells] = np.minimum(findx + cfi, 0.0)
+
+
+def _values(x):
+    """x as a float array, or as a numpy float for a single basin
+
+        A single basin is then stepped with numpy floats, whose arithmetic
+        costs much less than the same operations on 0-d arrays.
+    """
+    x = np.array(x, dtype=float)
+    return x[()] if x.ndim == 0 else x
+
+
+def _where(condition, x, y):
+    """np.where, or a plain choice when condition is a single bool"""
+    if isinstance(condition, (bool, np.bool_)):
+        return x if condition else y
+    return np.where(condition, x, y)
+
+
+def _maximum(x, y):
+    """np.maximum, or a plain comparison for a single basin"""
+    if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+        return np.maximum(x, y)
+    return y if y > x else x
+
+
+def _minimum(x, y):
+    """np.minimum, or a plain comparison for a single basin"""
+    if isinstance(x, np.ndarray) or isinstance(y, np.ndarray):
+        return np.minimum(x, y)
+    return y if y < x else x
+
+
+def _subset(x, cells):
+    """Values of x for the cells in the flat index array cells
+
+        Scalars apply to every cell so they are returned as they are.
+    """
+    x = np.asarray(x)
+    return x if x.ndim == 0 else x.reshape(-1)[cells]
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class SacramentoRecorder:
+    """A class used to keep Sacramento results at coarser intervals
+
+        Runoff components (ROCL) are kept every runoff_component_interval
+        hours and soil moisture storages (SMZC) every smzc_interval hours
+        of the model, instead of at every time step. The arrays are
+        allocated once, when the recorder is made, so a long sub-daily or
+        many-cell run only holds one row per recording interval.
+
+        Attributes
+        ----------
+        components : list(str)
+            Names from Sacramento.OUTPUTS that are recorded
+        states : list(str)
+            Names from Sacramento.STATE that are recorded
+        aggregate : bool
+            True to keep the sum of each runoff component over the
+            interval, False to keep its value at the end of the interval.
+            States are always kept at the end of the interval.
+        runoff_every : int
+            Number of model time steps in one runoff component interval
+        smzc_every : int
+            Number of model time steps in one soil moisture interval
+        runoff : dict
+            Runoff component arrays by name, shaped interval x basin
+        smzc : dict
+            State arrays by name, shaped interval x basin
+        steps : int
+            Number of time steps recorded so far
+
+        Methods
+        -------
+        record(model)
+            record the model after one time step
+        results()
+            the recorded runoff components and states
+    """
+
+    def __init__(self, model, steps, components=None, states=None, aggregate=True):
+        """Allocate the arrays for a run of the given number of time steps
+
+            Parameters
+            ----------
+            model : Sacramento
+                supplies the intervals, the time step (DT) and the number
+                of basins
+            steps : int
+                Number of time steps in the run
+            components : list(str)
+                defaults to Sacramento.OUTPUTS
+            states : list(str)
+                defaults to the soil moisture storages in Sacramento.STATE
+        """
+        self.components = list(model.OUTPUTS if components is None else components)
+        self.states = list(model.STATE[:6] if states is None else states)
+        self.aggregate = aggregate
+        step_hours = model.DT * 24.0
+        self.runoff_every = _interval_steps(model.runoff_component_interval, step_hours, 'runoff_component_interval')
+        self.smzc_every = _interval_steps(model.smzc_interval, step_hours, 'smzc_interval')
+
+        shape = np.shape(model.uztwc)
+        runoff_rows = -(-steps // self.runoff_every)
+        smzc_rows = -(-steps // self.smzc_every)
+        self.runoff = {name: np.zeros((runoff_rows,) + shape) for name in self.components}
+        self.smzc = {name: np.zeros((smzc_rows,) + shape) for name in self.states}
+        self.steps = 0
+
+    def record(self, model):
+        """Record the model after it has been advanced by one time step"""
+        row, position = divmod(self.steps, self.runoff_every)
+        for name in self.components:
+            if self.aggregate:
+                self.runoff[name][row] += getattr(model, name)
+            elif position == self.runoff_every - 1:
+                self.runoff[name][row] = getattr(model, name)
+
+        row, position = divmod(self.steps, self.smzc_every)
+        if position == self.smzc_every - 1:
+            for name in self.states:
+                self.smzc[name][row] = getattr(model, name)
+        self.steps += 1
+
+    def results(self):
+        """The recorded runoff components and states, by name, in one dict
+
+            A last interval that the run did not finish holds the sum so far
+            for runoff components and zeros otherwise.
+        """
+        results = dict(self.runoff)
+        results.update(self.smzc)
+        return results
+
+
+def _interval_steps(interval, step_hours, name):
+    """Number of model time steps in an interval given in hours"""
+    steps = interval / step_hours
+    if steps < 1 or steps != int(steps):
+        raise ValueError(name + " must be a multiple of the " + str(step_hours) + " hour time step.")
+    return int(steps)
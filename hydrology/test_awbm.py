@@ -1,4 +1,7 @@
+import threading
 import unittest
+import numpy as np
+from validation import error_checks as ec
 from hydrology.awbm import Awbm
 
 
@@ -71,5 +74,205 @@ class TestSurfaceStore(unittest.TestCase):
         self.assertAlmostEqual(outflow, 0.024936, self.precision)
 
 
+class TestRunSeries(unittest.TestCase):
+    def setUp(self):
+        """Set up two identical objects, one for each path"""
+        self.a_step = Awbm()
+        self.a_series = Awbm()
+        for a in (self.a_step, self.a_series):
+            a.buckets.set_quantities([0.0042, 0.05, 0.0429])
+            a.base.quantity = 0.01
+            a.surface.quantity = 0.01
+        rain = np.random.RandomState(42).gamma(0.7, 0.01, 1000)
+        self.precip = np.where(np.arange(1000) % 3 == 0, rain, 0.0)
+        self.et = 0.003
+
+    def tearDown(self):
+        """Destroy the objects after running tests"""
+        del self.a_step
+        del self.a_series
+
+    def testSameAsRunoff(self):
+        """Series outflow == per step outflow"""
+        expected = [self.a_step.runoff(p, self.et) for p in self.precip]
+        self.a_series.fast_forward_dry = False
+        outflow = self.a_series.run_series(self.precip, self.et)
+        np.testing.assert_array_equal(outflow, expected)
+
+    def testFinalState(self):
+        """Stores hold the same state after either path"""
+        for p in self.precip:
+            self.a_step.runoff(p, self.et)
+        self.a_series.fast_forward_dry = False
+        self.a_series.run_series(self.precip, self.et)
+        self.assertEqual(self.a_series.surface.quantity, self.a_step.surface.quantity)
+        self.assertEqual(self.a_series.base.quantity, self.a_step.base.quantity)
+        for i in range(self.a_step.bucket_count):
+            self.assertEqual(self.a_series.buckets[i].quantity, self.a_step.buckets[i].quantity)
+
+    def testVerificationOutflow(self):
+        """Compare to GoldSim model: AWBM Verification.gsm"""
+        self.a_series.buckets.set_quantities([0.00502, 0.140, 0.063])
+        self.a_series.base.quantity = 0.0
+        self.a_series.surface.quantity = 0.0
+        outflow = self.a_series.run_series([0.00654] * 10, [0.00025] * 10)
+        self.assertAlmostEqual(outflow.sum(), 0.024936, 3)
+
+    def testFilterRouting(self):
+        """Recursive filter routing == per step outflow"""
+        expected = [self.a_step.runoff(p, self.et) for p in self.precip]
+        self.a_series.routing = 'filter'
+        outflow = self.a_series.run_series(self.precip, self.et)
+        np.testing.assert_allclose(outflow, expected, rtol=1e-10, atol=1e-15)
+        self.assertAlmostEqual(self.a_series.base.quantity, self.a_step.base.quantity, 12)
+        self.assertAlmostEqual(self.a_series.surface.outflow, self.a_step.surface.outflow, 12)
+
+    def testDrySpells(self):
+        """Fast forward through dry spells == per step outflow"""
+        precip = np.where(np.arange(1000) % 40 < 3, self.precip + 0.01, 0.0)
+        expected = [self.a_step.runoff(p, self.et) for p in precip]
+        for routing in ('step', 'filter'):
+            a = Awbm()
+            a.buckets.set_quantities([0.0042, 0.05, 0.0429])
+            a.base.quantity = 0.01
+            a.surface.quantity = 0.01
+            a.routing = routing
+            outflow = a.run_series(precip, self.et)
+            np.testing.assert_allclose(outflow, expected, rtol=1e-10, atol=1e-15)
+            self.assertAlmostEqual(a.surface.outflow, self.a_step.surface.outflow, 12)
+            self.assertAlmostEqual(a.buckets.total_quantity(), self.a_step.buckets.total_quantity(), 12)
+
+    def testUnknownRouting(self):
+        """Unknown routing option raises an error"""
+        self.a_series.routing = 'kinematic'
+        self.assertRaises(ValueError, self.a_series.run_series, self.precip, self.et)
+
+
+class TestTrustedInput(unittest.TestCase):
+    def setUp(self):
+        """Set up a new object to be tested"""
+        self.a = Awbm()
+
+    def tearDown(self):
+        """Destroy the object after running tests"""
+        del self.a
+
+    def testCheckedByDefault(self):
+        """A negative store quantity is rejected by default"""
+        self.assertFalse(ec.is_trusted())
+        self.assertRaises(ValueError, setattr, self.a.surface, 'quantity', -1.0)
+
+    def testTrustedInput(self):
+        """Per step checks are skipped inside trusted_input"""
+        with ec.trusted_input():
+            self.a.surface.quantity = -1.0
+        self.assertFalse(ec.is_trusted())
+        self.assertRaises(ValueError, setattr, self.a.surface, 'quantity', -1.0)
+
+    def testNested(self):
+        """Leaving an inner block keeps the outer one trusted"""
+        with ec.trusted_input():
+            with ec.trusted_input():
+                pass
+            self.assertTrue(ec.is_trusted())
+        self.assertFalse(ec.is_trusted())
+
+    def testOtherThread(self):
+        """A trusted block does not switch off the checks in another thread"""
+        seen = []
+        with ec.trusted_input():
+            thread = threading.Thread(target=lambda: seen.append(ec.is_trusted()))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [False])
+
+    def testValidateOnce(self):
+        """run_series checks the whole series up front"""
+        precip = [0.01, 0.0, float('nan'), 0.02]
+        self.assertRaises(ValueError, self.a.run_series, precip, 0.001)
+        self.assertRaises(ValueError, self.a.run_series, [0.01, -0.02], 0.001)
+        self.a.baseflow_index = 1.5
+        self.assertRaises(ValueError, self.a.validate, [0.01], 0.001)
+
+
+class TestSensitivity(unittest.TestCase):
+    def setUp(self):
+        """Set up a parameter set and a forcing series"""
+        self.params = np.array([0.6, 0.85, 0.4, 0.04, 0.15, 0.3])
+        rain = np.random.RandomState(5).gamma(0.7, 0.02, 500)
+        self.precip = np.where(np.arange(500) % 3 == 0, rain, 0.0)
+        self.et = 0.003
+
+    def build(self, params):
+        """Create an Awbm object from a parameter vector"""
+        a = Awbm()
+        a.baseflow_index, a.surface_recession, a.baseflow_recession = params[:3]
+        a.set_comp_capacity(list(params[3:]))
+        a.buckets.set_quantities([0.001, 0.01, 0.02])
+        a.surface.quantity = 0.002
+        return a
+
+    def finite_difference(self):
+        """Central difference Jacobian of the outflow"""
+        jacobian = np.zeros((self.precip.size, self.params.size))
+        for j in range(self.params.size):
+            h = 1e-6 * self.params[j]
+            up = self.params.copy()
+            up[j] += h
+            down = self.params.copy()
+            down[j] -= h
+            jacobian[:, j] = (self.build(up).run_series(self.precip, self.et)
+                              - self.build(down).run_series(self.precip, self.et)) / (2.0 * h)
+        return jacobian
+
+    def testOutflowUnchanged(self):
+        """Carrying sensitivities does not change the outflow"""
+        outflow, jacobian = self.build(self.params).run_series(self.precip, self.et, sensitivity=True)
+        np.testing.assert_array_equal(outflow, self.build(self.params).run_series(self.precip, self.et))
+        self.assertEqual(jacobian.shape, (500, 6))
+
+    def testJacobian(self):
+        """Jacobian == finite differences for each routing option"""
+        expected = self.finite_difference()
+        for routing in ('step', 'filter'):
+            for fast_forward in (True, False):
+                a = self.build(self.params)
+                a.routing = routing
+                a.fast_forward_dry = fast_forward
+                jacobian = a.run_series(self.precip, self.et, sensitivity=True)[1]
+                np.testing.assert_allclose(jacobian, expected, rtol=1e-5, atol=1e-8)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        """Set up an object that has been spun up for a while"""
+        self.a = Awbm()
+        self.a.run_series(np.tile([0.02, 0.0, 0.0, 0.005], 50), 0.002)
+        self.precip = np.tile([0.01, 0.0, 0.003], 20)
+
+    def tearDown(self):
+        """Destroy the object after running tests"""
+        del self.a
+
+    def testRoundTrip(self):
+        """Restoring a snapshot repeats the same outflow"""
+        state = self.a.snapshot()
+        self.assertEqual(len(state), 40)
+        first = self.a.run_series(self.precip, 0.002)
+        self.a.restore_state(state)
+        np.testing.assert_array_equal(self.a.run_series(self.precip, 0.002), first)
+
+    def testWarmStart(self):
+        """A new object started from a snapshot == the spun up object"""
+        a2 = Awbm()
+        a2.restore_state(self.a.snapshot())
+        self.assertEqual(a2.buckets.total_quantity(), self.a.buckets.total_quantity())
+        self.assertEqual(a2.runoff(0.01, 0.002), self.a.runoff(0.01, 0.002))
+
+    def testWrongSize(self):
+        """A snapshot of the wrong size is rejected"""
+        self.assertRaises(ValueError, self.a.restore_state, [0.0, 0.0])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+from hydrology.awbm import Awbm
+from hydrology.awbm_batch import AwbmBatch
+from hydrology.catchment import Catchment
+
+
+class TestAwbmBatch(unittest.TestCase):
+    def setUp(self):
+        """Set up a few Awbm objects with different parameters and the
+            batch built from them"""
+        self.awbms = []
+        for i in range(4):
+            a = Awbm([0.03 + 0.01 * i, 0.15, 0.3 - 0.02 * i])
+            a.baseflow_index = 0.5 + 0.05 * i
+            a.surface_recession = 0.8 + 0.02 * i
+            a.baseflow_recession = 0.3 + 0.1 * i
+            a.buckets.set_quantities([0.0042, 0.05, 0.0429])
+            a.surface.quantity = 0.01
+            self.awbms.append(a)
+        self.batch = AwbmBatch.from_awbm(self.awbms)
+        rain = np.random.RandomState(7).gamma(0.7, 0.01, 500)
+        self.precip = np.where(np.arange(500) % 2 == 0, rain, 0.0)
+        self.et = 0.002
+
+    def tearDown(self):
+        """Destroy the objects after running tests"""
+        del self.awbms
+        del self.batch
+
+    def testDefaults(self):
+        """Default batch parameters == default Awbm parameters"""
+        a = Awbm()
+        b = AwbmBatch(2)
+        np.testing.assert_array_equal(b.capacity[1], [s.capacity for s in a.buckets.stores])
+        self.assertEqual(b.baseflow_index[0], a.baseflow_index)
+
+    def testRunoff(self):
+        """One batch step == one runoff call on each Awbm"""
+        expected = [a.runoff(0.00654, 0.00025) for a in self.awbms]
+        np.testing.assert_allclose(self.batch.runoff(0.00654, 0.00025), expected, rtol=1e-12)
+
+    def testRunSeries(self):
+        """Batch series == each Awbm stepped through the series"""
+        expected = np.array([[a.runoff(p, self.et) for a in self.awbms] for p in self.precip])
+        outflow = self.batch.run_series(self.precip, self.et)
+        self.assertEqual(outflow.shape, (500, 4))
+        np.testing.assert_allclose(outflow, expected, rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(self.batch.base, [a.base.quantity for a in self.awbms], rtol=1e-12)
+
+    def testPerCatchmentForcing(self):
+        """Each catchment can get its own precip series"""
+        precip = np.column_stack([self.precip * (i + 1) for i in range(4)])
+        expected = np.array([[a.runoff(p[i], self.et) for i, a in enumerate(self.awbms)] for p in precip])
+        np.testing.assert_allclose(self.batch.run_series(precip, self.et), expected, rtol=1e-12, atol=1e-15)
+
+    def testFromCatchments(self):
+        """Outflow includes the catchment area"""
+        catchments = {'C1': Catchment(1000.0, 'AWBM'), 'C2': Catchment(12600000.0, 'AWBM')}
+        batch = AwbmBatch.from_catchments(catchments)
+        self.assertEqual(batch.names, ['C1', 'C2'])
+        q = 0
+        for i in range(0, 11):
+            q = batch.outflow(0.00654, 0.00025)
+        self.assertAlmostEqual(q[1], 8321.71, 1)
+
+    def testSnapshot(self):
+        """Batch snapshot rows == Awbm snapshots, and restore repeats the run"""
+        for i, a in enumerate(self.awbms):
+            np.testing.assert_array_equal(self.batch.snapshot()[i], np.frombuffer(a.snapshot()))
+        state = self.batch.snapshot()
+        first = self.batch.run_series(self.precip, self.et)
+        self.batch.restore_state(state)
+        np.testing.assert_array_equal(self.batch.run_series(self.precip, self.et), first)
+        self.batch.restore_state([a.snapshot() for a in self.awbms])
+        np.testing.assert_array_equal(self.batch.snapshot(), state)
+
+
+if __name__ == '__main__':
+    unittest.main()
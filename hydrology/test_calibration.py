@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from hydrology.calibration import AwbmCalibration, build_awbm, param_key
+
+
+class TestCalibration(unittest.TestCase):
+    def setUp(self):
+        """Set up a calibration against flows from known parameters"""
+        rain = np.random.RandomState(3).gamma(0.7, 0.01, 730)
+        self.precip = np.where(np.arange(730) % 4 == 0, rain, 0.0)
+        self.et = 0.002
+        self.true_params = {'baseflow_index': 0.6,
+                            'surface_recession': 0.85,
+                            'baseflow_recession': 0.35,
+                            'depth_comp_capacity': [0.03, 0.12, 0.25]}
+        observed = build_awbm(self.true_params).run_series(self.precip, self.et)
+        self.cal = AwbmCalibration(self.precip, self.et, observed, warmup=30, processes=1)
+        self.precision = 6
+
+    def tearDown(self):
+        """Destroy the object after running tests"""
+        del self.cal
+
+    def testPerfectFit(self):
+        """True parameters give NSE == 1, RMSE == 0 and no bias"""
+        result = self.cal.evaluate([self.true_params])[0]
+        self.assertAlmostEqual(result['nse'], 1.0, self.precision)
+        self.assertAlmostEqual(result['rmse'], 0.0, self.precision)
+        self.assertAlmostEqual(result['bias'], 0.0, self.precision)
+
+    def testCache(self):
+        """Repeated candidates are only simulated once"""
+        other = dict(self.true_params, baseflow_index=0.4)
+        self.cal.evaluate([self.true_params, other, dict(self.true_params)])
+        self.cal.evaluate([other])
+        self.assertEqual(self.cal.simulations, 2)
+        self.assertEqual(len(self.cal.cache), 2)
+
+    def testParamKey(self):
+        """Key does not depend on the order of the parameters"""
+        reordered = dict(reversed(list(self.true_params.items())))
+        self.assertEqual(param_key(reordered), param_key(self.true_params))
+        self.assertNotEqual(param_key(dict(self.true_params, surface_recession=0.8)), param_key(self.true_params))
+
+    def testUnknownParameter(self):
+        """A misspelt parameter is an error rather than a new attribute"""
+        self.assertRaises(KeyError, build_awbm, {'baseflow_indx': 0.5})
+        self.assertRaises(KeyError, build_awbm, {'precip': 0.5})
+
+    def testPool(self):
+        """Process pool gives the same objectives as the serial run"""
+        candidates = [dict(self.true_params, baseflow_index=b) for b in (0.3, 0.5, 0.7, 0.9)]
+        serial = self.cal.evaluate(candidates)
+        with AwbmCalibration(self.precip, self.et, self.cal.observed, warmup=30, processes=2) as pooled:
+            self.assertEqual(pooled.evaluate(candidates[:2]), serial[:2])
+            pool = pooled._pool
+            self.assertEqual(pooled.evaluate(candidates), serial)
+            # The workers are started once and kept for later calls
+            self.assertIs(pooled._pool, pool)
+        self.assertIsNone(pooled._pool)
+
+    def testSearch(self):
+        """Random search finds a good fit"""
+        bounds = {'baseflow_index': (0.3, 0.9),
+                  'surface_recession': (0.7, 0.95),
+                  'baseflow_recession': (0.2, 0.5)}
+        best, result = self.cal.search(bounds, count=50, seed=1)
+        self.assertGreater(result['nse'], 0.5)
+        self.assertEqual(self.cal.simulations, 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
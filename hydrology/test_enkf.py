@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from hydrology.awbm import Awbm
+from hydrology.enkf import EnsembleKalmanFilter
+from hydrology.sacramento import Sacramento
+from hydrology.test_sacramento import sacramento_inputs
+
+
+class TestEnsembleKalmanFilter(unittest.TestCase):
+    def setUp(self):
+        self.basins = 5
+        self.init_states, self.params, self.globals = sacramento_inputs()
+        rng = np.random.RandomState(1)
+        self.precip = np.where(rng.uniform(size=(80, self.basins)) < 0.3,
+                               rng.gamma(0.6, 25.0, (80, self.basins)), 0.0)
+
+    def testTwinExperiment(self):
+        """Assimilating flows from a wetter truth pulls the lower zone towards it"""
+        truth_states = sacramento_inputs(self.basins, lztwc=300.0)[0]
+        truth = Sacramento(truth_states, self.params, self.globals)
+        observed = truth.run_series(self.precip, 3.0)['tci']
+
+        errors = []
+        for assimilate in (False, True):
+            f = EnsembleKalmanFilter.from_sacramento(
+                sacramento_inputs(self.basins)[0],
+                self.params, self.globals, 50, seed=0)
+            f.perturb(0.2)
+            for t in range(len(observed)):
+                predicted = f.forecast(self.precip[t], 3.0, precip_error=0.2)
+                self.assertEqual(predicted.shape, (50, self.basins))
+                if assimilate:
+                    f.analysis(observed[t], 0.1 * observed[t] + 0.1)
+            errors.append(np.abs(f.state.mean(axis=0)[:, 2] - truth.lztwc).mean())
+        self.assertLess(errors[1], 0.25 * errors[0])
+
+    def testSacramentoBounds(self):
+        """Updated Sacramento stores stay within capacity and adimc holds at least uztwc"""
+        f = EnsembleKalmanFilter.from_sacramento(self.init_states, self.params, self.globals, 30, seed=2)
+        self.assertIsInstance(f.rng, np.random.Generator)
+        f.perturb(0.5)
+        for t in range(20):
+            f.forecast(self.precip[t, 0], 3.0, precip_error=0.5)
+            state = f.analysis(50.0, 1.0)
+            self.assertTrue(np.all(state >= 0.0))
+            self.assertTrue(np.all(state <= f.capacity()))
+            self.assertTrue(np.all(state[..., 5] >= state[..., 0]))
+
+    def testAwbm(self):
+        """Awbm members stay within capacity and NaN observations change nothing"""
+        f = EnsembleKalmanFilter.from_awbm([Awbm(), Awbm()], 20, seed=1)
+        f.perturb(0.2)
+        self.assertEqual(f.state.shape, (20, 2, 5))
+        f.forecast(0.02, 0.002)
+        before = f.state
+        after = f.analysis([0.001, np.nan], 0.0005)
+        np.testing.assert_array_equal(after[:, 1], before[:, 1])
+        self.assertTrue(np.all(after[:, :, :3] <= f.capacity()[:, :3]))
+        self.assertTrue(np.all(after >= 0.0))
+
+    def testAnalysisNeedsForecast(self):
+        f = EnsembleKalmanFilter.from_awbm([Awbm()], 10)
+        self.assertRaises(ValueError, f.analysis, 0.001, 0.0005)
@@ -2,41 +2,40 @@ import unittest
 from hydrology.sacramento import Sacramento
 import numpy as np
 
+
+def sacramento_inputs(count=None, **overrides):
+    """Initial states, parameters and globals for the Sacramento tests
+
+        Any state, parameter or global can be overridden by name. With a
+        count the states and parameters are arrays with one value per basin.
+    """
+    init_states = {'uztwc': 20.0, 'uzfwc': 0.5, 'lztwc': 100.0,
+                   'lzfsc': 11.0, 'lzfpc': 27.0, 'adimc': 60.0}
+    params = {'uztwm': 40.0, 'uzfwm': 30.0, 'lztwm': 330.0, 'lzfpm': 40.0,
+              'lzfsm': 15.0, 'uzk': 0.4, 'lzpk': 0.005, 'lzsk': 0.1,
+              'zperc': 150.0, 'rexp': 2.0, 'pfree': 0.1, 'pctim': 0.05,
+              'adimp': 0.0, 'riva': 0.01, 'side': 0.2, 'rserv': 0.3}
+    globals = {'pxv': 0.0, 'isc': 1.0, 'aesc': 1.0}
+    for name, value in overrides.items():
+        for values in (init_states, params, globals):
+            if name in values:
+                values[name] = value
+                break
+        else:
+            raise KeyError(name + " is not a Sacramento input.")
+    if count is not None:
+        init_states = {name: np.full(count, value) for name, value in init_states.items()}
+        params = {name: np.full(count, value) for name, value in params.items()}
+    return init_states, params, globals
+
+
 class TestSacramento(unittest.TestCase):
     def setUp(self):
         """Set up a new object to be tested
 
             Compare results to GoldSim model: AWBM Verification.gsm"""
-        init_states = {'uztwc': 60.0,
-                       'uzfwc': 0.5,
-                       'lztwc': 100.0,
-                       'lzfsc': 11.0,
-                       'lzfpc': 47.0,
-                       'adimc': 160.0
-                       }
-        
-        params = {'uztwm': 40.0,    #default
-                  'uzfwm': 30.0,    #default
-                  'lztwm': 330.0,   #default
-                  'lzfpm': 40.0,    #default
-                  'lzfsm': 15.0,    #default
-                  'uzk': 0.4,       #default
-                  'lzpk': 0.005,    #default
-                  'lzsk': 0.1,      #default
-                  'zperc': 150.0,   #default
-                  'rexp': 2.0,      #default
-                  'pfree': 0.1,     #default
-                  'pctim': 0.0,     #default
-                  'adimp': 0.0,     #default
-                  'riva': 0.01,     #default
-                  'side': 0.0,      #default
-                  'rserv': 0.3      #default
-                  }
-        
-        globals = {'pxv': 2.5,
-                   'isc': 1.0,
-                   'aesc': 1.0
-                   }
+        init_states, params, globals = sacramento_inputs(uztwc=60.0, lzfpc=47.0, adimc=160.0,
+                                                         pctim=0.0, side=0.0, pxv=2.5)
         self.s1 = Sacramento(init_states, params, globals)
         self.precision = 2
     
@@ -46,8 +45,236 @@ class TestSacramento(unittest.TestCase):
         del self.precision
     
     def testET(self):
+        """Upper zone ET is the demand times uztwc / uztwm, and the water balance closes"""
         p = [0,2,4,8,16,32,0,0,0,0,0,0,0]
         et = 1.5
-        for i in range(10):
+        s = self.s1
+        initial = s.uztwc + s.uzfwc + s.lztwc + s.lzfsc + s.lzfpc
+        self.s1.update(p[0], et)
+        self.assertAlmostEqual(self.s1.se1, et * 60.0 / 40.0, self.precision)
+        out = s.tci + s.bfncc
+        for i in range(1, 10):
             self.s1.update(p[i], et)
-        self.assertAlmostEqual(self.s1.tci, 0.152, self.precision)
\ No newline at end of file
+            out += s.tci + s.bfncc
+        storage = s.uztwc + s.uzfwc + s.lztwc + s.lzfsc + s.lzfpc
+        self.assertAlmostEqual(sum(p[:10]), s.sett + out + storage - initial, 6)
+
+
+class TestSacramentoSnapshot(unittest.TestCase):
+    def setUp(self):
+        """Set up an object with a known state"""
+        init_states, params, globals = sacramento_inputs(uztwc=60.0, lzfpc=47.0, adimc=160.0,
+                                                         pctim=0.0, side=0.0, pxv=2.5)
+        self.s1 = Sacramento(init_states, params, globals)
+
+    def tearDown(self):
+        """Destroy the object after running tests"""
+        del self.s1
+
+    def testRoundTrip(self):
+        """Restoring a snapshot puts back every state variable"""
+        state = self.s1.snapshot()
+        self.s1.uztwc = 1.0
+        self.s1.lzfpc = 2.0
+        self.s1.restore_state(state)
+        self.assertEqual(self.s1.uztwc, 60.0)
+        self.assertEqual(self.s1.lzfpc, 47.0)
+        self.assertEqual(len(state), 8 * len(Sacramento.STATE))
+
+
+class TestSacramentoSeries(unittest.TestCase):
+    def setUp(self):
+        """Set up the inputs for a few years of daily data"""
+        self.init_states, self.params, self.globals = sacramento_inputs()
+        n = 1095
+        rng = np.random.RandomState(2)
+        self.precip = np.where(rng.uniform(size=n) < 0.3, rng.gamma(0.6, 25.0, n), 0.0)
+        self.pet = 3.0 + 2.0 * np.sin(np.arange(n) * 2.0 * np.pi / 365.0)
+
+    def storage(self, s):
+        """Total water held by the soil moisture stores [mm]"""
+        parea = 1.0 - s.adimp - s.pctim
+        return (s.uztwc + s.uzfwc + s.lztwc + s.lzfsc + s.lzfpc) * parea
+
+    def testWaterBalance(self):
+        """Precip == ET + channel inflow + deep recharge + change in storage"""
+        s = Sacramento(self.init_states, self.params, self.globals)
+        initial = self.storage(s)
+        results = s.run_series(self.precip, self.pet)
+        out = results['tet'].sum() + results['tci'].sum() + results['bfncc'].sum()
+        self.assertAlmostEqual(self.precip.sum(), out + self.storage(s) - initial, 6)
+        self.assertAlmostEqual(results['tet'].sum(), float(s.sett), 6)
+        self.assertGreater(results['tci'].sum(), 0.0)
+
+    def testManyBasins(self):
+        """Basins advanced together == each basin run on its own"""
+        count = 4
+        init_states, params, globals = sacramento_inputs(count, uzk=np.linspace(0.2, 0.5, count),
+                                                         adimp=np.linspace(0.0, 0.2, count))
+        precip = np.column_stack([self.precip * (0.5 + 0.25 * i) for i in range(count)])
+        results = Sacramento(init_states, params, globals).run_series(precip, self.pet)
+        self.assertEqual(results['tci'].shape, (1095, count))
+        for i in range(count):
+            single = Sacramento(self.init_states, {name: value[i] for name, value in params.items()}, self.globals)
+            expected = single.run_series(precip[:, i], self.pet)
+            for name in Sacramento.OUTPUTS:
+                np.testing.assert_allclose(results[name][:, i], expected[name], rtol=1e-9, atol=1e-9)
+
+    def testScalarPath(self):
+        """A single basin run with floats == the same basin held in arrays"""
+        s = Sacramento(self.init_states, self.params, self.globals)
+        results = s.run_series(self.precip, self.pet)
+        arrays = Sacramento(*sacramento_inputs(1))
+        expected = arrays.run_series(self.precip, self.pet)
+        for name in Sacramento.OUTPUTS:
+            np.testing.assert_allclose(results[name], expected[name][:, 0], rtol=1e-9, atol=1e-12)
+        for name in Sacramento.STATE[:6]:
+            self.assertAlmostEqual(getattr(s, name), float(getattr(arrays, name)[0]), 9)
+        self.assertEqual(s.ninc_report(), arrays.ninc_report())
+
+    def testUpdate(self):
+        """update returns tci for the time interval"""
+        s = Sacramento(self.init_states, self.params, self.globals)
+        tci = [float(s.update(p, 3.0)) for p in self.precip[:30]]
+        s2 = Sacramento(self.init_states, self.params, self.globals)
+        np.testing.assert_allclose(s2.run_series(self.precip[:30], 3.0)['tci'], tci)
+
+    def testNincCap(self):
+        """Capping ninc is counted and keeps the water balance closed"""
+        s = Sacramento(self.init_states, self.params, self.globals)
+        s.max_ninc = 4
+        initial = self.storage(s)
+        results = s.run_series(self.precip * 3.0, self.pet)
+        out = results['tet'].sum() + results['tci'].sum() + results['bfncc'].sum()
+        self.assertAlmostEqual(self.precip.sum() * 3.0, out + self.storage(s) - initial, 6)
+        report = s.ninc_report()
+        self.assertEqual(report['intervals'], 1095)
+        self.assertGreater(report['capped'], 0)
+        self.assertGreater(report['largest'], 4)
+        self.assertAlmostEqual(report['fraction'], report['capped'] / 1095.0)
+
+    def testNoCap(self):
+        """With max_ninc None no interval is capped"""
+        s = Sacramento(self.init_states, self.params, self.globals)
+        s.max_ninc = None
+        s.run_series(self.precip * 3.0, self.pet)
+        self.assertEqual(s.ninc_report()['capped'], 0)
+
+    def testDepletion(self):
+        """Depletion fractions match the formula and follow changes to uzk"""
+        s = Sacramento(self.init_states, self.params, self.globals)
+        duz, dlzp, dlzs = s.depletion(np.array(5))
+        self.assertAlmostEqual(float(duz), 1.0 - (1.0 - 0.4) ** (1.0 / 5.0))
+        self.assertAlmostEqual(float(dlzs), 1.0 - (1.0 - 0.1) ** (1.0 / 5.0))
+        s.uzk = 0.3
+        duz, dlzp, dlzs = s.depletion(np.array(5))
+        self.assertAlmostEqual(float(duz), 1.0 - (1.0 - 0.3) ** (1.0 / 5.0))
+
+
+class TestSacramentoEtDemand(unittest.TestCase):
+    def setUp(self):
+        self.s1 = Sacramento(*sacramento_inputs())
+
+    def testTable(self):
+        """Mid-month values come straight from et_demand_curve"""
+        table = self.s1.et_demand_table()
+        self.assertEqual(table.shape, (366,))
+        np.testing.assert_allclose(table[Sacramento.MONTH_START + 15], self.s1.et_demand_curve)
+        # Half way between December 16th and January 16th
+        self.assertAlmostEqual(table[0], 0.7 + (0.65 - 0.7) * 16.0 / 31.0)
+
+    def testLookup(self):
+        """Dates index the table the same way in leap and common years"""
+        dates = np.array(['2000-02-28', '2000-02-29', '2000-03-01', '2001-02-28', '2001-03-01',
+                          '1969-07-16'], dtype='datetime64[D]')
+        table = self.s1.et_demand_table()
+        np.testing.assert_allclose(self.s1.et_demand(dates), table[[58, 59, 60, 58, 60, 197]])
+        days = np.arange('1990-01-01', '2020-01-01', dtype='datetime64[D]')
+        self.assertEqual(self.s1.et_demand(days).shape, days.shape)
+
+    def testPeadj(self):
+        """peadj scales the table, which is rebuilt when it changes"""
+        before = self.s1.et_demand(['2010-06-16'])
+        self.s1.peadj = 1.2
+        np.testing.assert_allclose(self.s1.et_demand(['2010-06-16']), before * 1.2)
+
+
+class TestSacramentoCells(unittest.TestCase):
+    def setUp(self):
+        count = 500
+        init_states, params, self.globals = sacramento_inputs()
+        self.values = dict(init_states, fgix=0.0, **params)
+        self.cells = np.zeros(count, dtype=Sacramento.CELL_DTYPE)
+        for name, value in self.values.items():
+            self.cells[name] = value
+        self.cells['uzk'] = np.tile([0.3, 0.4, 0.5, 0.6, 0.7], count // 5)
+        rng = np.random.RandomState(3)
+        self.precip = np.where(rng.uniform(size=(60, count)) < 0.3, rng.gamma(0.6, 25.0, (60, count)), 0.0)
+
+    def testSameAsArrays(self):
+        """A model built from cells gives the same results as one built from arrays"""
+        columns = {name: self.cells[name].copy() for name in self.cells.dtype.names}
+        expected = Sacramento(columns, columns, self.globals).run_series(self.precip, 3.0)
+        s = Sacramento.from_cells(self.cells, self.globals)
+        results = s.run_series(self.precip, 3.0)
+        np.testing.assert_allclose(results['tci'], expected['tci'])
+        cells = s.cells()
+        self.assertEqual(cells.dtype, Sacramento.CELL_DTYPE)
+        np.testing.assert_allclose(cells['uzk'], self.cells['uzk'])
+        np.testing.assert_allclose(cells['lztwc'], s.lztwc)
+
+    def testMemory(self):
+        """A cell costs a few hundred bytes once the model has run"""
+        s = Sacramento.from_cells(self.cells, self.globals)
+        s.run_series(self.precip, 3.0)
+        self.assertLess(s.nbytes() / len(self.cells), 500)
+
+
+class TestSacramentoFrozenGround(unittest.TestCase):
+    def setUp(self):
+        count = 4
+        self.init_states, self.params, self.globals = sacramento_inputs(count, uzfwc=10.0, isc=0.0)
+        rng = np.random.RandomState(5)
+        self.precip = np.where(rng.uniform(size=(90, count)) < 0.3, rng.gamma(0.6, 25.0, (90, count)), 0.0)
+        # The first two basins freeze for 60 days then thaw, the others stay warm
+        self.ta = np.full((90, count), 10.0)
+        self.ta[:60, :2] = -10.0
+
+    def simulate(self, frozen_ground):
+        s = Sacramento(self.init_states, self.params, self.globals)
+        s.frozen_ground_calc_option = frozen_ground
+        return s, s.run_series(self.precip, 3.0, ta=self.ta)
+
+    def testWarmCells(self):
+        """Cells that never freeze get the same results as without frost"""
+        expected = self.simulate(False)[1]
+        s, results = self.simulate(True)
+        np.testing.assert_allclose(results['tci'][:, 2:], expected['tci'][:, 2:])
+        np.testing.assert_array_equal(s.fgix[2:], 0.0)
+
+    def testFrozenCells(self):
+        """Frozen ground cuts percolation, so more water runs off"""
+        expected = self.simulate(False)[1]
+        s = Sacramento(self.init_states, self.params, self.globals)
+        s.frozen_ground_calc_option = True
+        results = s.run_series(self.precip[:60], 3.0, ta=self.ta[:60])
+        self.assertTrue(np.all(s.fgix[:2] < s.frtemp))
+        self.assertTrue(np.all(results['tci'][:, :2].sum(axis=0) > expected['tci'][:60, :2].sum(axis=0)))
+        # The ground thaws once it is warm again
+        s.run_series(self.precip[60:], 3.0, ta=self.ta[60:])
+        self.assertTrue(np.all(s.fgix[:2] > -10.0))
+
+    def testSingleBasin(self):
+        """A basin held as floats freezes and thaws like the same column of an array model"""
+        s, expected = self.simulate(True)
+        single = Sacramento({name: value[0] for name, value in self.init_states.items()},
+                            {name: value[0] for name, value in self.params.items()}, self.globals)
+        single.frozen_ground_calc_option = True
+        results = single.run_series(self.precip[:, 0], 3.0, ta=self.ta[:, 0])
+        np.testing.assert_allclose(results['tci'], expected['tci'][:, 0])
+        self.assertAlmostEqual(float(single.fgix), s.fgix[0])
+
+    def testNeedsTemperature(self):
+        s = Sacramento(self.init_states, self.params, self.globals)
+        s.frozen_ground_calc_option = True
+        self.assertRaises(ValueError, s.update, 10.0, 3.0)
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from hydrology.sacramento import Sacramento
+from hydrology.sacramento_recorder import SacramentoRecorder
+from hydrology.test_sacramento import sacramento_inputs
+
+
+class TestSacramentoRecorder(unittest.TestCase):
+    def setUp(self):
+        count = 3
+        self.init_states, self.params, self.globals = sacramento_inputs(count)
+        rng = np.random.RandomState(4)
+        self.precip = np.where(rng.uniform(size=(100, count)) < 0.3, rng.gamma(0.6, 25.0, (100, count)), 0.0)
+
+    def model(self):
+        return Sacramento(self.init_states, self.params, self.globals)
+
+    def testIntervals(self):
+        """Sums of runoff components every 5 days, states every 10 days"""
+        expected = self.model().run_series(self.precip, 3.0)
+        s = self.model()
+        s.runoff_component_interval = 120
+        s.smzc_interval = 240
+        recorder = SacramentoRecorder(s, 100, states=['uztwc', 'lzfpc'])
+        results = s.run_series(self.precip, 3.0, recorder)
+        self.assertEqual(results['tci'].shape, (20, 3))
+        self.assertEqual(results['uztwc'].shape, (10, 3))
+        np.testing.assert_allclose(results['tci'], expected['tci'].reshape(20, 5, 3).sum(axis=1))
+        np.testing.assert_allclose(results['lzfpc'][-1], s.lzfpc)
+
+    def testSample(self):
+        """Without aggregation the value at the end of each interval is kept"""
+        expected = self.model().run_series(self.precip, 3.0)
+        s = self.model()
+        s.runoff_component_interval = 48
+        recorder = SacramentoRecorder(s, 100, components=['sdro'], aggregate=False)
+        results = s.run_series(self.precip, 3.0, recorder)
+        np.testing.assert_allclose(results['sdro'], expected['sdro'][1::2])
+
+    def testBadInterval(self):
+        """Intervals must be a multiple of the time step"""
+        s = self.model()
+        s.smzc_interval = 36
+        self.assertRaises(ValueError, SacramentoRecorder, s, 100)
@@ -1,6 +1,9 @@
+import os
+import tempfile
 import unittest
 from hydrology.watershed import Watershed
 from hydrology.catchment import Catchment
+from hydrology.awbm_batch import AwbmBatch
 import numpy as np
 from data.fileman import FileManager
 
@@ -30,6 +33,43 @@ class TestWatershed(unittest.TestCase):
         expected_ouflow = c.outflow(precip, et) * 2
         
         self.assertAlmostEqual(self.w.discharge(precip, et), expected_ouflow, self.precision)
+
+    def testDischargeBatch(self):
+        """discharge_batch gives the same outflow as discharge for Awbm catchments"""
+        w = Watershed()
+        w.add_junction('J1', 'sink')
+        w.link_catchment('C1', 'J1', 'AWBM')
+        w.link_catchment('C2', 'J1', 'AWBM')
+        batch = AwbmBatch.from_catchments(w.catchments)
+        for i in range(10):
+            expected = w.discharge(0.00654, 0.00025)
+            self.assertAlmostEqual(w.discharge_batch(batch, 0.00654, 0.00025), expected, 10)
+
+    def testBatchNeedsAwbm(self):
+        """A batch cannot be built from catchments using the simple method"""
+        self.assertRaises(ValueError, AwbmBatch.from_catchments, self.w.catchments)
+
+    def testRestoreState(self):
+        """Restoring a snapshot, from the dict or the .npz file, repeats the run"""
+        w = Watershed()
+        w.add_junction('J1', 'sink')
+        w.link_catchment('C1', 'J1', 'AWBM')
+        w.link_catchment('C2', 'J1', 'AWBM')
+        precip = [0.05, 0.0, 0.08, 0.02]
+        for p in precip:
+            w.discharge(p, 0.00025)
+        filename = os.path.join(tempfile.mkdtemp(), 'state.npz')
+        state = w.snapshot(filename)
+        expected = [w.discharge(p, 0.00025) for p in precip]
+        for saved in (state, filename):
+            w.restore_state(saved)
+            self.assertEqual([w.discharge(p, 0.00025) for p in precip], expected)
+
+    def testRestoreMissing(self):
+        """A state without one of the catchments is rejected"""
+        state = self.w.snapshot()
+        del state['C2']
+        self.assertRaises(ValueError, self.w.restore_state, state)
         
     def testLoadFile(self):
         precip = np.random.uniform(0, 15)
@@ -1,7 +1,9 @@
 import unittest
 from global_attributes.clock import Clock
-from hydrology.wgen import Wgen
+from concurrent.futures import ThreadPoolExecutor
+from hydrology.wgen import Wgen, realization_streams, _spell_occurrence, _truncated_normal
 import numpy as np
+import pandas as pd
 
 class TestWGEN(unittest.TestCase):
     def setUp(self):
@@ -93,6 +95,250 @@ class TestWGEN(unittest.TestCase):
             monthly_temps[i] /= realizations
 
         np.testing.assert_allclose(observed_tavg, monthly_temps, rtol=0.1, atol=0.05, err_msg='Not close enough!', verbose=True)
-        
+
+
+class TestWgenGenerate(unittest.TestCase):
+    def setUp(self):
+        self.w = Wgen()
+        self.dates = pd.date_range('1/1/2019', periods=3650)
+
+    def testShape(self):
+        rain, tmax, tmin = self.w.generate('1/1/2019', 3650, 20)
+        for values in (rain, tmax, tmin):
+            self.assertEqual(values.shape, (20, 3650))
+        self.assertTrue(np.all(tmax >= tmin))
+        self.assertTrue(np.all((rain == 0.0) | (rain >= self.w.min_rain)))
+
+    def testMonthlyRain(self):
+        """Mean monthly rain totals match the observed totals"""
+        rain_obs = [1.41, 1.68, 2.51, 3.63, 4.45, 4.15, 3.95,
+                    2.84, 4.00, 3.12, 1.58, 1.66]
+        self.w.min_rain = 0.0
+        rain = self.w.generate('1/1/2019', 3650, 50)[0]
+        month = self.dates.month.values - 1
+        monthly = [rain[:, month == m].sum() / (50 * 10) for m in range(12)]
+        np.testing.assert_allclose(rain_obs, monthly, rtol=0.1, atol=0.1)
+
+    def testBlocks(self):
+        """The temperature residuals carry over from one block of days to the next"""
+        self.w.BLOCK_SIZE = 200 * 30
+        rain, tmax, tmin = self.w.generate('1/1/2019', 360, 200)
+        anomaly = tmin - tmin.mean(axis=0)
+        last = np.arange(29, 359, 30)
+        r = [np.corrcoef(anomaly[:, d], anomaly[:, d + 1])[0, 1] for d in last]
+        self.assertGreater(np.mean(r), 0.3)
+
+    def testDetermTemp(self):
+        """Deterministic runs give the GoldSim temperatures on the first day of each month"""
+        goldsim_tavg = [19.19, 19.04, 23.47, 33.7, 47.97, 63.43,
+                        73.54, 74.41, 65.17, 50.55, 35.4, 24.74]
+        self.w.temp_determ = True
+        self.w.rain_deterministic = True
+        self.w.markov_deterministic = True
+        rain, tmax, tmin = self.w.generate('1/1/2019', 365, 2)
+        first = self.dates[:365].day == 1
+        np.testing.assert_almost_equal((tmax + tmin)[0, first] / 2.0, goldsim_tavg, decimal=1)
+
+
+class TestWgenSpells(unittest.TestCase):
+    def setUp(self):
+        self.w = Wgen(11)
+        self.w.occurrence = 'spells'
+        self.w.min_rain = 0.0
+
+    def testTransitions(self):
+        """Spells give the monthly transition probabilities of the Markov chain"""
+        dates = pd.date_range('1/1/2019', periods=3650)
+        month = dates.month.values[1:] - 1
+        wet = self.w.generate('1/1/2019', 3650, 100)[0] > 0.0
+        before = wet[:, :-1]
+        after = wet[:, 1:]
+        for m in range(12):
+            days = month == m
+            pww = (after & before)[:, days].sum() / before[:, days].sum()
+            pwd = (after & ~before)[:, days].sum() / (~before[:, days]).sum()
+            self.assertAlmostEqual(pww, self.w.pww_array[m], delta=0.02)
+            self.assertAlmostEqual(pwd, self.w.pwd_array[m], delta=0.02)
+
+    def testStreams(self):
+        batch = self.w.generate('1/1/2019', 500, 6, realization_streams(4, range(6)))
+        alone = self.w.generate('1/1/2019', 500, 1, realization_streams(4, [5]))
+        for i in range(3):
+            np.testing.assert_array_equal(batch[i][5], alone[i][0])
+
+    def testDrawCount(self):
+        """About one uniform number is drawn per spell rather than one per day"""
+        dates = pd.date_range('1/1/2019', periods=3650)
+        month = dates.month.values - 1
+        source = self.w._uniform_source()
+        drawn = []
+
+        def uniforms(rows, count):
+            drawn.append(len(rows) * count)
+            return source(rows, count)
+
+        wet_days, wet = _spell_occurrence(month, np.zeros(200, dtype=bool), np.asarray(self.w.pww_array)[month],
+                                          np.asarray(self.w.pwd_array)[month], uniforms)
+        spells = np.count_nonzero(wet_days[1:] != wet_days[:-1]) + 200
+        self.assertLess(sum(drawn), 1.5 * spells)
+        self.assertLess(sum(drawn), 0.5 * wet_days.size)
+        np.testing.assert_array_equal(wet, wet_days[-1])
+
+    def testSureSpell(self):
+        """A spell that is sure to carry on fills the rest of the run"""
+        self.w.pww_array = [1.0] * 12
+        self.w.wet = True
+        self.assertTrue(np.all(self.w.generate('1/1/2019', 400, 3)[0] > 0.0))
+
+    def testBadOccurrence(self):
+        self.w.occurrence = 'daily'
+        self.assertRaises(ValueError, self.w.generate, '1/1/2019', 10, 2)
+
+
+class TestWgenResiduals(unittest.TestCase):
+    def setUp(self):
+        self.w = Wgen(8)
+
+    def testTruncatedNormal(self):
+        e = _truncated_normal(np.random.default_rng(1), (3, 20000, 5))
+        self.assertEqual(e.shape, (3, 20000, 5))
+        self.assertLessEqual(np.abs(e).max(), 2.5)
+        self.assertAlmostEqual(e.mean(), 0.0, delta=0.01)
+        self.assertAlmostEqual(e.std(), 0.944, delta=0.01)
+
+    def testSeries(self):
+        """residual_series gives the same residuals as stepping one day at a time"""
+        e = _truncated_normal(np.random.default_rng(2), (3, 400, 6))
+        x0 = np.random.default_rng(3).normal(size=(3, 6))
+        x = x0
+        expected = np.empty_like(e)
+        for day in range(400):
+            x = self.w.TEMP_A @ x + self.w.TEMP_B @ e[:, day]
+            expected[:, day] = x
+        np.testing.assert_allclose(self.w.residual_series(e, x0), expected, atol=1e-12)
+
+    def testHarmonic(self):
+        """harmonic carries x from the day before"""
+        self.w.x = np.array([1.0, -0.5, 0.2])
+        e = _truncated_normal(np.random.default_rng(8), 3)
+        self.w.rng = np.random.default_rng(8)
+        np.testing.assert_allclose(self.w.harmonic(), self.w.TEMP_A @ self.w.x + self.w.TEMP_B @ e)
+
+    def testUpdate(self):
+        """Scalar update() follows x(t) = A x(t-1) + B e(t) from a fixed seed, carrying x"""
+        self.w.markov_deterministic = True
+        self.w.rain_deterministic = True
+        rng = np.random.default_rng(8)
+        tables = self.w.temperature_tables()
+        x = np.zeros(3)
+        for date in pd.date_range('1/1/2019', periods=60):
+            self.w.update(date)
+            x = self.w.TEMP_A @ x + self.w.TEMP_B @ _truncated_normal(rng, 3)
+            day = date.dayofyear - 1
+            wet = '1' if self.w.rain_today else ''
+            tmax1 = x[0] * tables['txs' + wet][day] + tables['txm' + wet][day]
+            tmin1 = x[1] * tables['tns'][day] + tables['tnm'][day]
+            np.testing.assert_allclose(self.w.x, x, rtol=1e-12)
+            self.assertAlmostEqual(self.w.tmax, max(tmax1, tmin1), 10)
+            self.assertAlmostEqual(self.w.tmin, min(tmax1, tmin1), 10)
+
+
+class TestWgenTables(unittest.TestCase):
+    def setUp(self):
+        self.w = Wgen(9)
+
+    def testTables(self):
+        tables = self.w.temperature_tables()
+        for name in Wgen.TEMPERATURE_TABLES:
+            self.assertEqual(tables[name].shape, (366,))
+        # dt_day is the warmest day
+        self.assertAlmostEqual(tables['txm'][199], self.w.txmd + self.w.atx)
+        self.assertAlmostEqual(tables['tnm'][199], self.w.tn + self.w.atn)
+        np.testing.assert_allclose(tables['txm'] - tables['txm1'], self.w.txmd - self.w.txmw)
+
+    def testRebuilt(self):
+        """The tables follow changes to the parameters"""
+        before = self.w.temperature_tables()['txm'][199]
+        self.w.atx += 1.0
+        self.assertAlmostEqual(self.w.temperature_tables()['txm'][199], before + 1.0)
+
+    def testCalcTemperature(self):
+        """The daily path takes its means from the tables"""
+        self.w.temp_determ = True
+        self.w.rain_today = False
+        date = pd.Timestamp('7/19/2019')
+        self.w.calc_temperature(date)
+        tables = self.w.temperature_tables()
+        x = self.w.x
+        tmax = x[0] * tables['txs'][date.dayofyear - 1] + tables['txm'][date.dayofyear - 1]
+        tmin = x[1] * tables['tns'][date.dayofyear - 1] + tables['tnm'][date.dayofyear - 1]
+        self.assertAlmostEqual(self.w.tmax, max(tmax, tmin))
+        self.assertAlmostEqual(self.w.tmin, min(tmax, tmin))
+
+
+class TestWgenStreams(unittest.TestCase):
+    def testSeed(self):
+        """The same seed gives the same weather"""
+        first = Wgen(5).generate('1/1/2019', 400, 4)
+        second = Wgen(np.random.default_rng(5)).generate('1/1/2019', 400, 4)
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(a, b)
+
+    def testRealization(self):
+        """Realization k is the same in a batch, on its own, or in a thread pool"""
+        batch = Wgen().generate('1/1/2019', 800, 10, realization_streams(42, range(10)))
+        alone = Wgen().generate('1/1/2019', 800, 1, realization_streams(42, [7]))
+
+        def one(k):
+            return Wgen().generate('1/1/2019', 800, 1, realization_streams(42, [k]))
+        with ThreadPoolExecutor(4) as pool:
+            threaded = list(pool.map(one, range(10)))
+        for i in range(3):
+            np.testing.assert_array_equal(batch[i][7], alone[i][0])
+            np.testing.assert_array_equal(batch[i][3], threaded[3][i][0])
+
+    def testSpawn(self):
+        """The streams are the children spawned from SeedSequence"""
+        child = np.random.default_rng(np.random.SeedSequence(42).spawn(10)[7])
+        np.testing.assert_array_equal(realization_streams(42, [7])[0].uniform(size=5), child.uniform(size=5))
+
+    def testStreamCount(self):
+        self.assertRaises(ValueError, Wgen().generate, '1/1/2019', 10, 3, realization_streams(1, range(2)))
+
+
+class TestWgenChunks(unittest.TestCase):
+    def join(self, chunks):
+        return [np.concatenate(arrays, axis=1) for arrays in zip(*chunks)]
+
+    def testSameAsGenerate(self):
+        """Joined chunks are the arrays generate returns, whatever the chunk size"""
+        expected = Wgen(4).generate('1/1/2019', 1500, 6)
+        for chunk_days in [1, 100, 365, 2000]:
+            joined = self.join(Wgen(4).generate_chunks('1/1/2019', 1500, 6, chunk_days))
+            for a, b in zip(expected, joined):
+                np.testing.assert_array_equal(a, b)
+
+    def testStreams(self):
+        streams = realization_streams(3, range(4))
+        expected = Wgen().generate('1/1/2019', 1000, 4, streams)
+        joined = self.join(Wgen().generate_chunks('1/1/2019', 1000, 4, 90, realization_streams(3, range(4))))
+        for a, b in zip(expected, joined):
+            np.testing.assert_array_equal(a, b)
+
+    def testChunkShape(self):
+        w = Wgen(1)
+        w.BLOCK_SIZE = 700
+        shapes = [rain.shape for rain, tmax, tmin in w.generate_chunks('1/1/2019', 1000, 2, 365)]
+        self.assertEqual(shapes, [(2, 365), (2, 365), (2, 270)])
+
+    def testSpells(self):
+        w = Wgen(2)
+        w.occurrence = 'spells'
+        expected = w.generate('1/1/2019', 800, 3)
+        w.rng = np.random.default_rng(2)
+        for a, b in zip(expected, self.join(w.generate_chunks('1/1/2019', 800, 3, 50))):
+            np.testing.assert_array_equal(a, b)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hydrology.wgen import Wgen, realization_streams
+from hydrology.wgen_cache import WgenCache
+import numpy as np
+
+
+class TestWgenCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = WgenCache(self.directory)
+        self.w = Wgen()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def testMiss(self):
+        """A new request is generated from the realization streams of the seed"""
+        rain, tmax, tmin = self.cache.generate(self.w, 7, '1/1/2019', 800, 3)
+        expected = Wgen().generate('1/1/2019', 800, 3, realization_streams(7, range(3)))
+        for a, b in zip((rain, tmax, tmin), expected):
+            np.testing.assert_array_equal(a, b)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def testHit(self):
+        """The same request is read back from the file as a memory map"""
+        first = self.cache.generate(self.w, 7, '1/1/2019', 400, 2)
+        self.w.rng = np.random.default_rng(99)
+        second = self.cache.generate(self.w, 7, '1/1/2019', 400, 2)
+        self.assertIsInstance(second[0].base, np.memmap)
+        self.assertFalse(second[0].flags.writeable)
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(a, b)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def testKeys(self):
+        """Changing the parameters, seed, dates or size makes a new entry"""
+        self.cache.generate(self.w, 7, '1/1/2019', 100, 2)
+        self.cache.generate(self.w, 8, '1/1/2019', 100, 2)
+        self.cache.generate(self.w, 7, '1/2/2019', 100, 2)
+        self.cache.generate(self.w, 7, '1/1/2019', 100, 3)
+        key = self.cache.parameter_key(self.w)
+        self.w.pww_array = [0.5] * 12
+        self.assertNotEqual(self.cache.parameter_key(self.w), key)
+        self.cache.generate(self.w, 7, '1/1/2019', 100, 2)
+        self.assertEqual(len(os.listdir(self.directory)), 5)
+
+    def testInvalidate(self):
+        self.cache.generate(self.w, 7, '1/1/2019', 100, 2)
+        self.cache.generate(self.w, 8, '1/1/2019', 100, 2)
+        key = self.cache.parameter_key(self.w)
+        self.w.txmd = 70.0
+        self.cache.generate(self.w, 7, '1/1/2019', 100, 2)
+        self.assertEqual(self.cache.invalidate(key), 2)
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertEqual(self.cache.size(), 0)
+
+    def testEviction(self):
+        """The least recently used files go first once max_bytes is passed"""
+        self.cache.generate(self.w, 1, '1/1/2019', 1000, 2)
+        self.cache.max_bytes = 3 * self.cache.size()
+        paths = []
+        for seed in range(1, 4):
+            self.cache.generate(self.w, seed, '1/1/2019', 1000, 2)
+            paths.append(self.cache.path(self.w, seed, '1/1/2019', 1000, 2))
+            os.utime(paths[-1], (seed, seed))
+        os.utime(paths[0], (10, 10))
+        self.cache.generate(self.w, 4, '1/1/2019', 1000, 2)
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    def testFailedStore(self):
+        """A request that fails while generating leaves no file behind"""
+        def generate_chunks(*args):
+            raise RuntimeError("generation failed")
+            yield
+        self.w.generate_chunks = generate_chunks
+        self.assertRaises(RuntimeError, self.cache.generate, self.w, 7, '1/1/2019', 100, 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def testStaleTemporary(self):
+        """Old temporary files are removed, ones that may still be written are kept"""
+        stale = os.path.join(self.directory, 'run.npy.1.tmp')
+        fresh = os.path.join(self.directory, 'run.npy.2.tmp')
+        for path in (stale, fresh):
+            open(path, 'wb').close()
+        os.utime(stale, (10, 10))
+        self.cache.generate(self.w, 7, '1/1/2019', 100, 2)
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+from hydrology.wgen import Wgen
+from hydrology.wgen_multisite import MultiSiteWgen
+from scipy.special import gammainccinv, ndtr
+import numpy as np
+
+
+class TestMultiSiteWgen(unittest.TestCase):
+    def setUp(self):
+        self.correlation = np.array([[1.0, 0.9, 0.3],
+                                     [0.9, 1.0, 0.3],
+                                     [0.3, 0.3, 1.0]])
+        self.stations = [Wgen() for i in range(3)]
+        self.stations[2].txmd += 10.0
+        self.stations[2].txmw += 10.0
+        self.m = MultiSiteWgen(self.stations, self.correlation, rng=1)
+
+    def testShape(self):
+        rain, tmax, tmin = self.m.generate('1/1/2019', 400, 5)
+        self.assertEqual(rain.shape, (5, 3, 400))
+        self.assertTrue((tmax >= tmin).all())
+        self.assertTrue((rain[rain > 0] >= self.stations[0].min_rain).all())
+
+    def testCorrelation(self):
+        """Wet days and temperatures are correlated in the order of the normals"""
+        rain, tmax, tmin = self.m.generate('1/1/2019', 3650, 20)
+        wet = (rain > 0).transpose(1, 0, 2).reshape(3, -1)
+        occurrence = np.corrcoef(wet)
+        self.assertGreater(occurrence[0, 1], 0.6)
+        self.assertGreater(occurrence[0, 1], occurrence[0, 2] + 0.3)
+        self.assertGreater(occurrence[0, 2], 0.1)
+        anomaly = (tmin - tmin.mean(axis=0)).transpose(1, 0, 2).reshape(3, -1)
+        self.assertAlmostEqual(np.corrcoef(anomaly)[0, 1], 0.9, delta=0.03)
+
+    def testIndependent(self):
+        """With no correlation each station keeps the statistics of its own Wgen"""
+        m = MultiSiteWgen(self.stations, np.eye(3), rng=2)
+        rain, tmax, tmin = m.generate('1/1/2019', 365, 400)
+        single = Wgen(2).generate('1/1/2019', 365, 400)
+        self.assertAlmostEqual(np.corrcoef((rain[:, 0] > 0).ravel(), (rain[:, 1] > 0).ravel())[0, 1], 0.0, delta=0.02)
+        self.assertAlmostEqual(rain[:, 0].mean() / single[0].mean(), 1.0, delta=0.05)
+        self.assertAlmostEqual(tmax[:, 0].mean(), single[1].mean(), delta=0.3)
+        self.assertAlmostEqual(tmax[:, 2].mean() - tmax[:, 0].mean(), 10.0, delta=0.5)
+
+    def testTruncated(self):
+        """Temperature normals are truncated like Wgen's, not clipped, so the spread matches"""
+        m = MultiSiteWgen(self.stations, np.eye(3), rng=3)
+        tmin = m.generate('1/1/2019', 365, 400)[2][:, 0]
+        single = Wgen(3).generate('1/1/2019', 365, 400)[2]
+        spread = (tmin - tmin.mean(axis=0)).std() / (single - single.mean(axis=0)).std()
+        self.assertAlmostEqual(spread, 1.0, delta=0.01)
+
+    def testQuantiles(self):
+        """The tabulated gamma quantiles match the exact ones"""
+        tables = self.m.quantile_tables()
+        w = self.stations[0]
+        z = self.m.QUANTILE_GRID[100]
+        exact = gammainccinv(w.alpha_array[3], ndtr(-z)) * w.beta_array[3]
+        self.assertAlmostEqual(tables[3, 0, 100], exact)
+
+    def testMatrix(self):
+        self.assertRaises(ValueError, MultiSiteWgen, self.stations, np.eye(2))
+        self.assertRaises(np.linalg.LinAlgError, MultiSiteWgen, self.stations, np.ones((3, 3)) * 2 - np.eye(3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from hydrology.wgen import Wgen
+from hydrology.wgen_validation import validate, expected_statistics, generated_statistics, spells
+import numpy as np
+import pandas as pd
+
+
+class TestWgenValidation(unittest.TestCase):
+    def setUp(self):
+        self.w = Wgen()
+
+    def testValidate(self):
+        """Thousands of generated station years match the parameters"""
+        report = validate(self.w, years=100, realizations=50, seed=1)
+        self.assertTrue(report['passed'].all().all(), report['passed'])
+        self.assertGreater(report['station_years_per_second'], 0.0)
+        self.assertEqual(report['spells']['wet'][0], 0)
+        self.assertGreater(report['spells']['wet'][1], report['spells']['wet'][2])
+
+    def testSpellOccurrence(self):
+        self.w.occurrence = 'spells'
+        report = validate(self.w, years=100, realizations=50, seed=2)
+        self.assertTrue(report['passed'].all().all(), report['passed'])
+
+    def testTolerance(self):
+        report = validate(self.w, years=5, realizations=2, seed=1, tolerances={'tmax_mean': ('absolute', 0.0)})
+        self.assertFalse(report['passed']['tmax_mean'].any())
+
+    def testSpells(self):
+        dates = pd.date_range('1/1/2019', periods=8)
+        wet = np.array([[1, 1, 0, 0, 0, 1, 0, 1],
+                        [0, 1, 1, 1, 0, 0, 1, 1]], dtype=bool)
+        lengths, spell_wet, month = spells(wet, dates)
+        np.testing.assert_array_equal(lengths, [3, 1, 1, 3, 2])
+        np.testing.assert_array_equal(spell_wet, [False, True, False, True, False])
+
+    def testThinning(self):
+        """Amounts below min_rain make the wet fraction smaller than the Markov chain's"""
+        dates = pd.date_range('1/1/2019', periods=365)
+        fraction = expected_statistics(self.w, dates)['wet_fraction']
+        self.w.min_rain = 0.0
+        chain = np.asarray(self.w.pwd_array) / (1.0 - np.asarray(self.w.pww_array) + np.asarray(self.w.pwd_array))
+        np.testing.assert_allclose(expected_statistics(self.w, dates)['wet_fraction'], chain)
+        self.assertTrue((fraction < chain).all())
+
+    def testGenerated(self):
+        dates = pd.date_range('1/1/2019', periods=365)
+        rain = np.where(np.arange(365) % 2 == 0, 1.0, 0.0)
+        stats = generated_statistics(dates, rain, np.full(365, 60.0), np.full(365, 40.0))
+        self.assertAlmostEqual(stats['pww'][1], 0.0)
+        self.assertAlmostEqual(stats['pwd'][1], 1.0)
+        self.assertAlmostEqual(stats['wet_spell'][3], 1.0)
+        self.assertAlmostEqual(stats['tmax_std'][5], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import unittest
+from hydrology.wgen import Wgen
+from hydrology.wgenpar import read_record, estimate_parameters
+import numpy as np
+import pandas as pd
+
+RECORD = os.path.join(os.path.dirname(__file__), '..', 'data_external', 'timeseries_data1.csv')
+
+
+class TestWgenPar(unittest.TestCase):
+    def setUp(self):
+        self.w = Wgen(1)
+        self.w.min_rain = 1e-9
+        self.dates = pd.date_range('1/1/1900', periods=365 * 100)
+        self.rain, self.tmax, self.tmin = self.w.generate(self.dates[0], len(self.dates), 2)
+
+    def testPrecipitation(self):
+        """The Markov chain and gamma parameters are recovered from generated rain"""
+        p = estimate_parameters(self.dates, self.rain[0], min_rain=1e-9)
+        np.testing.assert_allclose(p['pww_array'], self.w.pww_array, atol=0.05)
+        np.testing.assert_allclose(p['pwd_array'], self.w.pwd_array, atol=0.03)
+        np.testing.assert_allclose(p['alpha_array'], self.w.alpha_array, rtol=0.15)
+        np.testing.assert_allclose(p['beta_array'], self.w.beta_array, rtol=0.15)
+        self.assertNotIn('txmd', p)
+
+    def testTemperature(self):
+        """The seasonal temperature curves are recovered from generated weather"""
+        p = estimate_parameters(self.dates, self.rain[0], self.tmax[0], self.tmin[0], min_rain=1e-9)
+        for name in ['txmd', 'txmw', 'atx', 'tn', 'atn']:
+            self.assertAlmostEqual(p[name], getattr(self.w, name), delta=0.5)
+        for name in ['cvtx', 'acvtx', 'cvtn', 'acvtn']:
+            self.assertAlmostEqual(p[name], getattr(self.w, name), delta=0.02)
+
+    def testStations(self):
+        """Stations fitted together get the same parameters as one at a time"""
+        together = estimate_parameters(self.dates, self.rain.T, self.tmax.T, self.tmin.T)
+        for k in range(2):
+            alone = estimate_parameters(self.dates, self.rain[k], self.tmax[k], self.tmin[k])
+            for name in alone:
+                np.testing.assert_allclose(together[k][name], alone[name])
+
+    def testMissing(self):
+        """Missing days are left out of the counts"""
+        rain = self.rain[0].copy()
+        rain[1000:1400] = np.nan
+        p = estimate_parameters(self.dates, rain)
+        q = estimate_parameters(self.dates.delete(np.arange(1000, 1400)), np.delete(rain, np.arange(1000, 1400)))
+        np.testing.assert_allclose(p['alpha_array'], q['alpha_array'])
+        self.assertFalse(np.isnan(p['pww_array']).any())
+
+    def testSetParameters(self):
+        p = estimate_parameters(self.dates, self.rain[0], self.tmax[0], self.tmin[0])
+        w = Wgen()
+        w.set_parameters(p)
+        self.assertEqual(w.pww_array, p['pww_array'])
+        self.assertEqual(w.txmd, p['txmd'])
+        self.assertRaises(KeyError, w.set_parameters, {'lat': 40.0})
+
+    @unittest.skipUnless(os.path.exists(RECORD), 'needs data_external/timeseries_data1.csv')
+    def testRecord(self):
+        """Generated monthly rain matches the record the parameters came from"""
+        dates, rain = read_record(RECORD)
+        w = Wgen(3)
+        w.set_parameters(estimate_parameters(dates, rain))
+        generated = w.generate(dates[0], len(dates), 10)[0]
+        observed = pd.Series(rain, dates).groupby(dates.month).mean()
+        simulated = pd.DataFrame(generated.T, dates).groupby(dates.month).mean().mean(axis=1)
+        np.testing.assert_allclose(simulated, observed, rtol=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
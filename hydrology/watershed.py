@@ -1,6 +1,7 @@
 from water_manage.flow_network import Network
 from hydrology.catchment import Catchment
 from hydrology.junction import Junction
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 
@@ -39,6 +40,8 @@ class Watershed(Network):
             update(precipitation, et, outlet_node)
                 Calculates runoff from all catchments and routes it down
                 through the demand network
+            discharge_batch(batch, precip, et)
+                Same as discharge but using an AwbmBatch for the catchments
             outflow (@property)
                 This is the resulting discharge from the watershed.
             add_junction(junct_name, receiving_junction)
@@ -60,16 +63,22 @@ class Watershed(Network):
                 
             load_from_file(file_name)
                 Loads a new watershed from a file, overwriting any existing nodes
+
+            snapshot()
+                Saves the runoff state of every catchment
+
+            restore_state(state)
+                Puts every catchment back in the state from a snapshot or .npz file
     """
 
     def __init__(self):
         Network.__init__(self)
         self.catchments = {}
 
-    def link_catchment(self, name, downstream_name='sink'):
+    def link_catchment(self, name, downstream_name='sink', runoff_method='simple'):
         """Link a Catchment object with the network node"""
         self.add_catchment(name, downstream_name)
-        c = Catchment()
+        c = Catchment(runoff_method=runoff_method)
         self.catchments[name] = c
     
     def discharge(self, precip, et):
@@ -139,6 +148,64 @@ class Watershed(Network):
     #     self.network.add_node(self.source_node, type=self.source_node)
     #     self.network.add_edge(self.source_node, catchment_name)
 
+    def discharge_batch(self, batch, precip, et):
+        """Same as discharge, but every catchment is advanced by one call
+            to an AwbmBatch instead of one runoff call per catchment.
+            The catchments must use the Awbm runoff method, e.g. linked
+            with link_catchment(name, downstream_name, 'AWBM').
+
+            Parameters
+            ----------
+                batch : AwbmBatch
+                    built from this watershed using AwbmBatch.from_catchments(self.catchments)
+                precip : float
+                et : float
+        """
+        for name, flow in zip(batch.names, batch.outflow(precip, et).tolist()):
+            self.update_capacity(name, flow)
+
+        return self.outflow()
+
+    def snapshot(self, filename=None):
+        """Save the runoff state of every catchment
+
+            Parameters
+            ----------
+            filename : str, optional
+                If given, the states are also written to this .npz file
+
+            Returns
+            -------
+            state : dict
+                runoff_method.snapshot() bytes by catchment name
+        """
+        state = {name: c.runoff_method.snapshot() for name, c in self.catchments.items()}
+        if filename is not None:
+            np.savez(filename, **{name: np.frombuffer(blob, dtype='<f8') for name, blob in state.items()})
+        return state
+
+    def restore_state(self, state):
+        """Put every catchment back in the state from a snapshot
+
+            Parameters
+            ----------
+            state : dict or str
+                the dict from snapshot, or the name of the .npz file it wrote
+
+            Raises
+            ------
+            ValueError
+                if the state has no entry for one of the catchments
+        """
+        if isinstance(state, str):
+            with np.load(state) as saved:
+                state = {name: saved[name] for name in saved.files}
+        missing = [name for name in self.catchments if name not in state]
+        if missing:
+            raise ValueError("The state has no entry for the catchments " + ", ".join(missing) + ".")
+        for name, catchment in self.catchments.items():
+            catchment.runoff_method.restore_state(state[name])
+
     def delete_node(self, node_name):
         sub = nx.bfs_tree(self.network, source=node_name, reverse=True)
         for i in list(sub.nodes):
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 import math
+from scipy.signal import lfilter
 from global_attributes.aegis import Aegis
 
 class Wgen(Aegis):
@@ -25,6 +26,8 @@ class Wgen(Aegis):
             using WGEN PAR found in our GoldSim library. Run the model
             as-is and view the "WGEN_Validation" to see how the results
             compare against those presented in the WGEN documentation.
+            hydrology.wgen_validation.validate makes the same comparison
+            with the statistics of thousands of generated years.
 
             Attributes
             ----------
@@ -83,6 +86,12 @@ class Wgen(Aegis):
                 daily min calc_temperature
             tmax : float
                 daily max calc_temperature
+            occurrence : str, default 'markov'
+                How generate picks wet and dry days: 'markov' draws a number
+                for every day, 'spells' draws a number for every wet or dry
+                spell and gamma amounts for the wet days only. Both give the
+                same chain, but 'spells' needs well under half the random
+                numbers for the rain
             temp_determ : bool, default False
                 If True, calculate temperature with determined Fourier coefficients
                 instead of relying on random numbers, which is the default. This
@@ -91,15 +100,45 @@ class Wgen(Aegis):
                 be deterministic. A markov_deterministic = 0.177 and
                 rain_deterministic = 0.25 are used.
 
+            rng : np.random.Generator
+                Source of the random numbers
+
             Methods
             -------
             precipitation(date)
             calc_temperature(date)
+            generate(start_date, n_days, n_realizations, streams)
+            generate_chunks(start_date, n_days, n_realizations, chunk_days, streams)
+            set_parameters(parameters)
+            temperature_tables()
             tavg
     	"""
-
-    def __init__(self):
+    # Lag-1 (A) and lag-0 (B) coefficient matrices of the temperature residual process
+    TEMP_A = np.array([[0.567, 0.086, -0.002],
+                       [0.253, 0.504, -0.05],
+                       [-0.006, -0.039, 0.244]])
+    TEMP_B = np.array([[0.781, 0.000, 0.000],
+                       [0.328, 0.637, 0.00],
+                       [0.238, -0.341, 0.873]])
+    TEMPERATURE_TABLES = ['txm', 'txs', 'txm1', 'txs1', 'tnm', 'tns']
+    PARAMETERS = ['pww_array', 'pwd_array', 'alpha_array', 'beta_array', 'min_rain',
+                  'txmd', 'txmw', 'atx', 'cvtx', 'acvtx', 'tn', 'atn', 'cvtn', 'acvtn', 'dt_day']
+    BLOCK_SIZE = 2 ** 20    # Realization days generated together by generate
+    STREAM_BLOCK_DAYS = 366     # Days generated together by generate with one stream per realization
+    # Values used in place of random numbers when temp_determ is True
+    X_DETERM = np.array([-0.3513, -1.754, 0.6244])
+    E_DETERM = np.array([math.sqrt(-2.0 * math.log(rn1)) * math.cos(6.283185 * rn2)
+                         for rn1, rn2 in zip([0.25, 0.5, 0.75], [0.75, 0.5, 0.25])])
+
+    def __init__(self, rng=None):
+        """
+        Parameters
+        ----------
+        rng : np.random.Generator, SeedSequence or int, optional
+            the random number generator, or a seed for a new one
+        """
         Aegis.__init__(self)
+        self.rng = np.random.default_rng(rng)
         self.lat = 40.76
 
         self.pww_array = [0.4113, 0.4026, 0.4585, 0.4826,
@@ -135,6 +174,9 @@ class Wgen(Aegis):
 
         self.temp_determ = False
         self.x = [0] * 3
+        self.occurrence = 'markov'
+        self._temperature_key = None
+        self._temperature_tables = None
 
         self.tmin = 0.0
         self.tmax = 0.0
@@ -143,6 +185,211 @@ class Wgen(Aegis):
         self.precipitation(date)
         self.calc_temperature(date)
 
+    def generate(self, start_date='1/1/2019', n_days=365, n_realizations=1, streams=None):
+        """Generate many realizations of daily weather at once
+
+            Every realization starts from the current wet state and
+            temperature residuals of this object, which are left unchanged.
+            All of the random numbers are drawn in a few large arrays and
+            each day advances the Markov chain and the temperature
+            residuals of every realization together.
+
+            The random numbers come from rng, unless streams are given.
+            Then realization k draws only from streams[k], in blocks of
+            STREAM_BLOCK_DAYS days, so its trace does not depend on which
+            other realizations are generated with it or where.
+
+            Parameters
+            ----------
+            start_date : Timestamp or str
+                the first day generated
+            n_days : int
+            n_realizations : int
+            streams : list(np.random.Generator), optional
+                one generator per realization, e.g. from realization_streams
+
+            Returns
+            -------
+            rain : array[float]
+                daily rain (in), shaped realization x day
+            tmax : array[float]
+                daily max temperature (Fdeg), shaped realization x day
+            tmin : array[float]
+                daily min temperature (Fdeg), shaped realization x day
+        """
+        rain = np.empty((n_realizations, n_days))
+        tmax = np.empty((n_realizations, n_days))
+        tmin = np.empty((n_realizations, n_days))
+        first = 0
+        for block in self._blocks(start_date, n_days, n_realizations, streams):
+            days = slice(first, first + block[0].shape[1])
+            rain[:, days], tmax[:, days], tmin[:, days] = block
+            first = days.stop
+        return rain, tmax, tmin
+
+    def generate_chunks(self, start_date='1/1/2019', n_days=365, n_realizations=1, chunk_days=365, streams=None):
+        """Generate many realizations of daily weather, a chunk of days at a time
+
+            The same weather as generate, from the same random numbers, but
+            handed out chunk_days at a time so that only a chunk (and the
+            block of days being generated) is held in memory. The wet state
+            and temperature residuals of every realization carry on from
+            one chunk to the next, so joining the chunks gives exactly the
+            arrays generate would return.
+
+            Parameters
+            ----------
+            start_date : Timestamp or str
+                the first day generated
+            n_days : int
+            n_realizations : int
+            chunk_days : int
+                days in each chunk; the last chunk may be shorter
+            streams : list(np.random.Generator), optional
+                one generator per realization, as for generate
+
+            Yields
+            ------
+            rain, tmax, tmin : array[float]
+                as for generate, shaped realization x chunk_days. Chunk i
+                starts on day i * chunk_days.
+        """
+        if chunk_days < 1:
+            raise ValueError("chunk_days must be at least 1.")
+        pending = []
+        held = 0
+        for block in self._blocks(start_date, n_days, n_realizations, streams):
+            pending.append(block)
+            held += block[0].shape[1]
+            while held >= chunk_days:
+                yield _take_days(pending, chunk_days)
+                held -= chunk_days
+        if held:
+            yield _take_days(pending, held)
+
+    def _blocks(self, start_date, n_days, n_realizations, streams=None):
+        """Rain, tmax and tmin for each block of days, carrying wet and x between blocks"""
+        if streams is not None and len(streams) != n_realizations:
+            raise ValueError("There should be one stream for each of the " + str(n_realizations) + " realizations.")
+        dates = pd.date_range(start=pd.Timestamp(start_date), periods=n_days)
+        wet = np.full(n_realizations, self.wet)
+        x = np.tile(np.asarray(self.x, dtype=float)[:, np.newaxis], (1, n_realizations))
+        # Work through blocks of days so the random numbers for a block stay small
+        if streams is None:
+            block = max(1, self.BLOCK_SIZE // n_realizations)
+        else:
+            block = self.STREAM_BLOCK_DAYS
+        for first in range(0, n_days, block):
+            rain, tmax, tmin, wet, x = self._generate(dates[first:first + block], wet, x, streams)
+            yield rain, tmax, tmin
+
+    def _generate(self, dates, wet, x, streams=None):
+        """Generate weather for the given dates starting from wet and x
+
+            Returns rain, tmax and tmin shaped realization x day, followed
+            by the wet state and temperature residuals after the last day.
+            The arrays are worked on day by realization, so that each day
+            of the Markov chain and the residual process is contiguous.
+        """
+        size = (len(dates), len(wet))
+        month = dates.month.values - 1
+        pww = np.asarray(self.pww_array)[month]
+        pwd = np.asarray(self.pwd_array)[month]
+        if self.occurrence == 'spells' and not self.markov_deterministic:
+            # One draw per wet or dry spell, then gamma amounts for the wet days only
+            wet_days, wet = _spell_occurrence(month, wet, pww, pwd, self._uniform_source(streams))
+            rain_raw = self._wet_amounts(month, wet_days, streams)
+            e = self._normals(size, streams)
+        elif self.occurrence in ('markov', 'spells'):
+            rn, rain_raw, e = self._draws(month, size[1], streams)
+            if self.markov_deterministic:
+                rn = np.full(size, 0.177)
+            # Advance the Markov chain of every realization one day at a time
+            wet_days = np.empty(size, dtype=bool)
+            for day in range(size[0]):
+                wet = rn[day] <= np.where(wet, pww[day], pwd[day])
+                wet_days[day] = wet
+        else:
+            raise ValueError("occurrence should be 'markov' or 'spells'.")
+        if self.rain_deterministic:
+            rain_raw = np.full(size, 0.25)
+        rain = np.where(wet_days & (rain_raw >= self.min_rain), rain_raw, 0.0)
+        rain_today = rain >= self.min_rain
+
+        # Temperature residuals: x(t) = A x(t-1) + B e(t)
+        if self.temp_determ:
+            x = np.broadcast_to((self.TEMP_A @ self.X_DETERM + self.TEMP_B @ self.E_DETERM)[:, np.newaxis], (3, size[1]))
+            residuals = np.broadcast_to(x[:, np.newaxis], (3,) + size)
+        else:
+            residuals = self.residual_series(e, x)
+            x = residuals[:, -1]
+
+        # Seasonal means and standard deviations for each day
+        tables = self.temperature_tables()
+        day = dates.dayofyear.values - 1
+        txm, txs, txm1, txs1, tnm, tns = [tables[name][day, np.newaxis] for name in self.TEMPERATURE_TABLES]
+
+        tmax1 = residuals[0] * np.where(rain_today, txs1, txs) + np.where(rain_today, txm1, txm)
+        tmin1 = residuals[1] * tns + tnm
+        tmax = np.maximum(tmax1, tmin1)
+        tmin = np.minimum(tmax1, tmin1)
+        return rain.T, tmax.T, tmin.T, wet, x
+
+    def _draws(self, month, n, streams=None):
+        """Uniform, gamma and truncated normal numbers for n realizations
+
+            Returns arrays shaped day x realization (3 x day x realization
+            for the normals)
+            for the days of the given months. With streams, realization k
+            takes all of its numbers from streams[k].
+        """
+        alpha = np.asarray(self.alpha_array)[month]
+        beta = np.asarray(self.beta_array)[month]
+        days = len(month)
+        if streams is None:
+            rn = self.rng.uniform(size=(days, n))
+            rain_raw = self.rng.gamma(alpha[:, np.newaxis], beta[:, np.newaxis], (days, n))
+            e = _truncated_normal(self.rng, (3, days, n))
+            return rn, rain_raw, e
+
+        rn = np.empty((days, n))
+        rain_raw = np.empty((days, n))
+        e = np.empty((3, days, n))
+        for k, rng in enumerate(streams):
+            rn[:, k] = rng.uniform(size=days)
+            rain_raw[:, k] = rng.gamma(alpha, beta)
+            e[:, :, k] = _truncated_normal(rng, (3, days))
+        return rn, rain_raw, e
+
+    def _uniform_source(self, streams=None):
+        """A function giving count uniform numbers for each realization in rows"""
+        if streams is None:
+            return lambda rows, count: self.rng.uniform(size=(len(rows), count))
+        return lambda rows, count: np.array([streams[k].uniform(size=count) for k in rows]).reshape(len(rows), count)
+
+    def _wet_amounts(self, month, wet_days, streams=None):
+        """Gamma rain amounts drawn for the wet days only, zero on dry days"""
+        alpha = np.asarray(self.alpha_array)[month]
+        beta = np.asarray(self.beta_array)[month]
+        rain_raw = np.zeros(wet_days.shape)
+        if streams is None:
+            day, k = np.nonzero(wet_days)
+            rain_raw[day, k] = self.rng.gamma(alpha[day], beta[day])
+        else:
+            for k, rng in enumerate(streams):
+                day = np.flatnonzero(wet_days[:, k])
+                rain_raw[day, k] = rng.gamma(alpha[day], beta[day])
+        return rain_raw
+
+    def _normals(self, size, streams=None):
+        """Truncated normal numbers shaped 3 x day x realization"""
+        if streams is None:
+            return _truncated_normal(self.rng, (3,) + size)
+        e = np.empty((3,) + size)
+        for k, rng in enumerate(streams):
+            e[:, :, k] = _truncated_normal(rng, (3, size[0]))
+        return e
+
     def precipitation(self, date=pd.Timestamp('1/1/2019')):
         """Generate daily precipitation depths from monthly data
 
@@ -172,7 +419,7 @@ class Wgen(Aegis):
         if self.rain_deterministic:
             rain_gamma = 0.25
         else:
-            rain_gamma = np.random.gamma(alpha, beta)
+            rain_gamma = self.rng.gamma(alpha, beta)
 
         # Rain correction factor
         # TODO: implemennt correction factors in precip as function of "pw"
@@ -189,7 +436,7 @@ class Wgen(Aegis):
         if self.markov_deterministic:
             rn = 0.177
         else:
-            rn = np.random.uniform()
+            rn = self.rng.uniform()
 
         # Determine wet or dry day using Markov Chain model
         if self.wet:
@@ -229,33 +476,20 @@ class Wgen(Aegis):
                 date = Timestamp
         """
 
-        dayofyear = date.dayofyear
+        day = date.dayofyear - 1
         """Calculate a one harmonic series"""
         self.x = self.harmonic()
 
-        """Calculate calc_temperature factors tns and tnm"""
-        d1 = self.txmd - self.txmw
-        dt = math.cos(0.0172 * (dayofyear - self.dt_day))
-        txm = self.txmd + self.atx * dt
-        xcr1 = 0.06
-        if self.cvtx + self.acvtx * dt >= 0.0:
-            xcr1 = self.cvtx + self.acvtx * dt
-
-        txs = txm * xcr1
-        txm1 = txm - d1
-        txs1 = txm1 * xcr1
-        txxs = txs
-        txxm = txm
+        """Look up calc_temperature factors for the day of the year"""
+        tables = self.temperature_tables()
         if self.rain_today:
-            txxs = txs1
-            txxm = txm1
-
-        tnm = self.tn + self.atn * dt
-        xcr2 = 0.06
-        if self.cvtn + self.acvtn * dt >= 0.0:
-            xcr2 = self.cvtn + self.acvtn * dt
-
-        tns = tnm * xcr2
+            txxs = tables['txs1'][day]
+            txxm = tables['txm1'][day]
+        else:
+            txxs = tables['txs'][day]
+            txxm = tables['txm'][day]
+        tnm = tables['tnm'][day]
+        tns = tables['tns'][day]
 
         """Generate calc_temperature min/max depths"""
         tmax1 = self.x[0] * txxs + txxm
@@ -267,50 +501,241 @@ class Wgen(Aegis):
         self.tmax = max(tmax1, tmin1) + cf_max
         self.tmin = min(tmax1, tmin1) + cf_min
 
+    def set_parameters(self, parameters):
+        """Set the station parameters, such as those from wgenpar.estimate_parameters
+
+            Parameters
+            ----------
+            parameters : dict
+                values by name, for any of PARAMETERS
+
+            Raises
+            ------
+            KeyError
+                if a name is not one of PARAMETERS
+        """
+        for name, value in parameters.items():
+            if name not in self.PARAMETERS:
+                raise KeyError(name + " is not a Wgen parameter.")
+            setattr(self, name, list(value) if name.endswith('_array') else value)
+
+    def temperature_tables(self):
+        """Seasonal temperature means and standard deviations for each day of the year
+
+            Like the TXM, TXS, TXM1, TXS1, TNM and TNS arrays of the
+            Fortran WGEN, these only depend on the temperature parameters,
+            so they are worked out for all 366 days at once and kept until
+            one of the parameters changes.
+
+            Returns
+            -------
+            tables : dict
+                366 values for each of TEMPERATURE_TABLES, indexed by day
+                of the year - 1
+        """
+        key = (self.txmd, self.txmw, self.atx, self.cvtx, self.acvtx,
+               self.tn, self.atn, self.cvtn, self.acvtn, self.dt_day)
+        if key != self._temperature_key:
+            dt = np.cos(0.0172 * (np.arange(1, 367) - self.dt_day))
+            txm = self.txmd + self.atx * dt
+            xcr1 = np.where(self.cvtx + self.acvtx * dt >= 0.0, self.cvtx + self.acvtx * dt, 0.06)
+            txm1 = txm - (self.txmd - self.txmw)
+            tnm = self.tn + self.atn * dt
+            xcr2 = np.where(self.cvtn + self.acvtn * dt >= 0.0, self.cvtn + self.acvtn * dt, 0.06)
+            self._temperature_key = key
+            self._temperature_tables = {'txm': txm, 'txs': txm * xcr1,
+                                        'txm1': txm1, 'txs1': txm1 * xcr1,
+                                        'tnm': tnm, 'tns': tnm * xcr2}
+        return self._temperature_tables
+
     @property
     def tavg(self):
         return (self.tmax + self.tmin) / 2.0
 
     def fourier(self):
-        """Fourier routine"""
-        deterministic = self.temp_determ
-        v = 0.0
-        e = np.zeros(3)
-        rn1_determ = [0.25, 0.5, 0.75]
-        rn2_determ = [0.75, 0.5, 0.25]
-        for i in range(0, 3):
-            j = 0
-            out_bounds = True
-            while out_bounds:
-                rn1 = (rn1_determ[i] if deterministic else np.random.uniform())
-                rn2 = (rn2_determ[i] if deterministic else np.random.uniform())
-                v = min(math.sqrt(-2.0 * math.log(rn1)) * math.cos(6.283185 * rn2), 2.6)
-                out_bounds = abs(v) > 2.5 and j < 100
-                j += 1
-            e[i] += v
-        return e
-        
+        """Three standard normal numbers truncated at +-2.5"""
+        if self.temp_determ:
+            return self.E_DETERM.copy()
+        return _truncated_normal(self.rng, 3)
+
     def harmonic(self):
-        """Calculate a one harmonic series"""
+        """Calculate a one harmonic series, x(t) = A x(t-1) + B e(t)"""
         e = self.fourier()
-        if self.temp_determ:
-            self.x = [-0.3513, -1.754, 0.6244]
+        x = (self.X_DETERM if self.temp_determ else np.asarray(self.x, dtype=float))
+        return self.TEMP_A @ x + self.TEMP_B @ e
+
+    def residual_series(self, e, x):
+        """Temperature residuals for a whole series of normal numbers
+
+            Rather than stepping x(t) = A x(t-1) + B e(t) one day at a
+            time, A is diagonalized so the recursion splits into three
+            first order filters, each run over every day and realization
+            with one lfilter call.
+
+            Parameters
+            ----------
+            e : array[float]
+                truncated normal numbers, shaped 3 x day x realization
+            x : array[float]
+                residuals on the day before the first, shaped 3 x realization
+
+            Returns
+            -------
+            residuals : array[float]
+                shaped 3 x day x realization
+        """
+        lam, v = np.linalg.eig(self.TEMP_A)
+        v_inv = np.linalg.inv(v)
+        u = _product(v_inv @ self.TEMP_B, e)
+        z0 = _product(v_inv, np.asarray(x, dtype=float))
+        z = [lfilter([1.0], [1.0, -lam[i]], u[i], axis=0, zi=lam[i] * z0[i][np.newaxis])[0] for i in range(3)]
+        return np.real(_product(v, z))
+
+
+def realization_streams(seed, realizations):
+    """Independent random number generators for the given realizations
+
+        Realization k always gets the generator spawned as child k of
+        SeedSequence(seed), the same as SeedSequence(seed).spawn(n)[k], so
+        any process can make the streams for its own share of the
+        realizations.
+
+        Parameters
+        ----------
+        seed : int or SeedSequence
+        realizations : iterable(int)
+            realization numbers, e.g. range(700, 800)
+
+        Returns
+        -------
+        streams : list(np.random.Generator)
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [np.random.default_rng(np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (k,),
+                                                         pool_size=root.pool_size))
+            for k in realizations]
+
+
+def _spell_occurrence(month, wet, pww, pwd, uniforms):
+    """Wet or dry days built from whole spells instead of one draw per day
+
+        Staying wet from one day to the next has probability pww and
+        staying dry 1 - pwd, so the number of further days a spell lasts
+        is geometric and is drawn from one uniform number. Spells are cut
+        at the end of each month and drawn again with the next month's
+        probabilities, which gives the same chain as the daily Markov
+        model because the geometric distribution has no memory.
+
+        Each month of every realization first gets the number of spells
+        it is expected to need, all drawn in one call. The realizations
+        those do not cover draw a few more spells at a time until they
+        are, so little more than one number is drawn per spell. The days are filled in by marking where each spell starts
+        and taking a running xor down every realization.
+
+        Parameters
+        ----------
+        month : array[int]
+            0 based month of each day
+        wet : array[bool]
+            wet state of each realization on the day before the first day
+        pww, pwd : array[float]
+            probabilities for each day
+        uniforms : function
+            uniforms(rows, count) gives count uniform numbers for each of
+            the realizations in rows
+
+        Returns
+        -------
+        wet_days : array[bool]
+            shaped day x realization
+        wet : array[bool]
+            wet state of each realization on the last day
+    """
+    n_days = len(month)
+    count = len(wet)
+    first = np.flatnonzero(np.append(True, month[1:] != month[:-1]))
+    length = np.diff(np.append(first, n_days))
+    stay = np.stack([1.0 - pwd[first], pww[first]])
+    with np.errstate(divide='ignore'):
+        # Log of the chance of staying dry (row 0) or wet (row 1), kept below 0 so a sure stay gives inf
+        log_stay = np.minimum(np.log(stay), -np.finfo(float).tiny)
+        # Spells needed to cover each month, on average, and the numbers drawn up front and then at a time
+        expected = 2.0 * length * (1.0 - stay[0]) * (1.0 - stay[1]) / (2.0 - stay[0] - stay[1]) + 1.0
+    expected = np.where(np.isfinite(expected), expected, 1.0)
+    drawn = np.ceil(expected).astype(int)
+    extra = np.ceil(np.sqrt(expected)).astype(int)
+
+    # flips[day, k] is set where realization k changes state from the day before
+    flips = np.zeros((n_days, count), dtype=bool)
+    log_u = np.split(np.log(uniforms(np.arange(count), drawn.sum())), np.cumsum(drawn)[:-1], axis=1)
+    state = np.array(wet, dtype=bool)
+    for i in range(len(first)):
+        rows = np.arange(count)
+        log_u_month = log_u[i]
+        done = np.zeros(count)
+        changes = np.zeros(count, dtype=int)
+        spell = 0
+        while rows.size:
+            # Spell j of the month has the state of the day before the month if j is even
+            index = np.arange(spell, spell + log_u_month.shape[1])
+            spell_wet = state[rows, np.newaxis] != (index % 2 == 1)
+            with np.errstate(invalid='ignore'):
+                stays = np.floor(log_u_month / np.where(spell_wet, log_stay[1, i], log_stay[0, i]))
+            lengths = np.fmin(stays, length[i])
+            ends = done[rows, np.newaxis] + np.cumsum(lengths + (index > 0), axis=1)
+            r, j = np.nonzero(ends < length[i])
+            flips[first[i] + ends[r, j].astype(int), rows[r]] = True
+            changes[rows] += np.count_nonzero(ends < length[i], axis=1)
+            done[rows] = ends[:, -1]
+            rows = rows[ends[:, -1] < length[i]]
+            spell += log_u_month.shape[1]
+            if rows.size:
+                log_u_month = np.log(uniforms(rows, extra[i]))
+        state = state != (changes % 2 == 1)
+    wet_days = np.logical_xor.accumulate(flips, axis=0) != np.asarray(wet, dtype=bool)
+    return wet_days, state
+
+
+def _take_days(pending, days):
+    """Join the first days of the (rain, tmax, tmin) blocks in pending, leaving the rest"""
+    pieces = []
+    while days:
+        block = pending[0]
+        count = min(days, block[0].shape[1])
+        pieces.append([a[:, :count] for a in block])
+        if count == block[0].shape[1]:
+            pending.pop(0)
         else:
-            self.x = [0] * 3
-        x = self.x
-        a = np.array([[0.567, 0.086, -0.002],
-                      [0.253, 0.504, -0.05],
-                      [-0.006, -0.039, 0.244]])
-    
-        b = np.array([[0.781, 0.000, 0.000],
-                      [0.328, 0.637, 0.00],
-                      [0.238, -0.341, 0.873]])
-    
-        r = np.zeros(3)
-        rr = np.zeros(3)
-    
-        for i in range(0, 3):
-            for j in range(0, 3):
-                r[i] += b[i, j] * e[j]
-                rr[i] += a[i, j] * x[j]
-        return r + rr
\ No newline at end of file
+            pending[0] = tuple(a[:, count:] for a in block)
+        days -= count
+    if len(pieces) == 1:
+        return tuple(a.copy() for a in pieces[0])
+    return tuple(np.concatenate([p[i] for p in pieces], axis=1) for i in range(3))
+
+
+def _product(matrix, v):
+    """matrix @ v, where v holds one array for each of its components
+
+        Worked out term by term rather than with matmul, so each
+        realization gets exactly the same numbers however many
+        realizations are in v.
+    """
+    return np.array([sum(matrix[i, j] * v[j] for j in range(len(v)) if matrix[i, j] != 0.0)
+                     for i in range(matrix.shape[0])])
+
+
+def _truncated_normal(rng, size, bound=2.5):
+    """Standard normal numbers truncated at +-bound
+
+        A few more numbers than needed are drawn in one block, those
+        beyond the bound are dropped and the first ones left are kept.
+        Another block is only drawn in the rare case that too few are left.
+    """
+    size = tuple(np.atleast_1d(size))
+    count = int(np.prod(size))
+    inside = math.erf(bound / math.sqrt(2.0))
+    e = np.empty(0)
+    while e.size < count:
+        block = rng.standard_normal(int((count - e.size) / inside * 1.002) + 16)
+        e = np.concatenate((e, block[np.abs(block) <= bound]))
+    return e[:count].reshape(size)
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import time
+import numpy as np
+import pandas as pd
+from hydrology.wgen import realization_streams
+
+
+class WgenCache:
+    """A class used to keep generated Wgen weather in .npy files on disk
+
+        Each run is stored in its own file, named from two hashes. The
+        first hash covers the station parameters and starting state of
+        the Wgen object. The second covers the seed, the dates and the
+        number of realizations. The same request made again, by this or
+        any other process sharing the directory, opens the file as a
+        read-only memory map instead of generating the weather again.
+
+        Runs are generated with realization_streams(seed, ...), so the
+        stored weather depends only on what is in the key and not on the
+        state of the Wgen object's own rng.
+
+        The files are kept under max_bytes in total by deleting the least
+        recently used ones, with the file modification time recording
+        the last use. A request is written to a temporary file first and
+        renamed when it is complete. Temporary files are removed if the
+        generation fails, and any older than STALE_SECONDS, left by a
+        process that died part way through, are removed on eviction.
+
+        Attributes
+        ----------
+        directory : str
+            where the .npy files are kept
+        max_bytes : int
+            largest total size of the files
+
+        Methods
+        -------
+        parameter_key(wgen)
+            hash of the station parameters and starting state
+        run_key(seed, start_date, n_days, n_realizations)
+            hash of the rest of a request
+        generate(wgen, seed, start_date, n_days, n_realizations)
+            the weather for a request, from the cache if it is there
+        invalidate(wgen)
+            delete the runs made with some parameters, or every run
+        size()
+            total size of the files
+    """
+    SUFFIX = '.npy'
+    TEMPORARY_SUFFIX = '.tmp'
+    STALE_SECONDS = 24 * 3600
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def parameter_key(wgen):
+        """Hash of everything in a Wgen object that changes the weather it generates"""
+        h = hashlib.sha256()
+        for name in wgen.PARAMETERS + ['occurrence', 'wet', 'x', 'markov_deterministic',
+                                       'rain_deterministic', 'temp_determ']:
+            h.update(name.encode())
+            value = getattr(wgen, name)
+            h.update(value.encode() if isinstance(value, str) else np.asarray(value, dtype=float).tobytes())
+        return h.hexdigest()[:24]
+
+    @staticmethod
+    def run_key(seed, start_date, n_days, n_realizations):
+        """Hash of the seed, dates and number of realizations of a request"""
+        text = repr((int(seed), str(pd.Timestamp(start_date)), int(n_days), int(n_realizations)))
+        return hashlib.sha256(text.encode()).hexdigest()[:24]
+
+    def path(self, wgen, seed, start_date, n_days, n_realizations):
+        """The file holding a request"""
+        name = self.parameter_key(wgen) + '_' + self.run_key(seed, start_date, n_days, n_realizations)
+        return os.path.join(self.directory, name + self.SUFFIX)
+
+    def generate(self, wgen, seed, start_date='1/1/2019', n_days=365, n_realizations=1):
+        """Generated weather for a request, from the cache if it is there
+
+            Parameters
+            ----------
+            wgen : Wgen
+                supplies the parameters and starting state
+            seed : int
+                realization k uses realization_streams(seed, [k])
+            start_date : Timestamp or str
+            n_days : int
+            n_realizations : int
+
+            Returns
+            -------
+            rain, tmax, tmin : array[float]
+                as for Wgen.generate, as read-only views of the memory
+                mapped file
+        """
+        path = self.path(wgen, seed, start_date, n_days, n_realizations)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            self._store(path, wgen, seed, start_date, n_days, n_realizations)
+            self._evict(keep=path)
+        weather = np.load(path, mmap_mode='r')
+        return weather[0], weather[1], weather[2]
+
+    def _store(self, path, wgen, seed, start_date, n_days, n_realizations):
+        """Generate a request straight into a new file, a chunk at a time"""
+        temporary = path + '.' + str(os.getpid()) + self.TEMPORARY_SUFFIX
+        weather = None
+        try:
+            weather = np.lib.format.open_memmap(temporary, mode='w+', dtype=float, shape=(3, n_realizations, n_days))
+            streams = realization_streams(seed, range(n_realizations))
+            first = 0
+            for chunk in wgen.generate_chunks(start_date, n_days, n_realizations, wgen.STREAM_BLOCK_DAYS, streams):
+                days = slice(first, first + chunk[0].shape[1])
+                for i in range(3):
+                    weather[i, :, days] = chunk[i]
+                first = days.stop
+            weather.flush()
+            weather = None
+            os.replace(temporary, path)
+        except BaseException:
+            # Unmap before removing, which Windows needs
+            weather = None
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def _files(self):
+        """The cached files, least recently used first"""
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(self.SUFFIX)]
+        return sorted(paths, key=os.path.getmtime)
+
+    def _remove_stale(self):
+        """Delete temporary files older than STALE_SECONDS"""
+        oldest = time.time() - self.STALE_SECONDS
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.TEMPORARY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+            except OSError:
+                # Already removed, or still mapped by another process (Windows)
+                continue
+
+    def _evict(self, keep=None):
+        """Delete stale temporary files, then the least recently used files
+            until the total is under max_bytes"""
+        self._remove_stale()
+        files = self._files()
+        total = sum(os.path.getsize(path) for path in files)
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            size = os.path.getsize(path)
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped by another process (Windows), try again next time
+                continue
+            total -= size
+
+    def invalidate(self, wgen=None):
+        """Delete the runs made with some parameters, or every run
+
+            Runs are never returned for parameters other than their own,
+            so this only frees the space early. Call it before changing
+            the parameters of wgen, or give the parameter_key saved then.
+
+            Parameters
+            ----------
+            wgen : Wgen or str, optional
+                a Wgen object or a parameter_key. Every run is deleted if
+                it is None.
+
+            Returns
+            -------
+            count : int
+                number of files deleted
+        """
+        if wgen is None:
+            prefix = ''
+        else:
+            prefix = (wgen if isinstance(wgen, str) else self.parameter_key(wgen)) + '_'
+        count = 0
+        for path in self._files():
+            if os.path.basename(path).startswith(prefix):
+                os.remove(path)
+                count += 1
+        return count
+
+    def size(self):
+        """Total size of the cached files in bytes"""
+        return sum(os.path.getsize(path) for path in self._files())
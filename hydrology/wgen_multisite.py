@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+from scipy.special import gammainccinv, ndtr
+from hydrology.wgen import Wgen, _truncated_normal
+
+
+class MultiSiteWgen:
+    """A class used to generate weather at many stations with spatial correlation
+
+        Follows Wilks (1998): each station keeps its own Wgen parameters,
+        but the random numbers driving the stations on a day are taken
+        from standard normals that are correlated between stations.
+        Wet or dry days come from a correlated normal w, the station is
+        wet if Phi(w) is below its pww or pwd. Rain amounts come from a
+        second correlated normal put through the gamma quantile function
+        of the station. The three temperature residual normals are
+        correlated between stations in the same way. Each set of normals
+        is made by multiplying independent ones by the Cholesky factor of
+        its correlation matrix, worked out once. For the temperatures the
+        independent normals are first truncated at +-2.5 as in Wgen, by
+        drawing a few extra and rejecting those beyond the bound, so each
+        station's residual normals have the variance Wgen's have.
+
+        The correlation matrices are for the underlying normals. The
+        correlations of the wet/dry days and amounts they give are
+        smaller, so Wilks finds the normal correlations by trial from the
+        observed ones.
+
+        Every station and realization is advanced together, and generate
+        returns arrays shaped realization x station x day.
+
+        Attributes
+        ----------
+        stations : list(Wgen)
+            supply the parameters, starting wet state and temperature
+            residuals of each station
+        occurrence_factor, amount_factor, temperature_factor : array[float]
+            Cholesky factors of the station x station correlation matrices
+        rng : np.random.Generator
+            Source of the random numbers
+
+        Methods
+        -------
+        generate(start_date, n_days, n_realizations)
+            daily weather for every station
+    """
+    BLOCK_SIZE = 2 ** 20    # Realization station days generated together
+    TRUNCATE = 2.5          # Bound on the temperature normals, as in Wgen
+    QUANTILE_GRID = np.linspace(-6.0, 7.0, 1024)    # Normals where the gamma quantiles are tabulated
+
+    def __init__(self, stations, occurrence_correlation, amount_correlation=None, temperature_correlation=None,
+                 rng=None):
+        """
+            Parameters
+            ----------
+            stations : list(Wgen)
+            occurrence_correlation : array[float]
+                correlation matrix of the normals for wet or dry days,
+                station x station
+            amount_correlation : array[float], optional
+                for the rain amounts, defaults to occurrence_correlation
+            temperature_correlation : array[float], optional
+                for the temperature residuals, defaults to
+                occurrence_correlation
+            rng : np.random.Generator, SeedSequence or int, optional
+
+            Raises
+            ------
+            ValueError
+                if a matrix is not station x station
+            LinAlgError
+                if a matrix is not positive definite
+        """
+        self.stations = list(stations)
+        self.rng = np.random.default_rng(rng)
+        amount_correlation = occurrence_correlation if amount_correlation is None else amount_correlation
+        temperature_correlation = occurrence_correlation if temperature_correlation is None else temperature_correlation
+        self.occurrence_factor = self._factor(occurrence_correlation)
+        self.amount_factor = self._factor(amount_correlation)
+        self.temperature_factor = self._factor(temperature_correlation)
+        self._quantile_key = None
+        self._quantiles = None
+
+    def _factor(self, correlation):
+        correlation = np.asarray(correlation, dtype=float)
+        n = len(self.stations)
+        if correlation.shape != (n, n):
+            raise ValueError("The correlation matrices should be " + str(n) + " x " + str(n) + ".")
+        return np.linalg.cholesky(correlation)
+
+    def _parameter(self, name):
+        """A station parameter for every station, shaped ... x station"""
+        return np.stack([np.asarray(getattr(w, name), dtype=float) for w in self.stations], axis=-1)
+
+    def quantile_tables(self):
+        """Gamma rain amounts at each of QUANTILE_GRID, by month and station
+
+            Amounts for the normals drawn each day are interpolated from
+            these tables, which is much quicker than working out the gamma
+            quantile function for every wet day. They are kept until the
+            gamma parameters of a station change.
+
+            Returns
+            -------
+            quantiles : array[float]
+                shaped month x station x grid
+        """
+        alpha = self._parameter('alpha_array')
+        beta = self._parameter('beta_array')
+        key = (alpha.tobytes(), beta.tobytes())
+        if key != self._quantile_key:
+            upper = ndtr(-self.QUANTILE_GRID)
+            self._quantiles = gammainccinv(alpha[..., np.newaxis], upper) * beta[..., np.newaxis]
+            self._quantile_key = key
+        return self._quantiles
+
+    def generate(self, start_date='1/1/2019', n_days=365, n_realizations=1):
+        """Generate many realizations of daily weather at every station
+
+            Every realization starts from the wet state and temperature
+            residuals of each station's Wgen object, which are left
+            unchanged.
+
+            Parameters
+            ----------
+            start_date : Timestamp or str
+                the first day generated
+            n_days : int
+            n_realizations : int
+
+            Returns
+            -------
+            rain : array[float]
+                daily rain (in), shaped realization x station x day
+            tmax : array[float]
+                daily max temperature (Fdeg), shaped realization x station x day
+            tmin : array[float]
+                daily min temperature (Fdeg), shaped realization x station x day
+        """
+        n = len(self.stations)
+        dates = pd.date_range(start=pd.Timestamp(start_date), periods=n_days)
+        wet = np.tile(np.array([w.wet for w in self.stations], dtype=bool), (n_realizations, 1))
+        x = np.tile(self._parameter('x')[:, np.newaxis, :], (1, n_realizations, 1))
+        rain = np.empty((n_realizations, n, n_days))
+        tmax = np.empty((n_realizations, n, n_days))
+        tmin = np.empty((n_realizations, n, n_days))
+        block = max(1, self.BLOCK_SIZE // (n_realizations * n))
+        for first in range(0, n_days, block):
+            days = slice(first, first + block)
+            rain[..., days], tmax[..., days], tmin[..., days], wet, x = self._generate(dates[days], wet, x)
+        return rain, tmax, tmin
+
+    def _generate(self, dates, wet, x):
+        """Generate weather for the given dates starting from wet and x
+
+            wet is shaped realization x station and x is shaped 3 x
+            realization x station. Returns rain, tmax and tmin shaped
+            realization x station x day, followed by wet and x after the
+            last day. The working arrays are shaped day x realization x
+            station, so each day's values are one contiguous block.
+        """
+        size = (len(dates),) + wet.shape
+        month = dates.month.values - 1
+        pww = self._parameter('pww_array')[month, np.newaxis]
+        pwd = self._parameter('pwd_array')[month, np.newaxis]
+        min_rain = self._parameter('min_rain')
+
+        # Wet or dry days from correlated uniforms, one day at a time for every realization and station
+        rn = ndtr(self._correlated(self.occurrence_factor, size))
+        wet_days = np.empty(size, dtype=bool)
+        for day in range(size[0]):
+            wet = rn[day] <= np.where(wet, pww[day], pwd[day])
+            wet_days[day] = wet
+
+        # Gamma amounts from correlated normals, interpolated in the quantile tables
+        z = np.clip(self._correlated(self.amount_factor, size), self.QUANTILE_GRID[0], self.QUANTILE_GRID[-1])
+        rain = np.zeros(size)
+        day, k, station = np.nonzero(wet_days)
+        grid = self.QUANTILE_GRID
+        position = (z[day, k, station] - grid[0]) / (grid[1] - grid[0])
+        i = np.minimum(position.astype(int), len(grid) - 2)
+        fraction = position - i
+        quantiles = self.quantile_tables().reshape(-1)
+        i += (month[day] * size[2] + station) * len(grid)
+        below = quantiles[i]
+        above = quantiles[i + 1]
+        rain[day, k, station] = below + fraction * (above - below)
+        rain = np.where(rain >= min_rain, rain, 0.0)
+        rain_today = wet_days & (rain >= min_rain)
+
+        # Temperature residuals from correlated normals, all stations in one residual_series
+        e = _truncated_normal(self.rng, (3,) + size, self.TRUNCATE) @ self.temperature_factor.T
+        shape = e.shape
+        residuals = self.stations[0].residual_series(e.reshape(3, size[0], -1), x.reshape(3, -1))
+        residuals = residuals.reshape(shape)
+        x = residuals[:, -1]
+
+        tables = [w.temperature_tables() for w in self.stations]
+        doy = dates.dayofyear.values - 1
+        txm, txs, txm1, txs1, tnm, tns = [np.stack([t[name] for t in tables], axis=-1)[doy, np.newaxis]
+                                          for name in Wgen.TEMPERATURE_TABLES]
+        tmax1 = residuals[0] * np.where(rain_today, txs1, txs) + np.where(rain_today, txm1, txm)
+        tmin1 = residuals[1] * tns + tnm
+        tmax = np.maximum(tmax1, tmin1)
+        tmin = np.minimum(tmax1, tmin1)
+        order = (1, 2, 0)
+        return rain.transpose(order), tmax.transpose(order), tmin.transpose(order), wet, x
+
+    def _correlated(self, factor, size):
+        """Standard normals shaped size, correlated between stations on the last axis"""
+        return self.rng.standard_normal(size) @ factor.T
@@ -0,0 +1,223 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_discrete_lyapunov
+from scipy.special import gammaincc, ndtr
+from hydrology.wgen import realization_streams
+
+# Largest difference allowed between generated and expected statistics, as
+# ('relative', fraction) or ('absolute', value in the units of the statistic)
+TOLERANCES = {'wet_fraction': ('absolute', 0.01),
+              'pww': ('absolute', 0.02),
+              'pwd': ('absolute', 0.02),
+              'rain_mean': ('relative', 0.05),
+              'rain_std': ('relative', 0.05),
+              'wet_spell': ('relative', 0.1),
+              'dry_spell': ('relative', 0.1),
+              'tmax_mean': ('absolute', 0.5),
+              'tmin_mean': ('absolute', 0.5),
+              'tmax_std': ('relative', 0.05),
+              'tmin_std': ('relative', 0.05)}
+
+
+def validate(wgen, years=100, realizations=50, seed=None, start_date='1/1/2001', tolerances=None):
+    """Generate a large sample from wgen and compare its statistics to the parameters
+
+        The large sample version of the WGEN_Validation comparison: every
+        monthly statistic of the generated weather is worked out with a few
+        grouped reductions over all realizations and years, and checked
+        against the value the parameters imply.
+
+        Parameters
+        ----------
+        wgen : Wgen
+            the station; its state is left unchanged
+        years : int
+            years in each realization
+        realizations : int
+        seed : int, optional
+            realization k uses realization_streams(seed, [k])
+        start_date : Timestamp or str
+        tolerances : dict, optional
+            replaces entries of TOLERANCES
+
+        Returns
+        -------
+        report : dict
+            'expected' and 'generated': DataFrames of monthly statistics
+            (see expected_statistics), 'passed': a DataFrame of bool saying
+            which are within tolerance, 'spells': the wet and dry spell
+            length distributions, 'seconds' spent generating and
+            'station_years_per_second'
+    """
+    tolerances = dict(TOLERANCES, **(tolerances or {}))
+    dates = pd.date_range(start=pd.Timestamp(start_date), end=pd.Timestamp(start_date) + pd.DateOffset(years=years),
+                          inclusive='left')
+    streams = realization_streams(np.random.SeedSequence(seed), range(realizations))
+    began = time.perf_counter()
+    rain, tmax, tmin = wgen.generate(dates[0], len(dates), realizations, streams)
+    seconds = time.perf_counter() - began
+
+    expected = expected_statistics(wgen, dates)
+    generated = generated_statistics(dates, rain, tmax, tmin, wgen.min_rain)
+    passed = pd.DataFrame(index=expected.index)
+    for name in expected.columns:
+        kind, tolerance = tolerances[name]
+        difference = (generated[name] - expected[name]).abs()
+        if kind == 'relative':
+            difference = difference / expected[name].abs()
+        passed[name] = difference <= tolerance
+    lengths, wet, month = spells(rain >= wgen.min_rain, dates)
+    return {'expected': expected, 'generated': generated, 'passed': passed,
+            'spells': {'wet': np.bincount(lengths[wet]), 'dry': np.bincount(lengths[~wet])},
+            'seconds': seconds, 'station_years_per_second': years * realizations / seconds}
+
+
+def expected_statistics(wgen, dates):
+    """Monthly statistics of the weather the parameters of wgen should give
+
+        Wet days are those with at least min_rain, so the Markov chain is
+        thinned by the chance that a gamma amount is below min_rain.
+        Each month is treated as if its chain were stationary.
+
+        Parameters
+        ----------
+        wgen : Wgen
+        dates : DatetimeIndex
+            the days the statistics are for, which sets how each day of
+            the year is weighted in its month
+
+        Returns
+        -------
+        statistics : DataFrame
+            indexed by month 1 - 12, with columns wet_fraction, pww, pwd
+            (of wet days), rain_mean and rain_std (of daily rain, in),
+            wet_spell and dry_spell (mean lengths of spells starting in
+            the month, in days) and tmax_mean, tmin_mean, tmax_std and
+            tmin_std (of daily temperature, Fdeg)
+    """
+    pww = np.asarray(wgen.pww_array, dtype=float)
+    pwd = np.asarray(wgen.pwd_array, dtype=float)
+    alpha = np.asarray(wgen.alpha_array, dtype=float)
+    beta = np.asarray(wgen.beta_array, dtype=float)
+    m = wgen.min_rain / beta
+    chain_wet = pwd / (1.0 - pww + pwd)
+    kept = gammaincc(alpha, m)
+    wet = chain_wet * kept
+    thinned_pww = pww * kept
+    thinned_pwd = kept * (chain_wet - wet * pww) / (1.0 - wet)
+
+    statistics = pd.DataFrame(index=pd.Index(range(1, 13), name='month'))
+    statistics['wet_fraction'] = wet
+    statistics['pww'] = thinned_pww
+    statistics['pwd'] = thinned_pwd
+    mean = chain_wet * alpha * beta * gammaincc(alpha + 1.0, m)
+    square = chain_wet * alpha * (alpha + 1.0) * beta ** 2 * gammaincc(alpha + 2.0, m)
+    statistics['rain_mean'] = mean
+    statistics['rain_std'] = np.sqrt(square - mean ** 2)
+    statistics['wet_spell'] = 1.0 / (1.0 - thinned_pww)
+    statistics['dry_spell'] = 1.0 / thinned_pwd
+
+    # Variance of the residuals x(t) = A x(t-1) + B e(t), with e truncated at 2.5
+    b = 2.5
+    e_variance = 1.0 - 2.0 * b * np.exp(-0.5 * b * b) / np.sqrt(2.0 * np.pi) / (2.0 * ndtr(b) - 1.0)
+    x_variance = np.diag(solve_discrete_lyapunov(wgen.TEMP_A, e_variance * wgen.TEMP_B @ wgen.TEMP_B.T))
+
+    tables = wgen.temperature_tables()
+    day = dates.dayofyear.values - 1
+    month = dates.month.values - 1
+    p = wet[month]
+    tmax_mean = p * tables['txm1'][day] + (1.0 - p) * tables['txm'][day]
+    tmax_square = (p * (tables['txs1'][day] ** 2 * x_variance[0] + tables['txm1'][day] ** 2)
+                   + (1.0 - p) * (tables['txs'][day] ** 2 * x_variance[0] + tables['txm'][day] ** 2))
+    tmin_mean = tables['tnm'][day]
+    tmin_square = tables['tns'][day] ** 2 * x_variance[1] + tmin_mean ** 2
+    days = np.bincount(month, minlength=12)
+    for name, first, second in [('tmax', tmax_mean, tmax_square), ('tmin', tmin_mean, tmin_square)]:
+        mean = np.bincount(month, weights=first, minlength=12) / days
+        square = np.bincount(month, weights=second, minlength=12) / days
+        statistics[name + '_mean'] = mean
+        statistics[name + '_std'] = np.sqrt(square - mean ** 2)
+    return statistics
+
+
+def generated_statistics(dates, rain, tmax, tmin, min_rain=0.01):
+    """Monthly statistics of generated weather, the same as expected_statistics
+
+        Parameters
+        ----------
+        dates : DatetimeIndex
+        rain, tmax, tmin : array[float]
+            shaped realization x day, as from Wgen.generate
+        min_rain : float
+            smallest amount counted as a wet day
+
+        Returns
+        -------
+        statistics : DataFrame
+            with the columns of expected_statistics
+    """
+    rain = np.atleast_2d(rain)
+    month = np.broadcast_to(dates.month.values - 1, rain.shape)
+    wet = rain >= min_rain
+    statistics = pd.DataFrame(index=pd.Index(range(1, 13), name='month'))
+    statistics['wet_fraction'] = _monthly_mean(month, wet)
+
+    # Transitions, by the month of the later day
+    before = wet[:, :-1]
+    after = month[:, 1:]
+    wet_after = wet[:, 1:]
+    statistics['pww'] = _monthly_sum(after, before & wet_after) / _monthly_sum(after, before)
+    statistics['pwd'] = _monthly_sum(after, ~before & wet_after) / _monthly_sum(after, ~before)
+    statistics['rain_mean'] = _monthly_mean(month, rain)
+    statistics['rain_std'] = np.sqrt(_monthly_mean(month, rain ** 2) - statistics['rain_mean'] ** 2)
+
+    lengths, spell_wet, spell_month = spells(wet, dates)
+    for name, keep in [('wet_spell', spell_wet), ('dry_spell', ~spell_wet)]:
+        statistics[name] = (np.bincount(spell_month[keep], weights=lengths[keep], minlength=12)
+                            / np.bincount(spell_month[keep], minlength=12))
+
+    for name, values in [('tmax', tmax), ('tmin', tmin)]:
+        mean = _monthly_mean(month, values)
+        statistics[name + '_mean'] = mean
+        statistics[name + '_std'] = np.sqrt(_monthly_mean(month, values ** 2) - mean ** 2)
+    return statistics
+
+
+def spells(wet, dates):
+    """Lengths of the wet and dry spells of every realization
+
+        Spells cut off by the start or end of a realization are left out.
+
+        Parameters
+        ----------
+        wet : array[bool]
+            shaped realization x day
+        dates : DatetimeIndex
+
+        Returns
+        -------
+        lengths : array[int]
+            length of each spell in days
+        wet : array[bool]
+            True for wet spells
+        month : array[int]
+            month the spell starts in, 0 - 11
+    """
+    wet = np.atleast_2d(wet)
+    days = wet.shape[1]
+    starts = np.ones(wet.shape, dtype=bool)
+    starts[:, 1:] = wet[:, 1:] != wet[:, :-1]
+    first = np.flatnonzero(starts)
+    lengths = np.diff(np.append(first, wet.size))
+    day = first % days
+    whole = (day > 0) & (day + lengths < days)
+    return lengths[whole], wet.ravel()[first[whole]], dates.month.values[day[whole]] - 1
+
+
+def _monthly_sum(month, values):
+    return np.bincount(month.ravel(), weights=values.ravel().astype(float), minlength=12)
+
+
+def _monthly_mean(month, values):
+    return _monthly_sum(month, values) / np.bincount(month.ravel(), minlength=12)
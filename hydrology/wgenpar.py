@@ -0,0 +1,182 @@
+import numpy as np
+import pandas as pd
+
+
+def read_record(filename, date_column=0, rain_column=1):
+    """Read a daily record from a csv file such as timeseries_data1.csv
+
+        Parameters
+        ----------
+        filename : str
+        date_column, rain_column : int or str
+            the columns holding the dates and the daily rain
+
+        Returns
+        -------
+        dates : DatetimeIndex
+        rain : array[float]
+            daily rain, NaN where it is missing
+    """
+    record = pd.read_csv(filename, skipinitialspace=True)
+    dates = pd.DatetimeIndex(pd.to_datetime(_column(record, date_column)))
+    rain = pd.to_numeric(_column(record, rain_column), errors='coerce').to_numpy(dtype=float)
+    return dates, rain
+
+
+def estimate_parameters(dates, rain, tmax=None, tmin=None, min_rain=0.01, dt_day=200):
+    """Estimate Wgen parameters from a daily record, like WGENPAR
+
+        The record is grouped by month (precipitation) or day of the year
+        (temperature) with a few bincount passes over the whole record, so
+        many stations can be fitted together by giving one column each.
+
+        Precipitation: pww and pwd are the fractions of days following a
+        wet or a dry day that are wet, by the month of the later day.
+        alpha and beta are the gamma shape and scale of the wet day
+        amounts, from the Greenwood and Durand approximation to the
+        maximum likelihood estimates.
+
+        Temperature: the means over the years of each day of the year,
+        and their coefficients of variation, are fitted by least squares
+        to u + C cos(0.0172 (day - dt_day)), the seasonal curve used by
+        Wgen. txmd and atx come from dry days, txmw from wet days and the
+        other parameters from all days.
+
+        Parameters
+        ----------
+        dates : DatetimeIndex or array[datetime64]
+            one date per day of the record
+        rain : array[float]
+            daily rain, shaped day or day x station. NaN days are skipped.
+        tmax, tmin : array[float], optional
+            daily max and min temperature, shaped like rain
+        min_rain : float
+            smallest amount counted as a wet day
+        dt_day : int
+            day of the year with the highest temperature
+
+        Returns
+        -------
+        parameters : dict or list(dict)
+            Wgen attribute values by name, for Wgen.set_parameters. One
+            dict for each station if rain has a station axis.
+    """
+    dates = pd.DatetimeIndex(dates)
+    rain = np.asarray(rain, dtype=float)
+    stations = rain.ndim == 2
+    rain = rain.reshape(len(dates), -1)
+    month = dates.month.values - 1
+    count = rain.shape[1]
+
+    # Transition counts, by the month of the later day of each pair of days
+    known = ~np.isnan(rain)
+    wet = known & (rain >= min_rain) & (rain > 0.0)
+    pairs = known[1:] & known[:-1]
+    after = month[1:]
+    wet_before = _monthly_sum(after, pairs & wet[:-1])
+    dry_before = _monthly_sum(after, pairs & ~wet[:-1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pww = _monthly_sum(after, pairs & wet[:-1] & wet[1:]) / wet_before
+        pwd = _monthly_sum(after, pairs & ~wet[:-1] & wet[1:]) / dry_before
+
+    # Gamma fit to the wet day amounts
+    amount = np.where(wet, rain, 1.0)
+    wet_days = _monthly_sum(month, wet)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = _monthly_sum(month, np.where(wet, rain, 0.0)) / wet_days
+        mean_log = _monthly_sum(month, np.log(amount)) / wet_days
+        alpha = _gamma_shape(np.log(mean) - mean_log)
+        beta = mean / alpha
+
+    parameters = {'pww_array': pww, 'pwd_array': pwd, 'alpha_array': alpha, 'beta_array': beta,
+                  'min_rain': np.full(count, float(min_rain))}
+    if tmax is not None and tmin is not None:
+        tmax = np.asarray(tmax, dtype=float).reshape(len(dates), -1)
+        tmin = np.asarray(tmin, dtype=float).reshape(len(dates), -1)
+        day = dates.dayofyear.values - 1
+        curve = np.cos(0.0172 * (np.arange(1, 367) - dt_day))
+        dry = known & ~wet
+        parameters['txmd'], parameters['atx'] = _fit_mean(day, tmax, dry, curve)
+        parameters['txmw'] = _fit_mean(day, tmax, wet, curve, parameters['atx'])[0]
+        parameters['cvtx'], parameters['acvtx'] = _fit_cv(day, tmax, curve)
+        parameters['tn'], parameters['atn'] = _fit_mean(day, tmin, ~np.isnan(tmin), curve)
+        parameters['cvtn'], parameters['acvtn'] = _fit_cv(day, tmin, curve)
+        parameters['dt_day'] = np.full(count, dt_day)
+
+    result = [{name: _station(value, k) for name, value in parameters.items()} for k in range(count)]
+    return result if stations else result[0]
+
+
+def _column(record, column):
+    return record.iloc[:, column] if isinstance(column, int) else record[column]
+
+
+def _station(value, k):
+    """Parameter values for one station, as Wgen holds them"""
+    value = value[..., k]
+    return value.tolist() if np.ndim(value) else float(value)
+
+
+def _monthly_sum(month, values):
+    """Sum of values for each month, shaped 12 x station"""
+    return _grouped_sum(month, values, 12)
+
+
+def _grouped_sum(group, values, groups):
+    """Sum of values (day x station) for each group, in one bincount"""
+    stations = values.shape[1]
+    index = (group[:, np.newaxis] * stations + np.arange(stations)).ravel()
+    sums = np.bincount(index, weights=np.asarray(values, dtype=float).ravel(), minlength=groups * stations)
+    return sums.reshape(groups, stations)
+
+
+def _gamma_shape(a):
+    """Gamma shape from A = ln(mean) - mean(ln x) (Greenwood and Durand, 1960)"""
+    small = (0.5000876 + 0.1648852 * a - 0.0544274 * a ** 2) / a
+    large = (8.898919 + 9.059950 * a + 0.9775373 * a ** 2) / (a * (17.79728 + 11.968477 * a + a ** 2))
+    return np.where(a <= 0.5772, small, large)
+
+
+def _daily_stats(day, values, keep):
+    """Mean, standard deviation and count of values for each day of the year"""
+    keep = keep & ~np.isnan(values)
+    v = np.where(keep, values, 0.0)
+    n = _grouped_sum(day, keep, 366)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = _grouped_sum(day, v, 366) / n
+        variance = _grouped_sum(day, v * v, 366) / n - mean ** 2
+        std = np.sqrt(np.maximum(variance, 0.0) * n / (n - 1))
+    return mean, std, n
+
+
+def _fit_curve(y, weight, curve, amplitude=None):
+    """Weighted least squares fit of y = u + C curve for each station
+
+        If amplitude is given only u is fitted. Returns u and C.
+    """
+    good = (weight > 0) & np.isfinite(y)
+    w = np.where(good, weight, 0.0)
+    y = np.where(good, y, 0.0)
+    c = curve[:, np.newaxis]
+    if amplitude is not None:
+        u = (w * (y - amplitude * c)).sum(axis=0) / w.sum(axis=0)
+        return u, amplitude
+    sw = w.sum(axis=0)
+    sc = (w * c).sum(axis=0)
+    scc = (w * c * c).sum(axis=0)
+    sy = (w * y).sum(axis=0)
+    scy = (w * c * y).sum(axis=0)
+    amplitude = (sw * scy - sc * sy) / (sw * scc - sc ** 2)
+    return (sy - amplitude * sc) / sw, amplitude
+
+
+def _fit_mean(day, values, keep, curve, amplitude=None):
+    mean, std, n = _daily_stats(day, values, keep)
+    return _fit_curve(mean, n, curve, amplitude)
+
+
+def _fit_cv(day, values, curve):
+    mean, std, n = _daily_stats(day, values, ~np.isnan(values))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cv = std / mean
+    return _fit_curve(cv, np.where(n > 1, n, 0), curve)
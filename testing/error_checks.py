@@ -1,5 +1,52 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
 from validation.error import WrongUnits
 
+# When True, the checks made on every step (Store setters,
+# Awbm._bucket_overflow) are skipped. Inputs should then be checked once
+# up front, e.g. with check_array_positive, before stepping through a run.
+# Kept per thread and per async task, so one run cannot switch the checks
+# off for another.
+_trusted = ContextVar('trusted', default=False)
+
+
+def is_trusted():
+    """True inside a trusted_input block"""
+    return _trusted.get()
+
+
+@contextmanager
+def trusted_input():
+    """Skip the per-step checks inside a with block
+
+        Blocks may be nested; the setting from before the block is put
+        back when it ends.
+
+        Examples
+        --------
+        with ec.trusted_input():
+            for p in precip:
+                awbm.runoff(p, et)
+    """
+    token = _trusted.set(True)
+    try:
+        yield
+    finally:
+        _trusted.reset(token)
+
+
+def check_array_positive(my_array, my_variable_name='var1'):
+    """Checks a whole array at once for negative or missing values
+    :param my_array : array_like
+    :param my_variable_name : str
+    :return: valueError
+    """
+    values = np.asarray(my_array, dtype=float)
+    if np.isnan(values).any() or (values < 0.0).any():
+        neg_value_error = ValueError(my_variable_name + ' should be a positive')
+        raise neg_value_error
+
 
 def check_all_items_positive(my_list):
     for i in range(len(my_list)):
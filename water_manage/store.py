@@ -57,8 +57,8 @@ class Store:
             amount : float
                 User defined amount to replace the existing _quantity
         """
-        
-        ec.check_positive(amount, "quantity")
+        if not ec.is_trusted():
+            ec.check_positive(amount, "quantity")
         self._quantity = amount
         self.update()
 
@@ -74,8 +74,8 @@ class Store:
             new_capacity : float
                 User defined amount to replace the existing _capacity
         """
-    
-        ec.check_positive(new_capacity, "capacity")
+        if not ec.is_trusted():
+            ec.check_positive(new_capacity, "capacity")
         new_capacity = new_capacity
     
         if new_capacity < self._quantity:
@@ -86,18 +86,29 @@ class Store:
             self.overflow = 0.0
             self._capacity = new_capacity
 
-    def update(self):
+    def update(self, inflow=None, request=None):
         """Updates the _quantity given inflow and request being applied
 
         If _quantity ends up out of bounds (upper or lower) then it is
         set to the bound and overflow or outflow is updated
 
+        Parameters
+        ----------
+        inflow : float, optional
+            replaces the inflow attribute before updating
+        request : float, optional
+            replaces the request attribute before updating
+
         Raises
         ------
         NotImplementedError
             Raise if either value is negative
         """
-        
+        if inflow is not None:
+            self.inflow = inflow
+        if request is not None:
+            self.request = request
+
         self._quantity += (self.inflow - self.request)
 
         if self._quantity > self._capacity: